@@ -5,19 +5,21 @@ import copy
 import torch
 import torch.nn as nn
 from opacus import PrivacyEngine
+from opacus.privacy_ledger import PrivacyLedger
 from sklearn.linear_model import LogisticRegression
 
-from train_utils_mix import get_device, train, test
+from train_utils_mix import get_device, train, test, get_mixer
 from data import get_data, get_scatter_transform, get_scattered_loader
 from models import ScatterLinear, get_num_params
-from dp_utils import ORDERS, get_privacy_spent, get_renyi_divergence, scatter_normalization
+from dp_utils import ORDERS, scatter_normalization, get_privacy_spent_ledger, normalization_ledger
 from log import Logger
 
 
 def main(dataset, augment=False, batch_size=2048, mini_batch_size=256, sample_batches=False,
          lr=1, optim="SGD", momentum=0.9, nesterov=False, noise_multiplier=1, max_grad_norm=0.1,
          epochs=100, input_norm=None, num_groups=None, bn_noise_multiplier=None,
-         max_epsilon=None, logdir=None):
+         max_epsilon=None, logdir=None, accountant="rdp",
+         feature_cache_dir=None):
 
     logger = Logger(logdir)
     print(torch.cuda.is_available())
@@ -42,20 +44,21 @@ def main(dataset, augment=False, batch_size=2048, mini_batch_size=256, sample_ba
     test_loader = torch.utils.data.DataLoader(
         test_data, batch_size=mini_batch_size, shuffle=False, num_workers=1, pin_memory=True)
 
-    rdp_norm = 0
+    norm_ledger = PrivacyLedger()
     if input_norm == "BN":
         # compute noisy data statistics or load from disk if pre-computed
         save_dir = f"bn_stats/{dataset}"
         os.makedirs(save_dir, exist_ok=True)
-        bn_stats, rdp_norm = scatter_normalization(train_loader,
-                                                   scattering,
-                                                   K,
-                                                   device,
-                                                   len(train_data),
-                                                   len(train_data),
-                                                   noise_multiplier=bn_noise_multiplier,
-                                                   orders=ORDERS,
-                                                   save_dir=save_dir)
+        bn_stats, _ = scatter_normalization(train_loader,
+                                            scattering,
+                                            K,
+                                            device,
+                                            len(train_data),
+                                            len(train_data),
+                                            noise_multiplier=bn_noise_multiplier,
+                                            orders=ORDERS,
+                                            save_dir=save_dir)
+        norm_ledger = normalization_ledger(len(train_data), len(train_data), bn_noise_multiplier)
         model = ScatterLinear(K, (h, w), input_norm="BN", bn_stats=bn_stats)
         model2 = ScatterLinear(K, (h, w), input_norm="BN", bn_stats=bn_stats)
     else:
@@ -77,8 +80,10 @@ def main(dataset, augment=False, batch_size=2048, mini_batch_size=256, sample_ba
         # if there is no data augmentation, pre-compute the scattering transform
         train_loader = get_scattered_loader(train_loader, scattering, device,
                                             drop_last=True,
-                                            sample_batches=sample_batches)
-        test_loader = get_scattered_loader(test_loader, scattering, device)
+                                            sample_batches=sample_batches,
+                                            cache_dir=feature_cache_dir, dataset=dataset, split="train")
+        test_loader = get_scattered_loader(test_loader, scattering, device,
+                                           cache_dir=feature_cache_dir, dataset=dataset, split="test")
 
     # baseline Logistic Regression without privacy
     if optim == "LR":
@@ -156,9 +161,13 @@ def main(dataset, augment=False, batch_size=2048, mini_batch_size=256, sample_ba
     )
     privacy_engine2.attach(optimizer2)
 
+    # ModelMix over flat parameter buffers (models must already be on the device)
+    mixer = get_mixer(model, model2)
+
     for epoch in range(0, epochs):
         print(f"\nEpoch: {epoch}")
-        train_loss, train_acc = train(model, model2, train_loader, optimizer, optimizer2, epoch, n_acc_steps=n_acc_steps)
+        train_loss, train_acc = train(model, model2, train_loader, optimizer, optimizer2, epoch, n_acc_steps=n_acc_steps,
+                                      mixer=mixer)
         test_loss, test_acc = test(model, test_loader)
         test_loss2, test_acc2 = test(model2, test_loader)
         test_acc = max(test_acc, test_acc2)
@@ -167,11 +176,8 @@ def main(dataset, augment=False, batch_size=2048, mini_batch_size=256, sample_ba
         lr_scheduler2.step()
 
         if noise_multiplier > 0:
-            rdp_sgd = get_renyi_divergence(
-                privacy_engine.sample_rate, privacy_engine.noise_multiplier
-            ) * privacy_engine.steps
-            epsilon, _ = get_privacy_spent(rdp_norm + rdp_sgd)
-            epsilon2, _ = get_privacy_spent(rdp_sgd)
+            epsilon, _ = get_privacy_spent_ledger(norm_ledger + privacy_engine.ledger, accountant=accountant)
+            epsilon2, _ = get_privacy_spent_ledger(privacy_engine.ledger, accountant=accountant)
             print(f"ε = {epsilon:.3f} (sgd only: ε = {epsilon2:.3f})")
 
             if max_epsilon is not None and epsilon >= max_epsilon:
@@ -204,5 +210,8 @@ if __name__ == '__main__':
     parser.add_argument('--max_epsilon', type=float, default=None)
     parser.add_argument('--sample_batches', action="store_true")
     parser.add_argument('--logdir', default=None)
+    parser.add_argument('--accountant', default="rdp", choices=["rdp", "pld"])
+    parser.add_argument('--feature_cache_dir', default=None,
+                        help="directory of the on-disk cache of scattering features")
     args = parser.parse_args()
     main(**vars(args))
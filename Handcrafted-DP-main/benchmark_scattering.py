@@ -0,0 +1,123 @@
+import argparse
+import time
+
+import torch
+
+from data import SHAPES, get_data, get_scatter_transform
+
+
+def time_scattering(scattering, x, repeats):
+    # average time of a forward pass over `repeats` runs, after a warm-up run
+    with torch.no_grad():
+        scattering(x)
+        if x.is_cuda:
+            torch.cuda.synchronize(x.device)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            out = scattering(x)
+        if x.is_cuda:
+            torch.cuda.synchronize(x.device)
+    return (time.perf_counter() - start) / repeats, out
+
+
+MODES = {
+    "loop": {},
+    "batched": {"batched": True},
+    "real_input": {"real_input": True},
+    "batched+real_input": {"batched": True, "real_input": True},
+    "complex64": {"precision": "complex64"},
+    "float16": {"precision": "float16"},
+    "bfloat16": {"precision": "bfloat16"},
+    "batched+complex64": {"batched": True, "precision": "complex64"},
+}
+
+
+def benchmark_random(dataset, batch_sizes, repeats, device, modes):
+    # time the modes on random batches of images of `dataset`
+    h, w, c = SHAPES[dataset]
+
+    for batch_size in batch_sizes:
+        x = torch.rand(batch_size, c, h, w, device=device)
+        scattering, _, _ = get_scatter_transform(dataset)
+        _, reference = time_scattering(scattering.to(device), x, 1)
+        for mode in modes:
+            scattering, _, _ = get_scatter_transform(dataset, **MODES[mode])
+            scattering.to(device)
+            seconds, out = time_scattering(scattering, x, repeats)
+            error = ((out - reference).abs().max() / reference.abs().max()).item()
+            print(f"{dataset} batch_size={batch_size} {mode}: "
+                  f"{seconds * 1000:.1f}ms/batch, {batch_size / seconds:.0f} images/s, "
+                  f"max rel diff={error:.2e}")
+
+
+def benchmark_data(dataset, batch_size, device, modes, num_batches=None):
+    # accuracy versus throughput of the modes over the training set of `dataset`:
+    # the features of every mode are compared to those of the per-wavelet loop
+    # in single precision, relative to the largest reference feature of each channel
+    train_data, _ = get_data(dataset, augment=False)
+    loader = torch.utils.data.DataLoader(train_data, batch_size=batch_size, shuffle=False)
+
+    reference, _, _ = get_scatter_transform(dataset)
+    reference.to(device)
+    scatterings = {}
+    for mode in modes:
+        scatterings[mode], _, _ = get_scatter_transform(dataset, **MODES[mode])
+        scatterings[mode].to(device)
+
+    seconds = {mode: 0. for mode in modes}
+    max_err = {mode: 0. for mode in modes}
+    sq_err = {mode: 0. for mode in modes}
+    num_samples = 0
+    with torch.no_grad():
+        for i, (data, _) in enumerate(loader):
+            if num_batches is not None and i >= num_batches:
+                break
+            data = data.to(device)
+            ref = reference(data).flatten(2, -1)
+            scale = ref.abs().amax(dim=(0, 2), keepdim=True).clamp_min(1e-12)
+            for mode in modes:
+                if i == 0:
+                    # warm-up
+                    scatterings[mode](data)
+                start = time.perf_counter()
+                out = scatterings[mode](data)
+                if data.is_cuda:
+                    torch.cuda.synchronize(data.device)
+                seconds[mode] += time.perf_counter() - start
+                err = (out.flatten(2, -1) - ref) / scale
+                max_err[mode] = max(max_err[mode], err.abs().max().item())
+                sq_err[mode] += (err ** 2).mean(dim=(1, 2)).sum().item()
+            num_samples += len(data)
+
+    for mode in modes:
+        print(f"{dataset} train set ({num_samples} images) {mode}: "
+              f"{num_samples / seconds[mode]:.0f} images/s, "
+              f"rms rel err={(sq_err[mode] / num_samples) ** 0.5:.2e}, "
+              f"max rel err={max_err[mode]:.2e}")
+
+
+def main(dataset="cifar10", batch_sizes=(32, 256), repeats=10, device=None, modes=tuple(MODES),
+         use_data=False, num_batches=None):
+    # compare the execution modes of the Scattering2D of `get_scatter_transform`
+    # against the per-wavelet loop in single precision, on random batches or
+    # (with `use_data`) on the training set. The downstream accuracy of a mode is
+    # that of `cnns.py --scattering_precision=<precision>`.
+    device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+    if use_data:
+        benchmark_data(dataset, batch_sizes[0], device, modes, num_batches)
+    else:
+        benchmark_random(dataset, batch_sizes, repeats, device, modes)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='cifar10', choices=['cifar10', 'fmnist', 'mnist'])
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[32, 256])
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--device', default=None)
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    parser.add_argument('--use_data', action="store_true",
+                        help="benchmark over the training set instead of random batches")
+    parser.add_argument('--num_batches', type=int, default=None)
+    args = parser.parse_args()
+    main(**vars(args))
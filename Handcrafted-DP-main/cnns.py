@@ -4,11 +4,12 @@ import os
 import torch
 import torch.nn as nn
 from opacus import PrivacyEngine
+from opacus.privacy_ledger import PrivacyLedger
 
 from train_utils import get_device, train, test
 from data import get_data, get_scatter_transform, get_scattered_loader
 from models import CNNS, get_num_params
-from dp_utils import ORDERS, get_privacy_spent, get_renyi_divergence, scatter_normalization
+from dp_utils import ORDERS, scatter_normalization, get_privacy_spent_ledger, normalization_ledger
 from log import Logger
 
 
@@ -17,7 +18,8 @@ def main(dataset, augment=False, use_scattering=True, size=None,
          lr=4, optim="SGD", momentum=0.9, nesterov=False,
          noise_multiplier=5.6, max_grad_norm=0.1, epochs=120,
          input_norm="BN", num_groups=None, bn_noise_multiplier=8,
-         max_epsilon=None, logdir=None, early_stop=True):
+         max_epsilon=None, logdir=None, early_stop=True, accountant="rdp",
+         feature_cache_dir=None, scattering_precision="float32"):
 
     logger = Logger(logdir)
     device = get_device()
@@ -26,7 +28,7 @@ def main(dataset, augment=False, use_scattering=True, size=None,
     train_data, test_data = get_data(dataset, augment=augment)
 
     if use_scattering:
-        scattering, K, _ = get_scatter_transform(dataset)
+        scattering, K, _ = get_scatter_transform(dataset, precision=scattering_precision)
         scattering.to(device)
     else:
         scattering = None
@@ -47,20 +49,21 @@ def main(dataset, augment=False, use_scattering=True, size=None,
     test_loader = torch.utils.data.DataLoader(
         test_data, batch_size=mini_batch_size, shuffle=False, num_workers=1, pin_memory=True)
 
-    rdp_norm = 0
+    norm_ledger = PrivacyLedger()
     if input_norm == "BN":
         # compute noisy data statistics or load from disk if pre-computed
         save_dir = f"bn_stats/{dataset}"
         os.makedirs(save_dir, exist_ok=True)
-        bn_stats, rdp_norm = scatter_normalization(train_loader,
-                                                   scattering,
-                                                   K,
-                                                   device,
-                                                   len(train_data),
-                                                   len(train_data),
-                                                   noise_multiplier=bn_noise_multiplier,
-                                                   orders=ORDERS,
-                                                   save_dir=save_dir)
+        bn_stats, _ = scatter_normalization(train_loader,
+                                            scattering,
+                                            K,
+                                            device,
+                                            len(train_data),
+                                            len(train_data),
+                                            noise_multiplier=bn_noise_multiplier,
+                                            orders=ORDERS,
+                                            save_dir=save_dir)
+        norm_ledger = normalization_ledger(len(train_data), len(train_data), bn_noise_multiplier)
         model = CNNS[dataset](K, input_norm="BN", bn_stats=bn_stats, size=size)
     else:
         model = CNNS[dataset](K, input_norm=input_norm, num_groups=num_groups, size=size)
@@ -75,8 +78,10 @@ def main(dataset, augment=False, use_scattering=True, size=None,
     else:
         # pre-compute the scattering transform if necessery
         train_loader = get_scattered_loader(train_loader, scattering, device,
-                                            drop_last=True, sample_batches=sample_batches)
-        test_loader = get_scattered_loader(test_loader, scattering, device)
+                                            drop_last=True, sample_batches=sample_batches,
+                                            cache_dir=feature_cache_dir, dataset=dataset, split="train")
+        test_loader = get_scattered_loader(test_loader, scattering, device,
+                                           cache_dir=feature_cache_dir, dataset=dataset, split="test")
 
     print(f"model has {get_num_params(model)} parameters")
 
@@ -108,11 +113,8 @@ def main(dataset, augment=False, use_scattering=True, size=None,
         test_list.append(test_acc)
 
         if noise_multiplier > 0:
-            rdp_sgd = get_renyi_divergence(
-                privacy_engine.sample_rate, privacy_engine.noise_multiplier
-            ) * privacy_engine.steps
-            epsilon, _ = get_privacy_spent(rdp_norm + rdp_sgd)
-            epsilon2, _ = get_privacy_spent(rdp_sgd)
+            epsilon, _ = get_privacy_spent_ledger(norm_ledger + privacy_engine.ledger, accountant=accountant)
+            epsilon2, _ = get_privacy_spent_ledger(privacy_engine.ledger, accountant=accountant)
             print(f"ε = {epsilon:.3f} (sgd only: ε = {epsilon2:.3f})")
             eps_list.append(epsilon)
 
@@ -163,5 +165,11 @@ if __name__ == '__main__':
     parser.add_argument('--early_stop', type=bool, default=True)
     parser.add_argument('--sample_batches', action="store_true")
     parser.add_argument('--logdir', default=None)
+    parser.add_argument('--accountant', default="rdp", choices=["rdp", "pld"])
+    parser.add_argument('--feature_cache_dir', default=None,
+                        help="directory of the on-disk cache of scattering features")
+    parser.add_argument('--scattering_precision', default="float32",
+                        choices=["float32", "complex64", "float16", "bfloat16"],
+                        help="numerical precision of the ScatterNet (see get_scatter_transform)")
     args = parser.parse_args()
     main(**vars(args))
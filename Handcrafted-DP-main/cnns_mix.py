@@ -7,11 +7,12 @@ import copy
 from opacus import PrivacyEngine
 from torchvision import models
 from opacus.utils import module_modification
+from opacus.privacy_ledger import PrivacyLedger
 
-from train_utils_mix import get_device, train, test
+from train_utils_mix import get_device, train, test, get_mixer
 from data import get_data, get_scatter_transform, get_scattered_loader
 from models import CNNS, get_num_params, resnet01
-from dp_utils import ORDERS, get_privacy_spent, get_renyi_divergence, scatter_normalization
+from dp_utils import ORDERS, scatter_normalization, get_privacy_spent_ledger, normalization_ledger
 from log import Logger
 
 def main(dataset, augment=False, use_scattering=True, size=None,
@@ -19,7 +20,8 @@ def main(dataset, augment=False, use_scattering=True, size=None,
          lr=0.3, optim="SGD", momentum=0.9, nesterov=False,
          noise_multiplier=1, max_grad_norm=1.0, epochs=200,
          input_norm=None, num_groups=None, bn_noise_multiplier=None,
-         max_epsilon=None, logdir=None, early_stop=True):
+         max_epsilon=None, logdir=None, early_stop=True, accountant="rdp",
+         feature_cache_dir=None):
 
     logger = Logger(logdir)
     device = 1
@@ -48,20 +50,21 @@ def main(dataset, augment=False, use_scattering=True, size=None,
     test_loader = torch.utils.data.DataLoader(
         test_data, batch_size=mini_batch_size, shuffle=False, num_workers=1, pin_memory=True)
 
-    rdp_norm = 0
+    norm_ledger = PrivacyLedger()
     if input_norm == "BN":
         # compute noisy data statistics or load from disk if pre-computed
         save_dir = f"bn_stats/{dataset}"
         os.makedirs(save_dir, exist_ok=True)
-        bn_stats, rdp_norm = scatter_normalization(train_loader,
-                                                   scattering,
-                                                   K,
-                                                   device,
-                                                   len(train_data),
-                                                   len(train_data),
-                                                   noise_multiplier=bn_noise_multiplier,
-                                                   orders=ORDERS,
-                                                   save_dir=save_dir)
+        bn_stats, _ = scatter_normalization(train_loader,
+                                            scattering,
+                                            K,
+                                            device,
+                                            len(train_data),
+                                            len(train_data),
+                                            noise_multiplier=bn_noise_multiplier,
+                                            orders=ORDERS,
+                                            save_dir=save_dir)
+        norm_ledger = normalization_ledger(len(train_data), len(train_data), bn_noise_multiplier)
         model = CNNS[dataset](K, input_norm="BN", bn_stats=bn_stats, size=size)
         model2 = CNNS[dataset](K, input_norm="BN", bn_stats=bn_stats, size=size)
     else:
@@ -89,8 +92,10 @@ def main(dataset, augment=False, use_scattering=True, size=None,
     else:
         # pre-compute the scattering transform if necessery
         train_loader = get_scattered_loader(train_loader, scattering, device,
-                                            drop_last=True, sample_batches=sample_batches)
-        test_loader = get_scattered_loader(test_loader, scattering, device)
+                                            drop_last=True, sample_batches=sample_batches,
+                                            cache_dir=feature_cache_dir, dataset=dataset, split="train")
+        test_loader = get_scattered_loader(test_loader, scattering, device,
+                                           cache_dir=feature_cache_dir, dataset=dataset, split="test")
 
     print(f"model has {get_num_params(model)} parameters")
     print(train_loader)
@@ -128,6 +133,9 @@ def main(dataset, augment=False, use_scattering=True, size=None,
     )
     privacy_engine2.attach(optimizer2)
 
+    # ModelMix over flat parameter buffers (models must already be on the device)
+    mixer = get_mixer(model, model2)
+
     best_acc = 0
     flat_count = 0
 
@@ -136,7 +144,8 @@ def main(dataset, augment=False, use_scattering=True, size=None,
     for epoch in range(0, epochs):
         print(f"\nEpoch: {epoch}")
 
-        train_loss, train_acc = train(model, model2, train_loader, optimizer, optimizer2, epoch, n_acc_steps=n_acc_steps)
+        train_loss, train_acc = train(model, model2, train_loader, optimizer, optimizer2, epoch, n_acc_steps=n_acc_steps,
+                                      mixer=mixer)
         test_loss, test_acc = test(model, test_loader)
         test_loss2, test_acc2 = test(model2, test_loader)
         test_acc = max(test_acc, test_acc2)
@@ -146,11 +155,8 @@ def main(dataset, augment=False, use_scattering=True, size=None,
         lr_scheduler2.step()
 
         if noise_multiplier > 0:
-            rdp_sgd = get_renyi_divergence(
-                privacy_engine.sample_rate, privacy_engine.noise_multiplier
-            ) * privacy_engine.steps
-            epsilon, _ = get_privacy_spent(rdp_norm + rdp_sgd)
-            epsilon2, _ = get_privacy_spent(rdp_sgd)
+            epsilon, _ = get_privacy_spent_ledger(norm_ledger + privacy_engine.ledger, accountant=accountant)
+            epsilon2, _ = get_privacy_spent_ledger(privacy_engine.ledger, accountant=accountant)
             print(f"ε = {epsilon:.3f} (sgd only: ε = {epsilon2:.3f})")
 
             if max_epsilon is not None and epsilon >= max_epsilon:
@@ -202,6 +208,9 @@ if __name__ == '__main__':
     parser.add_argument('--early_stop', type=bool, default=True)
     parser.add_argument('--sample_batches', action="store_true")
     parser.add_argument('--logdir', default=None)
+    parser.add_argument('--accountant', default="rdp", choices=["rdp", "pld"])
+    parser.add_argument('--feature_cache_dir', default=None,
+                        help="directory of the on-disk cache of scattering features")
     args = parser.parse_args()
     main(**vars(args))
 
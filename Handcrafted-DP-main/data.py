@@ -6,6 +6,9 @@ import pickle
 import numpy as np
 import logging
 
+from feature_cache import get_cached_scattered_dataset, ShardBatchLoader
+from opacus.utils.uniform_sampler import poisson_sample
+
 
 SHAPES = {
     "cifar10": (32, 32, 3),
@@ -15,9 +18,18 @@ SHAPES = {
 }
 
 
-def get_scatter_transform(dataset):
+def get_scatter_transform(dataset, batched=False, real_input=False, precision="float32"):
+    # with `batched`, the wavelets of each scale are applied at once instead of
+    # one at a time (same coefficients, fewer and larger kernels: faster on GPU
+    # and for small batches, see benchmark_scattering.py).
+    # With `real_input`, the images and moduli are transformed with real FFTs
+    # (same coefficients up to rounding, half the input memory).
+    # `precision` is "float32" (complex numbers as pairs of floats), "complex64"
+    # (native complex tensors) or "float16"/"bfloat16" (native complex tensors,
+    # with the filters and moduli stored in half precision)
     shape = SHAPES[dataset]
-    scattering = Scattering2D(J=2, shape=shape[:2])
+    scattering = Scattering2D(J=2, shape=shape[:2], batched=batched, real_input=real_input,
+                              precision=precision)
     K = 81 * shape[2]
     (h, w) = shape[:2]
     return scattering, K, (h//4, w//4)
@@ -231,19 +243,20 @@ class SemiSupervisedSampler(torch.utils.data.Sampler):
 
 
 class PoissonSampler(torch.utils.data.Sampler):
-    def __init__(self, num_examples, batch_size):
-        self.inds = np.arange(num_examples)
+    def __init__(self, num_examples, batch_size, generator=None):
+        self.num_examples = num_examples
         self.batch_size = batch_size
         self.num_batches = int(np.ceil(num_examples / batch_size))
         self.sample_rate = self.batch_size / (1.0 * num_examples)
+        self.generator = generator
         super().__init__(None)
 
     def __iter__(self):
-        # select each data point independently with probability `sample_rate`
+        # select each data point independently with probability `sample_rate`,
+        # in time proportional to the batch size (see opacus.utils.uniform_sampler)
         for i in range(self.num_batches):
-            batch_idxs = np.random.binomial(n=1, p=self.sample_rate, size=len(self.inds))
-            batch = self.inds[batch_idxs.astype(np.bool)]
-            np.random.shuffle(batch)
+            batch = poisson_sample(self.num_examples, self.sample_rate, generator=self.generator)
+            batch = batch[torch.randperm(len(batch), generator=self.generator)]
             yield batch
 
     def __len__(self):
@@ -279,34 +292,120 @@ def get_scattered_dataset(loader, scattering, device, data_size):
     return data
 
 
-def get_scattered_loader(loader, scattering, device, drop_last=False, sample_batches=False):
-    # pre-compute a scattering transform (if there is one) and return
-    # a DataLoader
+class TensorBatchLoader(object):
+    # iterates over batches of `tensors` (e.g. features and targets) like a DataLoader
+    # over a TensorDataset, but builds every batch with a single slice (sequential
+    # batches) or index_select (shuffled batches, or the batches of a `batch_sampler`)
+    # per tensor, instead of one __getitem__ per sample followed by default_collate.
+    #
+    # With `pin_memory` and a cuda `device`, batches of CPU tensors are gathered into
+    # two pinned buffers in turn and copied to the device asynchronously, so that
+    # gathering a batch overlaps with the copy of the previous one.
+
+    def __init__(self, tensors, batch_size=1, shuffle=False, drop_last=False,
+                 batch_sampler=None, pin_memory=False, device=None, generator=None):
+        assert all(len(t) == len(tensors[0]) for t in tensors)
+        self.tensors = tensors
+        self.batch_sampler = batch_sampler
+        self.batch_size = None if batch_sampler is not None else batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.generator = generator
+        self.device = device
+        self.pin_memory = (pin_memory and device is not None and torch.device(device).type == "cuda"
+                           and all(t.device.type == "cpu" for t in tensors))
 
-    scatters = []
-    targets = []
+    def __len__(self):
+        if self.batch_sampler is not None:
+            return len(self.batch_sampler)
+        if self.drop_last:
+            return len(self.tensors[0]) // self.batch_size
+        return (len(self.tensors[0]) + self.batch_size - 1) // self.batch_size
+
+    def batches(self):
+        # the batches to gather: slices of the tensors, or index tensors
+        if self.batch_sampler is not None:
+            for indices in self.batch_sampler:
+                yield torch.as_tensor(indices, dtype=torch.long)
+        else:
+            num = len(self.tensors[0])
+            perm = torch.randperm(num, generator=self.generator) if self.shuffle else None
+            for start in range(0, len(self) * self.batch_size, self.batch_size):
+                end = min(start + self.batch_size, num)
+                yield slice(start, end) if perm is None else perm[start:end]
 
-    for (data, target) in loader:
-        data, target = data.to(device), target.to(device)
-        if scattering is not None:
-            data = scattering(data)
-        scatters.append(data)
-        targets.append(target)
+    def __iter__(self):
+        if not self.pin_memory:
+            for batch in self.batches():
+                if isinstance(batch, slice):
+                    yield tuple(t[batch] for t in self.tensors)
+                else:
+                    yield tuple(t.index_select(0, batch.to(t.device)) for t in self.tensors)
+            return
+
+        buffers = [None, None]
+        copied = [None, None]
+        for k, batch in enumerate(self.batches()):
+            slot = k % 2
+            size = batch.stop - batch.start if isinstance(batch, slice) else len(batch)
+
+            # wait for the copy out of this buffer (two batches ago) before reusing it
+            if copied[slot] is not None:
+                copied[slot].synchronize()
+            if buffers[slot] is None or len(buffers[slot][0]) < size:
+                buffers[slot] = [torch.empty((size,) + t.shape[1:], dtype=t.dtype).pin_memory()
+                                 for t in self.tensors]
+
+            staged = []
+            for t, buf in zip(self.tensors, buffers[slot]):
+                buf = buf[:size]
+                if isinstance(batch, slice):
+                    buf.copy_(t[batch])
+                else:
+                    torch.index_select(t, 0, batch, out=buf)
+                staged.append(buf)
+
+            out = tuple(buf.to(self.device, non_blocking=True) for buf in staged)
+            copied[slot] = torch.cuda.Event()
+            copied[slot].record()
+            yield out
+
+
+def get_scattered_loader(loader, scattering, device, drop_last=False, sample_batches=False,
+                         cache_dir=None, dataset=None, split=None):
+    # pre-compute a scattering transform (if there is one) and return
+    # a loader of batches of the pre-computed data.
+    # With a `cache_dir`, the features are memory-mapped from an on-disk cache
+    # shared by all runs (see feature_cache.py), and computed only the first time.
 
-    scatters = torch.cat(scatters, axis=0)
-    targets = torch.cat(targets, axis=0)
+    cached = cache_dir is not None and scattering is not None
+    if cached:
+        data = get_cached_scattered_dataset(loader, scattering, device, dataset, split, cache_dir)
+    else:
+        scatters = []
+        targets = []
+
+        for (data, target) in loader:
+            data, target = data.to(device), target.to(device)
+            if scattering is not None:
+                data = scattering(data)
+            scatters.append(data)
+            targets.append(target)
+
+        scatters = torch.cat(scatters, axis=0)
+        targets = torch.cat(targets, axis=0)
+
+    num_samples = len(data) if cached else len(scatters)
+    shuffle = isinstance(loader.sampler, torch.utils.data.RandomSampler)
+    batch_sampler = None
+    if sample_batches:
+        batch_sampler = PoissonSampler(num_samples, loader.batch_size)
 
-    data = torch.utils.data.TensorDataset(scatters, targets)
+    if cached:
+        if batch_sampler is None:
+            sampler = torch.utils.data.RandomSampler(data) if shuffle else torch.utils.data.SequentialSampler(data)
+            batch_sampler = torch.utils.data.BatchSampler(sampler, loader.batch_size, drop_last)
+        return ShardBatchLoader(data, batch_sampler)
 
-    if sample_batches:
-        sampler = PoissonSampler(len(scatters), loader.batch_size)
-        return torch.utils.data.DataLoader(data, batch_sampler=sampler,
-                                           num_workers=0, pin_memory=False)
-    else:
-        shuffle = isinstance(loader.sampler, torch.utils.data.RandomSampler)
-        return torch.utils.data.DataLoader(data,
-                                           batch_size=loader.batch_size,
-                                           shuffle=shuffle,
-                                           num_workers=0,
-                                           pin_memory=False,
-                                           drop_last=drop_last)
+    return TensorBatchLoader((scatters, targets), batch_size=loader.batch_size, shuffle=shuffle,
+                             drop_last=drop_last, batch_sampler=batch_sampler)
@@ -4,6 +4,9 @@ import math
 import numpy as np
 import torch
 import opacus.privacy_analysis as tf_privacy
+from opacus import calibration
+from opacus.privacy_ledger import PrivacyLedger
+from opacus.scripts.compute_dp_sgd_privacy_sweep import compute_dp_sgd_privacy_sweep
 
 ORDERS = [1 + x / 10.0 for x in range(1, 100)] + list(range(12, 64))
 
@@ -21,67 +24,127 @@ def get_privacy_spent(total_rdp, target_delta=1e-5, orders=ORDERS):
     return tf_privacy.get_privacy_spent(orders, total_rdp, target_delta)
 
 
-def get_epsilon(sample_rate, mul, num_steps, target_delta=1e-5, orders=ORDERS, rdp_init=0):
+def get_privacy_spent_ledger(ledger, target_delta=1e-5, orders=ORDERS, accountant="rdp"):
+    # compute the epsilon budget spent by all the mechanisms recorded in a PrivacyLedger,
+    # with the RDP or the PLD accountant
+    return ledger.get_privacy_spent(target_delta, orders, accountant)
+
+
+def normalization_ledger(data_size, sample_size, noise_multiplier):
+    # the sampled gaussian mechanisms of `scatter_normalization` (noisy means and squared means)
+    ledger = PrivacyLedger()
+    if noise_multiplier is not None and noise_multiplier > 0:
+        ledger.record(sample_size / (1.0 * data_size), noise_multiplier, count=2)
+    return ledger
+
+
+def get_epsilon(sample_rate, mul, num_steps, target_delta=1e-5, orders=ORDERS, rdp_init=0, accountant="rdp"):
     # compute the epsilon budget spent after `num_steps` with batch sampling rate
     # of `sample_rate` and a noise multiplier of `mul`
 
+    if accountant == "pld":
+        # the PLD accountant composes mechanisms, not RDP curves: see get_privacy_spent_ledger
+        assert np.all(np.asarray(rdp_init) == 0)
+        ledger = PrivacyLedger()
+        ledger.record(sample_rate, mul, num_steps)
+        eps, _ = get_privacy_spent_ledger(ledger, target_delta, orders, accountant)
+        return eps
+
     rdp = rdp_init + get_renyi_divergence(sample_rate, mul, orders=orders) * num_steps
     eps, _ = get_privacy_spent(rdp, target_delta=target_delta, orders=orders)
     return eps
 
 
+def get_epsilon_table(noise_multipliers, batch_sizes, epochs, sample_sizes, target_deltas=(1e-5,), orders=ORDERS):
+    # compute the epsilon budget of every combination of the hyperparameters at once,
+    # instead of calling `get_epsilon` in nested loops. Returns a dict of columns
+    # (noise_multiplier, batch_size, epochs, sample_size, sample_rate, steps, delta, epsilon, alpha)
+    return compute_dp_sgd_privacy_sweep(noise_multipliers, batch_sizes, epochs, sample_sizes, target_deltas, orders)
+
+
 def get_noise_mul(num_samples, batch_size, target_epsilon, epochs, rdp_init=0, target_delta=1e-5, orders=ORDERS):
     # compute the noise multiplier that results in a privacy budget
     # of `target_epsilon` being spent after a given number of epochs of DP-SGD.
-
-    mul_low = 100
-    mul_high = 0.1
+    # The search is shared with the PrivacyEngine (see opacus.calibration): RDP curves
+    # are memoized and every search is warm-started from the closest earlier solution.
 
     num_steps = math.floor(num_samples // batch_size) * epochs
     sample_rate = batch_size / (1.0 * num_samples)
 
-    eps_low = get_epsilon(sample_rate, mul_low, num_steps, target_delta, orders, rdp_init=rdp_init)
-    eps_high = get_epsilon(sample_rate, mul_high, num_steps, target_delta, orders, rdp_init=rdp_init)
-
-    assert eps_low < target_epsilon
-    assert eps_high > target_epsilon
+    return calibration.calibrate_noise_multiplier(
+        target_epsilon, target_delta, sample_rate, num_steps, orders,
+        rdp_init=np.asarray(rdp_init, dtype=float)
+    )
 
-    while eps_high - eps_low > 0.01:
-        mul_mid = (mul_high + mul_low) / 2
-        eps_mid = get_epsilon(sample_rate, mul_mid, num_steps, target_delta, orders, rdp_init=rdp_init)
 
-        if eps_mid <= target_epsilon:
-            mul_low = mul_mid
-            eps_low = eps_mid
-        else:
-            mul_high = mul_mid
-            eps_high = eps_mid
+def get_noise_muls(num_samples, targets, target_delta=1e-5, orders=ORDERS):
+    # compute the noise multipliers of a grid of `(target_epsilon, batch_size, epochs)`
+    # targets in one call, in the same order as `targets`
 
-    return mul_low
+    grid = [(target_epsilon, batch_size / (1.0 * num_samples), math.floor(num_samples // batch_size) * epochs)
+            for target_epsilon, batch_size, epochs in targets]
+    return calibration.calibrate_noise_multipliers(grid, target_delta, orders)
 
 
 def get_noise_mul_privbyiter(num_samples, batch_size, target_epsilon, epochs, target_delta=1e-5):
-    mul_low = 100
-    mul_high = 0.1
-
-    eps_low = priv_by_iter_guarantees(epochs, batch_size, num_samples, mul_low, target_delta, verbose=False)
-    eps_high = priv_by_iter_guarantees(epochs, batch_size, num_samples, mul_high, target_delta, verbose=False)
-
-    assert eps_low < target_epsilon
-    assert eps_high > target_epsilon
+    def eps_fn(mul):
+        return priv_by_iter_guarantees(epochs, batch_size, num_samples, mul, target_delta, verbose=False)
 
-    while eps_high - eps_low > 0.01:
-        mul_mid = (mul_high + mul_low) / 2
-        eps_mid = priv_by_iter_guarantees(epochs, batch_size, num_samples, mul_mid, target_delta, verbose=False)
+    return calibration.get_calibrator().solve(
+        eps_fn, target_epsilon,
+        family=("privbyiter", target_delta),
+        point=(math.log(num_samples / batch_size), math.log(epochs), math.log(target_epsilon))
+    )
 
-        if eps_mid <= target_epsilon:
-            mul_low = mul_mid
-            eps_low = eps_mid
-        else:
-            mul_high = mul_mid
-            eps_high = eps_mid
 
-    return mul_low
+class NormClippingSketch(object):
+    # streaming sum of K-dimensional vectors clipped to a quantile of their norms.
+    #
+    # The norms are counted in log-spaced buckets (a DDSketch): bucket i holds the
+    # norms in (gamma^(i-1), gamma^i] (relative to `min_norm`), so any quantile is
+    # known to a relative accuracy of `relative_accuracy` with O(log(max_norm / min_norm))
+    # counters. Each bucket also accumulates the sum of its vectors x and of x / |x|,
+    # so that once a quantile is picked, the sum of the vectors clipped to its bucket's
+    # upper edge t is exact:
+    #   sum_{|x| <= t} x + t * sum_{|x| > t} x / |x|
+    # The state is O(num_buckets * K) and lives on `device`.
+
+    def __init__(self, K, device, relative_accuracy=0.01, min_norm=1e-8, max_norm=1e8):
+        self.log_gamma = math.log((1 + relative_accuracy) / (1 - relative_accuracy))
+        self.offset = math.floor(math.log(min_norm) / self.log_gamma)
+        num_buckets = math.ceil(math.log(max_norm) / self.log_gamma) - self.offset + 1
+        self.counts = torch.zeros(num_buckets, dtype=torch.float64, device=device)
+        self.sums = torch.zeros(num_buckets, K, dtype=torch.float64, device=device)
+        self.unit_sums = torch.zeros(num_buckets, K, dtype=torch.float64, device=device)
+
+    def bucket_edge(self, bucket):
+        # upper edge of a bucket
+        return math.exp((bucket + self.offset) * self.log_gamma)
+
+    def update(self, x):
+        # add a batch of vectors (s x K); norms outside of [min_norm, max_norm] go
+        # to the first or last bucket
+        x = x.to(self.sums.dtype)
+        norms = torch.linalg.norm(x, dim=-1)
+        buckets = torch.ceil(torch.log(norms) / self.log_gamma) - self.offset
+        buckets = buckets.nan_to_num(0).clamp(0, len(self.counts) - 1).long()
+        self.counts.index_add_(0, buckets, torch.ones_like(norms))
+        self.sums.index_add_(0, buckets, x)
+        self.unit_sums.index_add_(0, buckets, x / norms.clamp_min(1e-30).unsqueeze(-1))
+
+    def quantile(self, q):
+        # the upper edge of the bucket of the norm of rank q * (n - 1)
+        cumulative = torch.cumsum(self.counts, 0)
+        rank = q * (cumulative[-1].item() - 1)
+        bucket = torch.searchsorted(cumulative, torch.tensor([rank], dtype=cumulative.dtype,
+                                                             device=cumulative.device), right=True)
+        return self.bucket_edge(bucket.item())
+
+    def clipped_sum(self, thresh):
+        # sum of the vectors clipped to a norm of `thresh`, a bucket edge returned by `quantile`
+        bucket = int(round(math.log(thresh) / self.log_gamma)) - self.offset
+        clipped = self.sums[:bucket + 1].sum(0) + thresh * self.unit_sums[bucket + 1:].sum(0)
+        return clipped.cpu().numpy()
 
 
 def scatter_normalization(train_loader, scattering, K, device,
@@ -114,8 +177,12 @@ def scatter_normalization(train_loader, scattering, K, device,
         print(mean.shape, var.shape)
     except OSError:
 
-        # compute the scattering transform and the mean and squared mean of features
-        scatters = []
+        # compute the scattering transform and the mean and squared mean of features.
+        # With noise, the per-sample means and squared means are streamed into
+        # sketches of their norms (see NormClippingSketch) rather than kept in memory
+        if noise_multiplier > 0:
+            mean_sketch = NormClippingSketch(K, device)
+            sq_mean_sketch = NormClippingSketch(K, device)
         mean = 0
         sq_mean = 0
         count = 0
@@ -129,40 +196,27 @@ def scatter_normalization(train_loader, scattering, K, device,
                     mean += data.sum(0).cpu().numpy()
                     sq_mean += (data**2).sum(0).cpu().numpy()
                 else:
-                    scatters.append(data.cpu().numpy())
+                    # s x K
+                    data = data[:sample_size - count].reshape(-1, K, data.shape[2] * data.shape[3])
+                    mean_sketch.update(data.mean(-1))
+                    sq_mean_sketch.update((data**2).mean(-1))
 
                 count += len(data)
                 if count >= sample_size:
                     break
 
         if noise_multiplier > 0:
-            scatters = np.concatenate(scatters, axis=0)
-            scatters = np.transpose(scatters, (0, 2, 3, 1))
-
-            scatters = scatters[:sample_size]
-
-            # s x K
-            scatter_means = np.mean(scatters.reshape(len(scatters), -1, K), axis=1)
-            norms = np.linalg.norm(scatter_means, axis=-1)
-
             # technically a small privacy leak, sue me...
-            thresh_mean = np.quantile(norms, 0.5)
-            scatter_means /= np.maximum(norms / thresh_mean, 1).reshape(-1, 1)
-            mean = np.mean(scatter_means, axis=0)
+            thresh_mean = mean_sketch.quantile(0.5)
+            mean = mean_sketch.clipped_sum(thresh_mean) / count
 
             mean += np.random.normal(scale=thresh_mean * noise_multiplier,
                                      size=mean.shape) / sample_size
 
-            # s x K
-            scatter_sq_means = np.mean((scatters ** 2).reshape(len(scatters), -1, K),
-                                       axis=1)
-            norms = np.linalg.norm(scatter_sq_means, axis=-1)
-
             # technically a small privacy leak, sue me...
-            thresh_var = np.quantile(norms, 0.5)
+            thresh_var = sq_mean_sketch.quantile(0.5)
             print(f"thresh_mean={thresh_mean:.2f}, thresh_var={thresh_var:.2f}")
-            scatter_sq_means /= np.maximum(norms / thresh_var, 1).reshape(-1, 1)
-            sq_mean = np.mean(scatter_sq_means, axis=0)
+            sq_mean = sq_mean_sketch.clipped_sum(thresh_var) / count
             sq_mean += np.random.normal(scale=thresh_var * noise_multiplier,
                                         size=sq_mean.shape) / sample_size
             var = np.maximum(sq_mean - mean ** 2, 0)
@@ -0,0 +1,253 @@
+import fcntl
+import hashlib
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import torch
+import kymatio
+
+# on-disk cache of pre-computed scattering features.
+#
+# The features of a (dataset, split) are identified by a digest of everything they
+# depend on: the dataset, its source file, its pre-processing, the parameters of the
+# Scattering2D transform, the storage dtype and the kymatio version. They are written
+# once, by a single process holding a lock on the entry, as shards of at most
+# `SHARD_SIZE` samples in `.npy` files, and every later run memory-maps the shards
+# instead of recomputing the transform.
+# The features are streamed to the shards block by block, so datasets that do not
+# fit in memory (e.g. the 500K tiny images) are transformed once and then trained
+# on at disk bandwidth with a `ShardBatchLoader`.
+#
+# layout of a cache entry:
+#   <cache_dir>/<dataset>-<split>-<digest>/meta.json
+#   <cache_dir>/<dataset>-<split>-<digest>/targets.npy
+#   <cache_dir>/<dataset>-<split>-<digest>/features_00000.npy, features_00001.npy, ...
+
+SHARD_SIZE = 10000
+
+
+def scattering_config(scattering):
+    # the parameters of a Scattering2D transform that determine its output
+    config = {
+        "J": scattering.J,
+        "L": scattering.L,
+        "shape": list(scattering.shape),
+        "max_order": scattering.max_order,
+        "pre_pad": scattering.pre_pad,
+    }
+    # reduced precisions change the features (single precision keeps the keys of older entries)
+    precision = getattr(scattering, "precision", "float32")
+    if precision != "float32":
+        config["precision"] = precision
+    return config
+
+
+def get_transform(data):
+    # the pre-processing of a dataset, looking through wrappers such as Subset
+    while not hasattr(data, "transform") and hasattr(data, "dataset"):
+        data = data.dataset
+    return getattr(data, "transform", None)
+
+
+def source_config(source):
+    # identifies a source file by its path, size and modification time (hashing
+    # the content of e.g. the tiny images would cost as much as a cache miss)
+    stat = os.stat(source)
+    return {"path": os.path.abspath(source), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def feature_cache_path(cache_dir, dataset, split, data, scattering, dtype=np.float32, source=None):
+    # path of the cache entry of the scattering features of `data`. `source` is the
+    # file the data was read from, when it is not implied by `dataset`.
+    # The key does not depend on the order of the samples, which datasets such as
+    # SemiSupervisedDataset shuffle at every construction: an entry stores the
+    # targets of the samples in the order they were transformed.
+    key = {
+        "dataset": dataset,
+        "split": split,
+        "num_samples": len(data),
+        "transform": repr(get_transform(data)),
+        "scattering": scattering_config(scattering),
+        "dtype": np.dtype(dtype).name,
+        "kymatio": kymatio.__version__,
+    }
+    if source is not None:
+        key["source"] = source_config(source)
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{dataset}-{split}-{digest}"), key
+
+
+class FeatureShards(torch.utils.data.Dataset):
+    # a dataset of memory-mapped feature shards written by `write_feature_shards`.
+    # Samples are read straight from the page cache, so jobs sharing a node also
+    # share the memory of the features.
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.shard_size = self.meta["shard_size"]
+
+        # copy-on-write mappings: zero-copy, but writable for torch.from_numpy
+        self.shards = [np.load(os.path.join(path, name), mmap_mode="c")
+                       for name in self.meta["shards"]]
+        self.targets = torch.from_numpy(np.load(os.path.join(path, "targets.npy")))
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __getitem__(self, idx):
+        shard, offset = divmod(idx, self.shard_size)
+        return torch.from_numpy(self.shards[shard][offset]), self.targets[idx]
+
+    def get_batch(self, indices):
+        # gather a batch with one read per shard, in increasing offsets, and
+        # return it in the order of `indices`
+        indices = np.asarray(indices, dtype=np.int64)
+        order = np.argsort(indices, kind="stable")
+        sorted_indices = indices[order]
+        shard_ids = sorted_indices // self.shard_size
+
+        features = np.empty((len(indices),) + self.shards[0].shape[1:],
+                            dtype=self.shards[0].dtype)
+        for shard in np.unique(shard_ids):
+            mask = shard_ids == shard
+            features[order[mask]] = self.shards[shard][sorted_indices[mask] - shard * self.shard_size]
+        return torch.from_numpy(features), self.targets[torch.from_numpy(indices)]
+
+
+class ShardBatchLoader(object):
+    # iterates over the batches of a `FeatureShards` dataset drawn by `batch_sampler`,
+    # like a DataLoader with that batch sampler. A background thread gathers the
+    # batches (see `FeatureShards.get_batch`) up to `prefetch` batches ahead of the
+    # training loop, so reading from disk overlaps with training.
+
+    def __init__(self, data, batch_sampler, prefetch=4, pin_memory=False):
+        self.dataset = data
+        self.batch_sampler = batch_sampler
+        self.batch_size = None
+        self.prefetch = prefetch
+        self.pin_memory = pin_memory
+
+    def __len__(self):
+        return len(self.batch_sampler)
+
+    def _produce(self, batches, stop):
+        try:
+            for indices in self.batch_sampler:
+                data, target = self.dataset.get_batch(indices)
+                if self.pin_memory:
+                    data, target = data.pin_memory(), target.pin_memory()
+                while not stop.is_set():
+                    try:
+                        batches.put((data, target), timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+        except BaseException as e:
+            batches.put(e)
+        batches.put(None)
+
+    def __iter__(self):
+        batches = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        producer = threading.Thread(target=self._produce, args=(batches, stop), daemon=True)
+        producer.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    return
+                if isinstance(batch, BaseException):
+                    raise batch
+                yield batch
+        finally:
+            # the training loop can stop early: release the producer
+            stop.set()
+            while producer.is_alive():
+                try:
+                    batches.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+
+def write_feature_shards(path, loader, scattering, device, meta, dtype=np.float32,
+                         shard_size=SHARD_SIZE):
+    # compute the scattering features of all the samples of `loader` (in order) and
+    # write them to the cache entry `path`. The entry is built in a temporary
+    # directory and moved into place once complete.
+
+    tmp_path = tempfile.mkdtemp(prefix=".tmp-", dir=os.path.dirname(path))
+    try:
+        num_samples = len(loader.dataset)
+        shards = []
+        targets = np.zeros(num_samples, dtype=np.int64)
+        shard = None
+        num = 0
+        for (data, target) in loader:
+            with torch.no_grad():
+                data = scattering(data.to(device)).cpu().numpy().astype(dtype, copy=False)
+            targets[num:num + len(data)] = target.numpy()
+
+            # fill the current shard, opening new ones as needed
+            start = 0
+            while start < len(data):
+                if num % shard_size == 0:
+                    if shard is not None:
+                        shard.flush()
+                    name = f"features_{len(shards):05d}.npy"
+                    shards.append(name)
+                    shard = np.lib.format.open_memmap(
+                        os.path.join(tmp_path, name), mode="w+", dtype=dtype,
+                        shape=(min(shard_size, num_samples - num),) + data.shape[1:])
+                offset = num % shard_size
+                count = min(len(data) - start, shard_size - offset)
+                shard[offset:offset + count] = data[start:start + count]
+                start += count
+                num += count
+
+        assert num == num_samples
+        if shard is not None:
+            shard.flush()
+            del shard
+        np.save(os.path.join(tmp_path, "targets.npy"), targets)
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump(dict(meta, shard_size=shard_size, shards=shards), f, indent=2)
+        os.rename(tmp_path, path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def get_cached_scattered_dataset(loader, scattering, device, dataset, split, cache_dir,
+                                 dtype=np.float32, shard_size=SHARD_SIZE, source=None):
+    # return the scattering features of the data of `loader` as a `FeatureShards`
+    # dataset, computing them only if they are not in the cache yet.
+    # Concurrent jobs wait on a lock for the first one to write the features.
+
+    data = loader.dataset
+    os.makedirs(cache_dir, exist_ok=True)
+    path, meta = feature_cache_path(cache_dir, dataset, split, data, scattering, dtype, source)
+
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(path):
+                print(f"computing scattering features of {dataset}/{split} into {path}")
+                ordered_loader = torch.utils.data.DataLoader(
+                    data, batch_size=loader.batch_size, shuffle=False,
+                    num_workers=loader.num_workers, pin_memory=loader.pin_memory)
+                write_feature_shards(path, ordered_loader, scattering, device, meta,
+                                     dtype=dtype, shard_size=shard_size)
+            else:
+                print(f"loading scattering features of {dataset}/{split} from {path}")
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+    return FeatureShards(path)
@@ -1,4 +1,12 @@
+import hashlib
+import inspect
+import json
 import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
 
 
 def find_cache_base_dir(cache_base_dir=None):
@@ -61,3 +69,145 @@ def get_cache_dir(name="", cache_base_dir=None, create=True):
             raise ValueError(
                 'The cache directory does not exist,' +
                 'but I cannot create it: {}'.format(path))
+
+
+class _ArrayRef(object):
+    """Placeholder of an array in a cached filter bank: the array is the
+    `size` elements of the `dtype` arrays of the bank starting at `offset`,
+    with shape `shape`."""
+    def __init__(self, dtype, offset, shape):
+        self.dtype = dtype
+        self.offset = offset
+        self.shape = shape
+
+
+def _split_arrays(obj, arrays):
+    """Replaces the numpy arrays of a nested structure of dicts, lists and
+    tuples by `_ArrayRef`s, appending the arrays to the lists of `arrays`
+    (one list per dtype)."""
+    if isinstance(obj, np.ndarray):
+        dtype = obj.dtype.str
+        chunks = arrays.setdefault(dtype, [])
+        offset = sum(chunk.size for chunk in chunks)
+        chunks.append(obj.ravel())
+        return _ArrayRef(dtype, offset, obj.shape)
+    if isinstance(obj, dict):
+        return {k: _split_arrays(v, arrays) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_split_arrays(v, arrays) for v in obj)
+    return obj
+
+
+def _join_arrays(obj, arrays):
+    """Inverse of `_split_arrays`, with the arrays as views of `arrays`."""
+    if isinstance(obj, _ArrayRef):
+        size = int(np.prod(obj.shape))
+        return arrays[obj.dtype][obj.offset:obj.offset + size].reshape(obj.shape)
+    if isinstance(obj, dict):
+        return {k: _join_arrays(v, arrays) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_join_arrays(v, arrays) for v in obj)
+    return obj
+
+
+def _dtype_name(dtype):
+    return "_" + np.dtype(dtype).name
+
+
+def _source_digest(factory):
+    """Digest of the source file of `factory`, which also holds the
+    helpers it calls."""
+    with open(inspect.getsourcefile(factory), "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def filter_bank_cache_path(factory, args, kwargs, cache_base_dir=None):
+    """
+    Path of the cache entry of the output of `factory(*args, **kwargs)`
+
+    The entry is keyed by the name of the factory, a digest of its source
+    file, its arguments and the version of kymatio, so that it is
+    invalidated when the filters change, including by a local edit of the
+    code that builds them.
+    """
+    from .version import version
+
+    key = {
+        "factory": factory.__module__ + "." + factory.__name__,
+        "source": _source_digest(factory),
+        "args": args,
+        "kwargs": kwargs,
+        "version": version,
+    }
+    digest = hashlib.sha1(
+        json.dumps(key, sort_keys=True, default=repr).encode()).hexdigest()[:16]
+    return os.path.join(get_cache_dir("filters", cache_base_dir=cache_base_dir),
+                        factory.__name__ + "-" + digest)
+
+
+def cached_filter_bank(factory, *args, **kwargs):
+    """
+    Returns `factory(*args, **kwargs)`, read from the filter bank cache.
+
+    The filter banks of the scattering transforms are nested dicts, lists and
+    tuples of numpy arrays and scalars. The first time a filter bank is built,
+    its arrays are written to the cache directory "filters" (see
+    `get_cache_dir`) as one `.npy` file per dtype next to the structure of the
+    bank. Later calls, in any process, memory-map these files (copy-on-write)
+    instead of building the filters again.
+
+    Setting the environment variable 'KYMATIO_FILTER_CACHE' to "0" disables
+    the cache. If the cache directory cannot be written, the filters are built
+    without caching.
+
+    Arguments
+    ---------
+    factory: callable
+        Function building the filter bank, e.g. `filter_bank` of scattering2d.
+        Its output must only depend on its arguments.
+    args, kwargs:
+        The (JSON-serializable) arguments of the factory.
+
+    Returns
+    -------
+    filters:
+        The output of the factory.
+    """
+    if os.environ.get('KYMATIO_FILTER_CACHE', '1') == '0':
+        return factory(*args, **kwargs)
+
+    try:
+        path = filter_bank_cache_path(factory, args, kwargs)
+    except (OSError, TypeError, ValueError):
+        return factory(*args, **kwargs)
+
+    if not os.path.exists(path):
+        filters = factory(*args, **kwargs)
+        arrays = {}
+        structure = _split_arrays(filters, arrays)
+        try:
+            # build the entry in a temporary directory and move it into place,
+            # so that concurrent processes only ever see complete entries
+            tmp_path = tempfile.mkdtemp(prefix=".tmp-", dir=os.path.dirname(path))
+            try:
+                for dtype, chunks in arrays.items():
+                    np.save(os.path.join(tmp_path, "arrays" + _dtype_name(dtype) + ".npy"),
+                            np.concatenate(chunks))
+                with open(os.path.join(tmp_path, "structure.pkl"), "wb") as f:
+                    pickle.dump(structure, f)
+                os.rename(tmp_path, path)
+            except OSError:
+                # another process may have written the entry first
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        except OSError:
+            pass
+        return filters
+
+    with open(os.path.join(path, "structure.pkl"), "rb") as f:
+        structure = pickle.load(f)
+    arrays = {}
+    for name in os.listdir(path):
+        if name.startswith("arrays") and name.endswith(".npy"):
+            array = np.load(os.path.join(path, name), mmap_mode="c")
+            arrays[array.dtype.str] = array
+    return _join_arrays(structure, arrays)
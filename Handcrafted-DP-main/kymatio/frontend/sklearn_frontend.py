@@ -1,18 +1,136 @@
+import copy
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
 from sklearn.base import BaseEstimator, TransformerMixin
 
 
+# default memory budget of the chunks transformed concurrently, in bytes
+MEMORY_BUDGET = 2 ** 28
+
+# bytes used while transforming a sample, as a multiple of its input and
+# output sizes (to account for the intermediates of the transform)
+_MEMORY_FACTOR = 4
+
+
+def _transform_chunk(scattering, x):
+    """Scattering of the samples of `x`, flattened to (n_samples, -1)."""
+    n_samples = x.shape[0]
+    shape = scattering.shape if isinstance(scattering.shape, tuple) else (scattering.shape,)
+    Sx = scattering.scattering(x.reshape((-1,) + shape))
+    return Sx.reshape(n_samples, -1)
+
+
+# the scattering instance of a worker process of the process pool
+_worker_scattering = None
+
+
+def _init_worker(scattering):
+    global _worker_scattering
+    _worker_scattering = scattering
+
+
+def _transform_worker_chunk(x):
+    return _transform_chunk(_worker_scattering, x)
+
+
 class ScatteringTransformerMixin(BaseEstimator, TransformerMixin):
+    def _init_parallel(self, n_jobs=None, memory_budget=MEMORY_BUDGET, prefer='threads'):
+        """Sets the parameters of the parallel transform (see `predict`)."""
+        if prefer not in ('threads', 'processes'):
+            raise ValueError("prefer must be 'threads' or 'processes'.")
+        self.n_jobs = n_jobs
+        self.memory_budget = memory_budget
+        self.prefer = prefer
+
     def fit(self, x=None, y=None):
         # No fitting necessary.
         return self
 
-    def predict(self, x):
+    def _effective_n_jobs(self):
+        n_jobs = getattr(self, 'n_jobs', None)
+        if n_jobs is None:
+            return 1
+        if n_jobs < 0:
+            return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+        return max(1, n_jobs)
+
+    def predict(self, x, out=None):
+        """Scattering of the samples of `x`, as an (n_samples, n_features)
+            array.
+
+            The samples are transformed in chunks sized so that the chunks
+            processed at once fit in `memory_budget` bytes, by `n_jobs`
+            workers (threads or processes, see `prefer`), each holding its own
+            copy of the transform. The chunks are written into `out`: a
+            preallocated array (e.g. a `np.memmap`), the path of a `.npy` file
+            to create as a memory-mapped array, or None to allocate the output
+            in memory.
+        """
         n_samples = x.shape[0]
-        x = x.reshape((-1,) + self.shape)
-        Sx = self.scattering(x)
-        Sx = Sx.reshape(n_samples, -1)
+        if n_samples == 0:
+            raise ValueError('The input should contain at least one sample.')
+
+        # the first sample gives the size of the output
+        first = _transform_chunk(self, x[:1])
+        shape = (n_samples, first.shape[1])
+        if out is None:
+            out = np.empty(shape, first.dtype)
+        elif isinstance(out, str):
+            out = np.lib.format.open_memmap(out, mode='w+', dtype=first.dtype, shape=shape)
+        elif out.shape != shape:
+            raise ValueError('The output should be of shape %s.' % (shape,))
+        out[:1] = first
+
+        n_jobs = self._effective_n_jobs()
+        sample_bytes = _MEMORY_FACTOR * (x[:1].nbytes + first.nbytes)
+        chunk_size = max(1, int(getattr(self, 'memory_budget', MEMORY_BUDGET)
+                                // (sample_bytes * n_jobs)))
+        chunks = [(start, min(start + chunk_size, n_samples))
+                  for start in range(1, n_samples, chunk_size)]
 
-        return Sx
+        if n_jobs == 1 or len(chunks) <= 1:
+            for start, end in chunks:
+                out[start:end] = _transform_chunk(self, x[start:end])
+        elif getattr(self, 'prefer', 'threads') == 'threads':
+            local = threading.local()
+
+            def transform(start, end):
+                if not hasattr(local, 'scattering'):
+                    local.scattering = copy.deepcopy(self)
+                out[start:end] = _transform_chunk(local.scattering, x[start:end])
+
+            with ThreadPoolExecutor(n_jobs) as executor:
+                self._run_chunks(chunks, lambda start, end: executor.submit(transform, start, end),
+                                 n_jobs, lambda start, end, result: None)
+        else:
+            def write(start, end, result):
+                out[start:end] = result
+
+            with ProcessPoolExecutor(n_jobs, initializer=_init_worker, initargs=(self,)) as executor:
+                self._run_chunks(chunks,
+                                 lambda start, end: executor.submit(_transform_worker_chunk, x[start:end]),
+                                 n_jobs, write)
+
+        if isinstance(out, np.memmap):
+            out.flush()
+        return out
+
+    @staticmethod
+    def _run_chunks(chunks, submit, n_jobs, write):
+        # keep at most 2 chunks per worker in flight, so that only those are in memory
+        pending = deque()
+        for start, end in chunks:
+            if len(pending) >= 2 * n_jobs:
+                done_start, done_end, future = pending.popleft()
+                write(done_start, done_end, future.result())
+            pending.append((start, end, submit(start, end)))
+        while pending:
+            start, end, future = pending.popleft()
+            write(start, end, future.result())
 
     transform = predict
 
@@ -29,6 +147,11 @@ class ScatteringTransformerMixin(BaseEstimator, TransformerMixin):
         `sklearn.base`. As a result, it supports calculating the scattering
         transform by calling the `predict` and `transform` methods. By
         extension, it can be included as part of a scikit-learn `Pipeline`.
+
+        Large inputs are transformed in chunks that fit in `memory_budget`
+        bytes, in parallel over `n_jobs` threads or processes (`prefer`), and
+        can be written to a preallocated or memory-mapped output with the `out`
+        argument of `transform`.
         """
 
     _doc_sample = 'np.random.randn(np.prod({shape}))'
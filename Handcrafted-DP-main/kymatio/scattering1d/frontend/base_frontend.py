@@ -1,4 +1,5 @@
 from ...frontend.base_frontend import ScatteringBase
+from ...caching import cached_filter_bank
 import math
 import numbers
 
@@ -70,8 +71,8 @@ class ScatteringBase1D(ScatteringBase):
 
     def create_filters(self):
         # Create the filters
-        self.phi_f, self.psi1_f, self.psi2_f, _ = scattering_filter_factory(
-            self.J_pad, self.J, self.Q, normalize=self.normalize,
+        self.phi_f, self.psi1_f, self.psi2_f, _ = cached_filter_bank(
+            scattering_filter_factory, self.J_pad, self.J, self.Q, normalize=self.normalize,
             criterion_amplitude=self.criterion_amplitude,
             r_psi=self.r_psi, sigma0=self.sigma0, alpha=self.alpha,
             P_max=self.P_max, eps=self.eps)
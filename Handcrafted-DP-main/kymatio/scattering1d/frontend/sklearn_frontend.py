@@ -1,11 +1,16 @@
-from ...frontend.sklearn_frontend import ScatteringTransformerMixin
+from ...frontend.sklearn_frontend import ScatteringTransformerMixin, MEMORY_BUDGET
 from ...numpy import Scattering1D as ScatteringNumPy1D
 
 
 # NOTE: Order in base classes matters here, since we want the sklearn-specific
 # documentation parameters to take precedence over NP.
 class ScatteringTransformer1D(ScatteringTransformerMixin, ScatteringNumPy1D):
-    pass
+    def __init__(self, J, shape, Q=1, max_order=2, average=True,
+            oversampling=0, vectorize=True, out_type='array', backend='numpy',
+            n_jobs=None, memory_budget=MEMORY_BUDGET, prefer='threads'):
+        ScatteringNumPy1D.__init__(self, J, shape, Q, max_order, average,
+                oversampling, vectorize, out_type, backend)
+        self._init_parallel(n_jobs, memory_budget, prefer)
 
 
 ScatteringTransformer1D._document()
@@ -1,6 +1,7 @@
 import numpy as np
 import math
 from .filter_bank import scattering_filter_factory, calibrate_scattering_filters
+from ..caching import cached_filter_bank
 
 def compute_border_indices(J, i0, i1):
     """
@@ -122,8 +123,8 @@ def compute_minimum_support_to_pad(T, J, Q, criterion_amplitude=1e-3,
         boundary error.
     """
     J_tentative = int(np.ceil(np.log2(T)))
-    _, _, _, t_max_phi = scattering_filter_factory(
-        J_tentative, J, Q, normalize=normalize, to_torch=False,
+    _, _, _, t_max_phi = cached_filter_bank(
+        scattering_filter_factory, J_tentative, J, Q, normalize=normalize, to_torch=False,
         max_subsampling=0, criterion_amplitude=criterion_amplitude,
         r_psi=r_psi, sigma0=sigma0, alpha=alpha, P_max=P_max, eps=eps)
     min_to_pad = 3 * t_max_phi
@@ -8,12 +8,12 @@ from packaging import version
 
 BACKEND_NAME = 'torch'
 
-from ...backend.torch_backend import _is_complex, cdgmm, type_checks, Modulus, concatenate
+from ...backend.torch_backend import _is_complex, _is_real, cdgmm, type_checks, Modulus, modulus, concatenate
 from ...backend.base_backend import FFT
 
 
 class Pad(object):
-    def __init__(self, pad_size, input_size):
+    def __init__(self, pad_size, input_size, real=False):
         """Padding which allows to simultaneously pad in a reflection fashion
             and map to complex.
 
@@ -23,9 +23,13 @@ class Pad(object):
                 Size of padding to apply [top, bottom, left, right].
             input_size : list of 2 integers
                 size of the original signal [height, width].
+            real : boolean, optional
+                If set to True, the padded signal is kept real (with a last
+                dimension of size 1) instead of being mapped to complex.
         """
         self.pad_size = pad_size
         self.input_size = input_size
+        self.real = real
 
         self.build()
 
@@ -63,7 +67,8 @@ class Pad(object):
             Returns
             -------
             output : tensor
-                Complex torch tensor that has been padded.
+                Complex (or real, see `real`) torch tensor that has been
+                padded.
 
         """
         batch_shape = x.shape[:-2]
@@ -78,8 +83,11 @@ class Pad(object):
         if self.pad_size[2] == self.input_size[1]:
             x = torch.cat([x[:, :, :, 1].unsqueeze(3), x, x[:, :, :, x.shape[3] - 2].unsqueeze(3)], 3)
 
-        output = x.new_zeros(x.shape + (2,))
-        output[..., 0] = x
+        if self.real:
+            output = x.reshape(x.shape + (1,))
+        else:
+            output = x.new_zeros(x.shape + (2,))
+            output[..., 0] = x
         output = output.reshape(batch_shape + output.shape[-3:])
         return output
 
@@ -142,6 +150,107 @@ class SubsampleFourier(object):
         out = out.reshape(batch_shape + out.shape[-3:])
         return out
 
+
+def cdgmm_filters(A, B):
+    """Complex pointwise multiplication with a stack of real filters.
+
+        Parameters
+        ----------
+        A : tensor
+            Complex tensor of size (..., M, N, 2).
+        B : tensor
+            Real tensor of size (K, M, N, 1), the stack of K filters.
+
+        Returns
+        -------
+        C : tensor
+            Output tensor of size (..., K, M, N, 2) such that:
+            C[..., k, m, n, :] = A[..., m, n, :] * B[k, m, n, :].
+
+    """
+    type_checks(A)
+
+    if not _is_real(B) or B.dim() != 4:
+        raise TypeError('The filters should be a stack of real filters (K, M, N, 1).')
+
+    if A.shape[-3:-1] != B.shape[-3:-1]:
+        raise RuntimeError('The filters are not compatible for multiplication.')
+
+    if A.dtype is not B.dtype:
+        raise TypeError('Input and filter must be of the same dtype.')
+
+    if A.device != B.device:
+        raise TypeError('Input and filter must be on the same device.')
+
+    C = torch.view_as_complex(A).unsqueeze(-3) * B[..., 0]
+    return torch.view_as_real(C)
+
+
+def hermitian_extend(x_half, N):
+    """Full spectrum of a real signal from its half spectrum.
+
+        Parameters
+        ----------
+        x_half : tensor
+            Complex tensor of size (..., M, N // 2 + 1), the output of `rfft2`
+            on a real signal of size (..., M, N), N even.
+        N : int
+            Width of the signal.
+
+        Returns
+        -------
+        x : tensor
+            Complex tensor of size (..., M, N), the output of `fft2` on the
+            signal, using x[..., k1, k2] = conj(x[..., -k1, -k2]).
+
+    """
+    tail = x_half[..., 1:N // 2].flip((-2, -1)).roll(1, -2).conj()
+    return torch.cat([x_half, tail], -1)
+
+
+def rfft(x):
+    """FFT of a real signal (last dimension 1), with half the work of a
+        complex FFT, returned as a full complex spectrum."""
+    N = x.shape[-2]
+    return torch.view_as_real(hermitian_extend(torch.fft.rfft2(x[..., 0]), N))
+
+
+def irfft(x):
+    """Real part of the inverse FFT of a complex spectrum, computed on the
+        half spectrum. This is exact when the spectrum is hermitian, i.e.
+        for the low-pass filtered spectra of the real signals of the
+        scattering transform."""
+    N = x.shape[-2]
+    x = torch.view_as_complex(x)[..., :N // 2 + 1]
+    return torch.fft.irfft2(x, s=x.shape[-2:-1] + (N,))
+
+
+class RealFFT(FFT):
+    """FFT of the real-input mode: forward FFTs of real signals (last
+        dimension 1) use `rfft`, and inverse C2R FFTs use `irfft`."""
+    def fft_forward(self, x, direction='C2C', inverse=False):
+        if _is_real(x) and direction == 'C2C' and not inverse:
+            if not x.is_contiguous():
+                raise RuntimeError('Tensors must be contiguous.')
+            return rfft(x)
+        return super(RealFFT, self).fft_forward(x, direction=direction, inverse=inverse)
+
+
+class RealModulus(object):
+    """Complex modulus of the real-input mode, returned as a real tensor
+        (with a last dimension of size 1) rather than as a complex tensor
+        with zero imaginary part."""
+    def __call__(self, x):
+        type_checks(x)
+
+        return modulus(x).unsqueeze(-1)
+
+
+class RealPad(Pad):
+    """Padding of the real-input mode, see `Pad`."""
+    def __init__(self, pad_size, input_size):
+        super(RealPad, self).__init__(pad_size, input_size, real=True)
+
 if version.parse(torch.__version__) >= version.parse('1.8'):
     fft = FFT(lambda x: torch.view_as_real(torch.fft.fft2(torch.view_as_complex(x))),
           lambda x: torch.view_as_real(torch.fft.ifft2(torch.view_as_complex(x))),
@@ -153,13 +262,139 @@ else:
               lambda x: torch.irfft(x, 2, normalized=False, onesided=False),
               type_checks)
 
-backend = namedtuple('backend', ['name', 'cdgmm', 'modulus', 'subsample_fourier', 'fft', 'Pad', 'unpad', 'concatenate'])
+backend = namedtuple('backend', ['name', 'cdgmm', 'cdgmm_filters', 'modulus', 'subsample_fourier', 'fft', 'Pad', 'unpad',
+                                 'concatenate', 'concatenate_paths'])
 backend.name = 'torch'
 backend.version = torch.__version__
 backend.cdgmm = cdgmm
+backend.cdgmm_filters = cdgmm_filters
 backend.modulus = Modulus()
 backend.subsample_fourier = SubsampleFourier()
 backend.fft = fft
 backend.Pad = Pad
 backend.unpad = unpad
 backend.concatenate = lambda x: concatenate(x, -3)
+backend.concatenate_paths = lambda x: torch.cat(x, -3)
+
+# Real-input mode: the signals are real images, so the input and the moduli
+# are kept real and their FFTs computed with rfft2 (half the work and memory),
+# and the low-pass outputs (real) with irfft2 on half spectra. The coefficients
+# are the same as with `backend` up to floating-point rounding.
+real_backend = namedtuple('backend', ['name', 'cdgmm', 'cdgmm_filters', 'modulus', 'subsample_fourier', 'fft', 'Pad',
+                                      'unpad', 'concatenate', 'concatenate_paths'])
+real_backend.name = 'torch'
+real_backend.version = torch.__version__
+real_backend.cdgmm = cdgmm
+real_backend.cdgmm_filters = cdgmm_filters
+real_backend.modulus = RealModulus()
+real_backend.subsample_fourier = SubsampleFourier()
+real_backend.fft = RealFFT(fft.fft, fft.ifft, irfft, type_checks)
+real_backend.Pad = RealPad
+real_backend.unpad = unpad
+real_backend.concatenate = backend.concatenate
+real_backend.concatenate_paths = backend.concatenate_paths
+
+
+# Native complex mode: the spectra are complex tensors (e.g. complex64) rather
+# than real tensors with a last dimension of size 2, so the FFTs run without
+# `view_as_real` round-trips and the modulus is `abs`. The filters keep their
+# (M, N, 1) layout. With a `storage_dtype` (float16 or bfloat16), the moduli
+# are stored in that dtype between the stages (and the frontend stores the
+# filters in it), while the FFTs still run in single precision.
+class ComplexPad(Pad):
+    """Padding of the native complex mode: the padded signal stays real, of
+        size (..., M, N)."""
+    def __init__(self, pad_size, input_size):
+        super(ComplexPad, self).__init__(pad_size, input_size, real=True)
+
+    def __call__(self, x):
+        return super(ComplexPad, self).__call__(x)[..., 0]
+
+
+def complex_cdgmm(A, B):
+    """Pointwise multiplication of a complex tensor A of size (..., M, N) with
+        a real filter B of size (M, N, 1)."""
+    if not A.is_complex():
+        raise TypeError('The input should be complex.')
+
+    if A.shape[-2:] != B.shape[-3:-1]:
+        raise RuntimeError('The filters are not compatible for multiplication.')
+
+    return A * B[..., 0]
+
+
+def complex_cdgmm_filters(A, B):
+    """Pointwise multiplication of a complex tensor A of size (..., M, N) with
+        a stack of real filters B of size (K, M, N, 1), of size
+        (..., K, M, N)."""
+    if not A.is_complex():
+        raise TypeError('The input should be complex.')
+
+    if A.shape[-2:] != B.shape[-3:-1]:
+        raise RuntimeError('The filters are not compatible for multiplication.')
+
+    return A.unsqueeze(-3) * B[..., 0]
+
+
+def complex_subsample_fourier(x, k):
+    """Subsampling of `SubsampleFourier` for complex tensors of size
+        (..., M, N)."""
+    if not x.is_complex():
+        raise TypeError('The x should be complex.')
+
+    batch_shape = x.shape[:-2]
+    y = x.reshape((-1, k, x.shape[-2] // k, k, x.shape[-1] // k))
+    out = y.mean(3, keepdim=False).mean(1, keepdim=False)
+    return out.reshape(batch_shape + out.shape[-2:])
+
+
+class ComplexFFT(object):
+    """FFTs of the native complex mode. Real inputs (the padded signal and
+        the moduli) are promoted to single precision first."""
+    def __call__(self, x, direction='C2C', inverse=False):
+        if direction == 'C2R':
+            if not inverse:
+                raise RuntimeError('C2R mode can only be done with an inverse FFT.')
+            return torch.fft.ifft2(x).real
+
+        if not x.is_complex() and x.dtype in (torch.float16, torch.bfloat16):
+            x = x.float()
+
+        if inverse:
+            return torch.fft.ifft2(x)
+        return torch.fft.fft2(x)
+
+
+class ComplexModulus(object):
+    """Modulus of the native complex mode, stored in `storage_dtype` if
+        given."""
+    def __init__(self, storage_dtype=None):
+        self.storage_dtype = storage_dtype
+
+    def __call__(self, x):
+        if not x.is_complex():
+            raise TypeError('The input should be complex.')
+
+        x = x.abs()
+        if self.storage_dtype is not None:
+            x = x.to(self.storage_dtype)
+        return x
+
+
+def complex_backend(storage_dtype=None):
+    """Backend of the native complex mode, see above."""
+    backend = namedtuple('backend', ['name', 'cdgmm', 'cdgmm_filters', 'modulus', 'subsample_fourier', 'fft',
+                                     'Pad', 'unpad', 'concatenate', 'concatenate_paths', 'storage_dtype'])
+    backend.name = 'torch'
+    backend.version = torch.__version__
+    backend.cdgmm = complex_cdgmm
+    backend.cdgmm_filters = complex_cdgmm_filters
+    backend.modulus = ComplexModulus(storage_dtype)
+    backend.subsample_fourier = complex_subsample_fourier
+    backend.fft = ComplexFFT()
+    backend.Pad = ComplexPad
+    backend.unpad = unpad
+    backend.concatenate = lambda x: concatenate(x, -3)
+    backend.concatenate_paths = lambda x: torch.cat(x, -3)
+    backend.storage_dtype = storage_dtype
+    return backend
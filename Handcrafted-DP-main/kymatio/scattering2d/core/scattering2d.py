@@ -86,4 +86,101 @@ def scattering2d(x, pad, unpad, backend, J, L, phi, psi, max_order,
     return out_S
 
 
-__all__ = ['scattering2d']
+def scattering2d_batched(x, pad, unpad, backend, J, L, phi, psi, psi_stacks,
+        max_order, out_type='array'):
+    """Batched version of `scattering2d`.
+
+        Instead of filtering the signal with one wavelet at a time, all the
+        wavelets of a scale are applied at once: `psi_stacks[(j, res)]` stacks
+        the `L` filters of scale `j` at resolution `res` along a new leading
+        dimension, and `backend.cdgmm_filters` multiplies a signal with the
+        whole stack by broadcasting. The first-order paths are thus computed
+        in one pass per `j1` and the second-order paths in one pass per
+        `(j1, j2)`, with the same operations (and coefficients) as
+        `scattering2d`, returned in the same order.
+
+        The second-order passes hold `L * L` padded signals per input signal,
+        which bounds the batch size that fits in memory.
+    """
+    subsample_fourier = backend.subsample_fourier
+    modulus = backend.modulus
+    fft = backend.fft
+    cdgmm = backend.cdgmm
+    cdgmm_filters = backend.cdgmm_filters
+    concatenate_paths = backend.concatenate_paths
+
+    U_r = pad(x)
+
+    U_0_c = fft(U_r, 'C2C')
+
+    # First low pass filter
+    U_1_c = cdgmm(U_0_c, phi[0])
+    U_1_c = subsample_fourier(U_1_c, k=2 ** J)
+
+    S_0 = fft(U_1_c, 'C2R', inverse=True)
+    S_0 = unpad(S_0)
+
+    # (..., paths, M, N) blocks of coefficients
+    out_S_0 = [S_0.reshape(S_0.shape[:-2] + (1,) + S_0.shape[-2:])]
+    out_S_1, out_S_2 = [], []
+
+    for j1 in range(J):
+        # (..., L, M, N, 2)
+        U_1_c = cdgmm_filters(U_0_c, psi_stacks[(j1, 0)])
+        if j1 > 0:
+            U_1_c = subsample_fourier(U_1_c, k=2 ** j1)
+        U_1_c = fft(U_1_c, 'C2C', inverse=True)
+        U_1_c = modulus(U_1_c)
+        U_1_c = fft(U_1_c, 'C2C')
+
+        # Second low pass filter
+        S_1_c = cdgmm(U_1_c, phi[j1])
+        S_1_c = subsample_fourier(S_1_c, k=2 ** (J - j1))
+
+        S_1_r = fft(S_1_c, 'C2R', inverse=True)
+        S_1_r = unpad(S_1_r)
+
+        out_S_1.append(S_1_r)
+
+        if max_order < 2 or j1 == J - 1:
+            continue
+
+        S_2_j1 = []
+        for j2 in range(j1 + 1, J):
+            # (..., L, L, M, N, 2)
+            U_2_c = cdgmm_filters(U_1_c, psi_stacks[(j2, j1)])
+            U_2_c = subsample_fourier(U_2_c, k=2 ** (j2 - j1))
+            U_2_c = fft(U_2_c, 'C2C', inverse=True)
+            U_2_c = modulus(U_2_c)
+            U_2_c = fft(U_2_c, 'C2C')
+
+            # Third low pass filter
+            S_2_c = cdgmm(U_2_c, phi[j2])
+            S_2_c = subsample_fourier(S_2_c, k=2 ** (J - j2))
+
+            S_2_r = fft(S_2_c, 'C2R', inverse=True)
+            S_2_r = unpad(S_2_r)
+
+            S_2_j1.append(S_2_r)
+
+        # order the paths by theta1, then j2 and theta2, as in `scattering2d`
+        S_2_r = concatenate_paths(S_2_j1)
+        S_2_r = S_2_r.reshape(S_2_r.shape[:-4] + (-1,) + S_2_r.shape[-2:])
+        out_S_2.append(S_2_r)
+
+    S = concatenate_paths(out_S_0 + out_S_1 + out_S_2)
+
+    if out_type == 'array':
+        return S
+
+    paths = [((), ())]
+    paths.extend(((p['j'],), (p['theta'],)) for p in psi)
+    if max_order >= 2:
+        paths.extend(((p1['j'], p2['j']), (p1['theta'], p2['theta']))
+                     for p1 in psi for p2 in psi if p2['j'] > p1['j'])
+
+    return [{'coef': S[..., n, :, :], 'j': j, 'theta': theta}
+            for n, (j, theta) in enumerate(paths)]
+
+
+__all__ = ['scattering2d', 'scattering2d_batched']
@@ -1,4 +1,5 @@
 from ...frontend.base_frontend import ScatteringBase
+from ...caching import cached_filter_bank
 
 from ..filter_bank import filter_bank
 from ..utils import compute_padding
@@ -32,7 +33,7 @@ class ScatteringBase2D(ScatteringBase):
         self.unpad = self.backend.unpad
 
     def create_filters(self):
-        filters = filter_bank(self.M_padded, self.N_padded, self.J, self.L)
+        filters = cached_filter_bank(filter_bank, self.M_padded, self.N_padded, self.J, self.L)
         self.phi, self.psi = filters['phi'], filters['psi']
 
     _doc_shape = 'M, N'
@@ -1,11 +1,16 @@
-from ...frontend.sklearn_frontend import ScatteringTransformerMixin
+from ...frontend.sklearn_frontend import ScatteringTransformerMixin, MEMORY_BUDGET
 from ...numpy import Scattering2D as ScatteringNumPy2D
 
 
 # NOTE: Order in base classes matters here, since we want the sklearn-specific
 # documentation parameters to take precedence over NP.
 class ScatteringTransformer2D(ScatteringTransformerMixin, ScatteringNumPy2D):
-    pass
+    def __init__(self, J, shape, L=8, max_order=2, pre_pad=False,
+            backend='numpy', out_type='array', n_jobs=None,
+            memory_budget=MEMORY_BUDGET, prefer='threads'):
+        ScatteringNumPy2D.__init__(self, J, shape, L, max_order, pre_pad,
+                backend, out_type)
+        self._init_parallel(n_jobs, memory_budget, prefer)
 
 
 ScatteringTransformer2D._document()
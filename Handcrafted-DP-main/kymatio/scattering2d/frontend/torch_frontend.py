@@ -1,24 +1,65 @@
 import torch
 
 from .base_frontend import ScatteringBase2D
-from ...scattering2d.core.scattering2d import scattering2d
+from ...scattering2d.core.scattering2d import scattering2d, scattering2d_batched
 from ...frontend.torch_frontend import ScatteringTorch
 
 
+# the storage dtype of the filters and moduli of each precision (None: single precision)
+PRECISIONS = {
+    'float32': None,
+    'complex64': None,
+    'float16': torch.float16,
+    'bfloat16': torch.bfloat16,
+}
+
+
 class ScatteringTorch2D(ScatteringTorch, ScatteringBase2D):
     def __init__(self, J, shape, L=8, max_order=2, pre_pad=False,
-            backend='torch', out_type='array'):
+            backend='torch', out_type='array', batched=False, real_input=False,
+            precision='float32'):
         ScatteringTorch.__init__(self)
-        ScatteringBase2D.__init__(**locals())
+        if precision not in PRECISIONS:
+            raise ValueError('The precision must be one of %s.' % ', '.join(PRECISIONS))
+        if precision != 'float32':
+            # native complex tensors, with the filters and moduli stored in
+            # half precision for 'float16' and 'bfloat16'
+            if real_input:
+                raise RuntimeError('The real-input mode and the %s precision are mutually '
+                                   'exclusive.' % precision)
+            if backend != 'torch':
+                raise RuntimeError('The %s precision is only supported by the torch backend.'
+                                   % precision)
+            from ..backend.torch_backend import complex_backend
+            backend = complex_backend(PRECISIONS[precision])
+        if real_input:
+            # real images: keep the signals real and use real FFTs
+            if backend != 'torch':
+                raise RuntimeError('The real-input mode is only supported by the torch backend.')
+            from ..backend.torch_backend import real_backend
+            backend = real_backend
+        ScatteringBase2D.__init__(self, J, shape, L, max_order, pre_pad,
+                                  backend, out_type)
+        self.batched = batched
+        self.real_input = real_input
+        self.precision = precision
         ScatteringBase2D._instantiate_backend(self, 'kymatio.scattering2d.backend.')
         ScatteringBase2D.build(self)
         ScatteringBase2D.create_filters(self)
 
         if pre_pad:
-            # Need to cast to complex in Torch
+            # Need to cast to complex in Torch (the real-input mode takes it as real)
             self.pad = lambda x: x.reshape(x.shape + (1,))
 
         self.register_filters()
+        if batched:
+            if not hasattr(self.backend, 'cdgmm_filters'):
+                raise RuntimeError('The batched scattering is not supported by the %s backend.'
+                                   % self.backend.name)
+            self.register_filter_stacks()
+        if PRECISIONS[precision] is not None:
+            for name, buf in self.named_buffers():
+                self._buffers[name] = buf.to(PRECISIONS[precision])
 
     def register_single_filter(self, v, n):
         current_filter = torch.from_numpy(v).unsqueeze(-1)
@@ -48,6 +89,24 @@ class ScatteringTorch2D(ScatteringTorch, ScatteringBase2D):
                 self.psi[j][k] = self.register_single_filter(v, n)
                 n = n + 1
 
+    def register_filter_stacks(self):
+        """ For the batched scattering, stacks the wavelets of every scale j
+            at every resolution res into a (L, M, N, 1) buffer, in order of
+            theta. """
+        self.psi_stack_keys = []
+        for j in range(self.J):
+            psis = [psi for psi in self.psi if psi['j'] == j]
+            for res in range(j + 1):
+                if res not in psis[0]:
+                    continue
+                stack = torch.stack([psi[res] for psi in psis])
+                self.register_buffer('psi_stack_%i_%i' % (j, res), stack, persistent=False)
+                self.psi_stack_keys.append((j, res))
+
+    def load_filter_stacks(self):
+        return {(j, res): getattr(self, 'psi_stack_%i_%i' % (j, res))
+                for j, res in self.psi_stack_keys}
+
     def load_single_filter(self, n, buffer_dict):
         return buffer_dict['tensor' + str(n)]
 
@@ -104,8 +163,13 @@ class ScatteringTorch2D(ScatteringTorch, ScatteringBase2D):
 
         input = input.reshape((-1,) + signal_shape)
 
-        S = scattering2d(input, self.pad, self.unpad, self.backend, self.J,
-                            self.L, phi, psi, self.max_order, self.out_type)
+        if self.batched:
+            S = scattering2d_batched(input, self.pad, self.unpad, self.backend, self.J,
+                                     self.L, phi, psi, self.load_filter_stacks(),
+                                     self.max_order, self.out_type)
+        else:
+            S = scattering2d(input, self.pad, self.unpad, self.backend, self.J,
+                                self.L, phi, psi, self.max_order, self.out_type)
 
         if self.out_type == 'array':
             scattering_shape = S.shape[-3:]
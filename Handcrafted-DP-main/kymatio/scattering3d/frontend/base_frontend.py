@@ -1,4 +1,5 @@
 from ...frontend.base_frontend import ScatteringBase
+from ...caching import cached_filter_bank
 from ..filter_bank import solid_harmonic_filter_bank, gaussian_filter_bank
 
 
@@ -23,11 +24,11 @@ class ScatteringBase3D(ScatteringBase):
         self.M, self.N, self.O = self.shape
 
     def create_filters(self):
-        self.filters = solid_harmonic_filter_bank(
-            self.M, self.N, self.O, self.J, self.L, self.sigma_0)
+        self.filters = cached_filter_bank(
+            solid_harmonic_filter_bank, self.M, self.N, self.O, self.J, self.L, self.sigma_0)
 
-        self.gaussian_filters = gaussian_filter_bank(
-            self.M, self.N, self.O, self.J + 1, self.sigma_0)
+        self.gaussian_filters = cached_filter_bank(
+            gaussian_filter_bank, self.M, self.N, self.O, self.J + 1, self.sigma_0)
 
     _doc_shape = 'M, N, O'
 
@@ -1,4 +1,4 @@
-from ...frontend.sklearn_frontend import ScatteringTransformerMixin
+from ...frontend.sklearn_frontend import ScatteringTransformerMixin, MEMORY_BUDGET
 from ...numpy import HarmonicScattering3D as HarmonicScatteringNumPy3D
 
 
@@ -6,7 +6,12 @@ from ...numpy import HarmonicScattering3D as HarmonicScatteringNumPy3D
 # documentation parameters to take precedence over NP.
 class HarmonicScatteringTransformer3D(ScatteringTransformerMixin,
                                       HarmonicScatteringNumPy3D):
-    pass
+    def __init__(self, J, shape, L=3, sigma_0=1, max_order=2, rotation_covariant=True, method='integral', points=None,
+                 integral_powers=(0.5, 1., 2.), backend='numpy', n_jobs=None,
+                 memory_budget=MEMORY_BUDGET, prefer='threads'):
+        HarmonicScatteringNumPy3D.__init__(self, J, shape, L, sigma_0, max_order,
+                rotation_covariant, method, points, integral_powers, backend)
+        self._init_parallel(n_jobs, memory_budget, prefer)
 
 
 HarmonicScatteringTransformer3D._document()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+r"""
+Per-layer choice of the per-sample gradient norm strategy used by ghost clipping.
+
+A ghost sampler can get the per-sample gradient norms of its layer in two ways:
+
+* ``ghost``: from Gram matrices of the activations and backprops, whose size per
+  sample grows with the square of the number of positions ``T`` (sequence
+  length, or output pixels of a convolution).
+* ``materialize``: by building the per-sample gradients of the layer, taking
+  their norms and dropping them right away, at a size per sample equal to
+  the size of the weight.
+
+Either way, only the norms are kept and the clipped sum is computed later from
+the activations and backprops. The cheaper strategy differs from layer to
+layer (e.g. the first convolutions of a CIFAR-10 ResNet work on 32x32 maps,
+where ``T ** 2`` is much larger than the weight, while for the last ones it is
+the opposite), so ``GradSampleModule`` plans every layer on its first batch and
+records the decision in ``GradSampleModule.norm_plan``.
+"""
+
+from typing import Callable, NamedTuple, Tuple
+
+import torch
+import torch.nn as nn
+
+
+GHOST = "ghost"
+MATERIALIZE = "materialize"
+
+
+class LayerNormPlan(NamedTuple):
+    r"""
+    Per-sample gradient norm strategy of a layer, with the costs it was chosen from
+    (the per-sample number of elements of the intermediate tensor of each strategy).
+    """
+    strategy: str
+    ghost_cost: int
+    materialize_cost: int
+
+
+def plan_layer(
+    costs_fn: Callable[[nn.Module, torch.Tensor, torch.Tensor], Tuple[int, int]],
+    layer: nn.Module,
+    A: torch.Tensor,
+    B: torch.Tensor,
+) -> LayerNormPlan:
+    r"""
+    Picks the cheaper per-sample gradient norm strategy for ``layer``.
+
+    Args:
+        costs_fn: Function returning the ``(ghost, materialize)`` costs of the layer
+        layer: Layer
+        A: Activations
+        B: Backpropagations
+
+    Returns:
+        The plan of the layer
+    """
+    ghost_cost, materialize_cost = costs_fn(layer, A, B)
+    strategy = GHOST if ghost_cost <= materialize_cost else MATERIALIZE
+    return LayerNormPlan(strategy, ghost_cost, materialize_cost)
@@ -31,7 +31,7 @@ Notes:
     the stored grad_sample.
 """
 
-from typing import Callable, Iterator, Optional, Tuple
+from typing import Callable, Iterator, Optional, Sequence, Tuple, Union
 
 import torch
 import numpy
@@ -39,7 +39,7 @@ from opacus.grad_sample import GradSampleModule
 from torch import nn
 
 from .utils.clipping import NormClipper
-from .utils.tensor_utils import calc_sample_norms
+from .utils.tensor_utils import calc_sample_norms, mean_over_batch_groups
 
 
 class PerSampleGradientClipper:
@@ -54,6 +54,7 @@ class PerSampleGradientClipper:
         norm_clipper: NormClipper,
         batch_first: bool = True,
         loss_reduction: str = "mean",
+        group_size: Optional[Union[int, Sequence[int]]] = None,
     ):
         r"""
         Attaches to a module, and clips all grad_sample in the backward
@@ -76,11 +77,20 @@ class PerSampleGradientClipper:
 
             loss_reduction: Indicates if the loss reduction (for aggregating the gradients)
                 is a sum or a mean operation. Can take values ``sum`` or ``mean``
+
+            group_size: If set, BatchClipping is used: contiguous groups of samples
+                are averaged and the group means are clipped instead of the
+                per-sample gradients. Either the size of every group (the last
+                group of a batch may be smaller) or the list of group sizes of
+                every batch (see
+                :meth:`~opacus.utils.tensor_utils.mean_over_batch_groups`).
+                The batch size then counts groups.
         """
         self.module = module
         self.norm_clipper = norm_clipper
         self.batch_first = batch_first
         self.loss_reduction = loss_reduction
+        self.group_size = group_size
 
         self._reset_aggregated_state()
 
@@ -106,6 +116,7 @@ class PerSampleGradientClipper:
         """
         self._aggr_batch_size = 0
         self._aggr_thresh = torch.zeros(1)
+        self._flat_summed_grad = None
 
     def _get_aggregated_state(self) -> Tuple[torch.Tensor, int]:
         r"""
@@ -137,10 +148,19 @@ class PerSampleGradientClipper:
         threshs, batch_size = self._get_aggregated_state()
         # now that we know the full batch size, we can average the gradients
         n = 0
-        for _, p in self._named_params():
-            p.grad = self._scale_summed_grad(p.summed_grad, batch_size)
-            n += 1
-            del p.summed_grad
+        if self._flat_summed_grad is not None:
+            grads = self.module.flat_views(
+                self._scale_summed_grad(self._flat_summed_grad, batch_size)
+            )
+            for (_, p), grad in zip(self._named_params(), grads):
+                p.grad = grad
+                n += 1
+                del p.summed_grad
+        else:
+            for _, p in self._named_params():
+                p.grad = self._scale_summed_grad(p.summed_grad, batch_size)
+                n += 1
+                del p.summed_grad
 
         # NOTE: For Renyi-based epsilon calculation, we will calculate a flat
         # max norm equal to the norm of all clip values per layer.
@@ -156,6 +176,23 @@ class PerSampleGradientClipper:
         will populate the ``.grad`` field with the average gradient over the entire batch of size
         ``(N-1)* B + b`` with ``b <= B``.
         """
+        flat_grad_sample = self._flat_grad_sample()
+        if flat_grad_sample is not None:
+            self._clip_and_accumulate_flat(flat_grad_sample)
+            return
+
+        if self.group_size is not None:
+            # BatchClipping: the group means take the place of the per-sample gradients
+            for _, p in self._named_params():
+                if hasattr(p, "grad_sample_norm"):
+                    raise ValueError(
+                        "BatchClipping (group_size) is not supported with ghost clipping"
+                    )
+                if hasattr(p, "grad_sample"):
+                    p.grad_sample = mean_over_batch_groups(
+                        p.grad_sample, self.group_size
+                    )
+
         # step 0 : calculate the layer norms
         all_norms = calc_sample_norms(
             named_params=self._named_grad_samples(),
@@ -175,12 +212,30 @@ class PerSampleGradientClipper:
         # The size for every param.grad_sample is the batch size
         self._aggr_batch_size += batch_size
 
+        named_params = list(self._named_params())
+        clipping_factor = [
+            clip_factor for clip_factor, _ in zip(clipping_factor, named_params)
+        ]
+        # parameters clipped with ghost clipping only have per-sample norms, their
+        # clipped sums are computed from the activations and backprops of the layers
+        ghost_factors = {
+            p: clip_factor
+            for clip_factor, (_, p) in zip(clipping_factor, named_params)
+            if hasattr(p, "grad_sample_norm")
+        }
+        ghost_sums = (
+            self.module.ghost_weighted_sums(ghost_factors) if ghost_factors else {}
+        )
+
         for i, (clip_factor, named_param) in enumerate(
-            zip(clipping_factor, self._named_params())
+            zip(clipping_factor, named_params)
         ):
             # Do the clipping
             name, p = named_param
-            summed_grad = self._weighted_sum(clip_factor, p.grad_sample)
+            if p in ghost_sums:
+                summed_grad = ghost_sums[p]
+            else:
+                summed_grad = self._weighted_sum(clip_factor, p.grad_sample)
             clipping_thresh = self.norm_clipper.thresholds[
                 i if len(self.norm_clipper.thresholds) > 1 else 0
             ]
@@ -196,29 +251,109 @@ class PerSampleGradientClipper:
                 clip_factor,
                 clipping_thresh,
                 per_sample_norm,
-                p.grad_sample,
+                getattr(p, "grad_sample", None),
                 grad_before_clip=p.grad,
                 grad_after_clip=self._scale_summed_grad(summed_grad, batch_size),
             )
 
-            # remove the per-sample gradients
+            # remove the per-sample gradients (or their norms)
+            if hasattr(p, "grad_sample"):
+                del p.grad_sample
+            else:
+                del p.grad_sample_norm
+        self._on_batch_clip()  # inform analysis of the whole module
+
+    def _flat_grad_sample(self) -> Optional[torch.Tensor]:
+        r"""
+        Returns the per-sample gradients as one ``[B, P]`` matrix if they all live in
+        the flat buffer of the module (see
+        :meth:`~opacus.grad_sample.GradSampleModule.reserve_grad_sample`) and the
+        clipping is flat, and ``None`` otherwise.
+        """
+        flat = getattr(self.module, "grad_sample_flat", None)
+        if flat is None or self.norm_clipper.is_per_layer:
+            return None
+        params = [p for _, p in self._named_params()]
+        if len(params) != len(self.module.grad_sample_flat_params) or any(
+            p is not q for p, q in zip(params, self.module.grad_sample_flat_params)
+        ):
+            return None
+        if self._flat_summed_grad is None and any(
+            hasattr(p, "summed_grad") for p in params
+        ):
+            return None
+
+        batch_size = None
+        for p in params:
+            if (
+                not hasattr(p, "grad_sample")
+                or p.grad_sample.data_ptr() != p.grad_sample_arena.data_ptr()
+            ):
+                return None
+            if batch_size is None:
+                batch_size = p.grad_sample.shape[0]
+            elif p.grad_sample.shape[0] != batch_size:
+                return None
+        return flat[:batch_size]
+
+    def _clip_and_accumulate_flat(self, grad_sample: torch.Tensor) -> None:
+        r"""
+        ``clip_and_accumulate`` for per-sample gradients laid out as one ``[B, P]``
+        matrix: the norms take a single reduction and the clipped sum a single
+        ``clip_factor @ grad_sample`` product, and the parameters get views into it.
+        """
+        if self.group_size is not None:
+            grad_sample = mean_over_batch_groups(grad_sample, self.group_size)
+
+        norms = grad_sample.norm(2, dim=1)
+        clip_factor = next(iter(self.norm_clipper.calc_clipping_factors([norms])))
+        self._aggr_thresh = torch.max(self._aggr_thresh, self.norm_clipper.thresholds)
+        batch_size = grad_sample.shape[0]
+        self._aggr_batch_size += batch_size
+
+        summed_grad = clip_factor.to(grad_sample.dtype) @ grad_sample
+        if self._flat_summed_grad is None:
+            self._flat_summed_grad = summed_grad
+            for (_, p), view in zip(
+                self._named_params(), self.module.flat_views(summed_grad)
+            ):
+                p.summed_grad = view
+        else:
+            self._flat_summed_grad += summed_grad
+
+        if self.on_batch_clip_func:
+            clipping_thresh = self.norm_clipper.thresholds[0]
+            for (name, p), view in zip(
+                self._named_params(), self.module.flat_views(summed_grad)
+            ):
+                self._on_batch_clip(
+                    name,
+                    clip_factor,
+                    clipping_thresh,
+                    norms,
+                    p.grad_sample,
+                    grad_before_clip=p.grad,
+                    grad_after_clip=self._scale_summed_grad(view, batch_size),
+                )
+        for _, p in self._named_params():
             del p.grad_sample
         self._on_batch_clip()  # inform analysis of the whole module
 
     def zero_grad(self):
         """
-        Deletes the added attributes, ``grad_sample`` and ``summed_grad``.
+        Deletes the added attributes, ``grad_sample`` and ``summed_grad``, and the
+        activations and backprops kept by the module for ghost clipping.
 
-        The two mentioned attributes are
+        The mentioned attributes are
         automatically deleted when ``pre_step`` or
         ``clip_and_accumulate`` are properly called. This is a safety measure
         to avoid further issues if regular use has not been followed.
         """
+        self.module.del_grad_sample()
         for _, param in self._named_params():
-            if hasattr(param, "grad_sample"):
-                del param.grad_sample
             if hasattr(param, "summed_grad"):
                 del param.summed_grad
+        self._flat_summed_grad = None
 
     def _named_params(self) -> Iterator[Tuple[str, nn.Parameter]]:
         r"""
@@ -232,7 +367,8 @@ class PerSampleGradientClipper:
     def _named_grad_samples(self) -> Iterator[Tuple[str, torch.Tensor]]:
         r"""
         Helper function to get names and per-sample gradients for parameters
-        that required grad.
+        that required grad. Parameters clipped with ghost clipping give their
+        per-sample gradient norms instead.
 
         Returns:
             Iterator of parameter names and per-sample gradients
@@ -241,7 +377,9 @@ class PerSampleGradientClipper:
         no_grad_samples = [
             n
             for n, p in self.module.named_parameters()
-            if p.requires_grad and not hasattr(p, "grad_sample")
+            if p.requires_grad
+            and not hasattr(p, "grad_sample")
+            and not hasattr(p, "grad_sample_norm")
         ]
         if len(no_grad_samples) >= 1:
             raise AttributeError(
@@ -249,7 +387,7 @@ class PerSampleGradientClipper:
             )
 
         return (
-            (n, p.grad_sample)
+            (n, p.grad_sample if hasattr(p, "grad_sample") else p.grad_sample_norm)
             for n, p in self.module.named_parameters()
             if p.requires_grad
         )
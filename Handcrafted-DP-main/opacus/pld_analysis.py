@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+
+r"""
+Privacy loss distribution (PLD) accounting of an additive Sampled Gaussian
+Mechanism (SGM), based on:
+Antti Koskela et al. "Tight differential privacy for discrete-valued mechanisms
+and for the subsampled Gaussian mechanism using FFT." AISTATS 2021, and
+Sivakanth Gopi et al. "Numerical composition of differential privacy." NeurIPS 2021.
+
+The privacy loss of one step of the SGM is discretized once on a grid of spacing
+``value_discretization_interval``; the distribution of the privacy loss of
+``steps`` steps is then the ``steps``-fold convolution of the discretized
+distribution, computed with FFTs by repeated squaring (``O(log(steps))``
+convolutions). Under add/remove adjacency, the two directions (removing or adding
+an example) have different PLDs, which are composed separately; epsilon is the
+largest of the two.
+
+Unlike RDP, the (epsilon, delta) guarantee is read from the PLD without going
+through a conversion theorem. The discretization is pessimistic (see
+``_compute_sgm_pld``), so the epsilon of the discretized PLD is an upper bound
+on the true epsilon; unlike rounding the privacy loss of every step up to the
+grid, it does not drift away from it by one interval per composed step.
+
+Example:
+    Suppose that we have run an SGM applied to a function with L2-sensitivity of 1.
+
+    Its parameters are given as a list of tuples
+    ``[(q_1, sigma_1, steps_1), ..., (q_k, sigma_k, steps_k)],``
+    and we wish to compute epsilon for a given target delta.
+
+    The example code would be:
+
+    >>> plds = None
+    >>> for q, sigma, steps in parameters:
+    >>>     plds = pld_analysis.compose(plds, pld_analysis.compute_pld(q, sigma, steps))
+    >>> epsilon, _ = pld_analysis.get_privacy_spent(plds, delta)
+
+"""
+
+import math
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import numpy as np
+from scipy import signal, special
+
+
+DEFAULT_VALUE_DISCRETIZATION_INTERVAL = 1e-4
+DEFAULT_TAIL_MASS = 1e-15
+
+
+class PrivacyLossDistribution:
+    r"""
+    Discretized distribution of the privacy loss of a mechanism, in one direction
+    of adjacency.
+
+    The privacy loss takes the value ``(offset + i) * value_discretization_interval``
+    with probability ``pmf[i]``, and is infinite with probability ``infinity_mass``.
+    """
+
+    def __init__(
+        self,
+        pmf: np.ndarray,
+        offset: int,
+        value_discretization_interval: float,
+        infinity_mass: float = 0.0,
+        tail_mass: float = DEFAULT_TAIL_MASS,
+    ):
+        r"""
+        Args:
+            pmf: Probabilities of the finite values of the privacy loss
+            offset: Grid index of the first value of ``pmf``
+            value_discretization_interval: Spacing of the grid of privacy losses
+            infinity_mass: Probability that the privacy loss is infinite
+            tail_mass: Mass dropped from each tail of the distribution after a
+                composition
+        """
+        self.pmf = pmf
+        self.offset = offset
+        self.value_discretization_interval = value_discretization_interval
+        self.infinity_mass = infinity_mass
+        self.tail_mass = tail_mass
+        # self-compositions 2 ** k times, kept to answer growing numbers of steps
+        self._powers: List["PrivacyLossDistribution"] = [self]
+
+    @property
+    def losses(self) -> np.ndarray:
+        r"""
+        Finite values of the privacy loss, aligned with ``pmf``.
+        """
+        return (
+            np.arange(self.offset, self.offset + len(self.pmf))
+            * self.value_discretization_interval
+        )
+
+    def compose(self, other: "PrivacyLossDistribution") -> "PrivacyLossDistribution":
+        r"""
+        Returns the PLD of the composition of the mechanisms of ``self`` and ``other``.
+
+        The probabilities are convolved with an FFT. Tails lighter than
+        ``tail_mass`` are then cut: the upper one is added to the infinite privacy
+        loss and the lower one to the lowest kept value, which can only make the
+        guarantee looser.
+        """
+        if self.value_discretization_interval != other.value_discretization_interval:
+            raise ValueError(
+                "Cannot compose PLDs with different value discretization intervals."
+            )
+        pmf = np.maximum(signal.fftconvolve(self.pmf, other.pmf), 0)
+        offset = self.offset + other.offset
+        infinity_mass = 1 - (1 - self.infinity_mass) * (1 - other.infinity_mass)
+
+        lower = np.cumsum(pmf)
+        upper = np.cumsum(pmf[::-1])
+        start = int(np.searchsorted(lower, self.tail_mass, side="right"))
+        n_upper = int(np.searchsorted(upper, self.tail_mass, side="right"))
+        stop = len(pmf) - n_upper
+        if start < stop:
+            lower_mass = lower[start - 1] if start > 0 else 0.0
+            upper_mass = upper[n_upper - 1] if n_upper > 0 else 0.0
+            pmf = pmf[start:stop].copy()
+            pmf[0] += lower_mass
+            offset += start
+            infinity_mass += upper_mass
+
+        return PrivacyLossDistribution(
+            pmf,
+            offset,
+            self.value_discretization_interval,
+            min(infinity_mass, 1.0),
+            self.tail_mass,
+        )
+
+    def self_compose(self, count: int) -> "PrivacyLossDistribution":
+        r"""
+        Returns the PLD of ``count`` compositions of the mechanism, by repeated
+        squaring. The squares are kept, so that later calls with a larger
+        ``count`` only compose the missing powers.
+        """
+        if count < 1:
+            raise ValueError(f"count should be positive, got {count}")
+        result = None
+        k = 0
+        while count:
+            if k == len(self._powers):
+                self._powers.append(self._powers[-1].compose(self._powers[-1]))
+            if count & 1:
+                power = self._powers[k]
+                result = power if result is None else result.compose(power)
+            count >>= 1
+            k += 1
+        return result
+
+    def get_delta_for_epsilon(self, epsilon: float) -> float:
+        r"""
+        Returns the smallest delta for which the mechanism is (epsilon, delta)-DP
+        in this direction, i.e. ``E[max(0, 1 - exp(epsilon - L))]``.
+        """
+        losses = self.losses
+        above = losses > epsilon
+        return float(
+            self.infinity_mass
+            + np.sum(self.pmf[above] * -np.expm1(epsilon - losses[above]))
+        )
+
+    def get_epsilon_for_delta(self, delta: float) -> float:
+        r"""
+        Returns the smallest non-negative epsilon for which the mechanism is
+        (epsilon, delta)-DP in this direction.
+        """
+        if self.infinity_mass > delta:
+            return np.inf
+        losses = self.losses
+        # sums over the losses at or above every grid value
+        mass = np.cumsum(self.pmf[::-1])[::-1]
+        weighted = np.cumsum((self.pmf * np.exp(-losses))[::-1])[::-1]
+
+        # delta(losses[j]) only involves the losses above losses[j]
+        mass_above = np.append(mass[1:], 0.0)
+        weighted_above = np.append(weighted[1:], 0.0)
+        deltas = self.infinity_mass + mass_above - np.exp(losses) * weighted_above
+        j = int(np.argmax(deltas <= delta))
+        if deltas[j] > delta:
+            return np.inf
+        # delta(epsilon) = infinity_mass + mass[j] - exp(epsilon) * weighted[j]
+        # on [losses[j - 1], losses[j]]
+        excess = self.infinity_mass + mass[j] - delta
+        if excess <= 0:
+            return 0.0
+        epsilon = min(math.log(excess / weighted[j]), losses[j])
+        if j > 0:
+            epsilon = max(epsilon, losses[j - 1])
+        return max(float(epsilon), 0.0)
+
+
+def _log_ratio_threshold(q: float, sigma: float, losses: np.ndarray) -> np.ndarray:
+    r"""
+    Returns the point ``x`` at which the privacy loss
+    ``log(1 - q + q * exp((2x - 1) / (2 sigma^2)))`` of the SGM equals ``losses``
+    (``-inf`` for losses that it never reaches).
+    """
+    lowest = math.log1p(-q) if q < 1 else -np.inf
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = sigma ** 2 * (np.log(np.expm1(losses) + q) - math.log(q)) + 0.5
+    return np.where(losses > lowest, x, -np.inf)
+
+
+@lru_cache(maxsize=16)
+def _compute_sgm_pld(
+    q: float,
+    sigma: float,
+    remove: bool,
+    value_discretization_interval: float,
+    tail_mass: float,
+) -> PrivacyLossDistribution:
+    r"""
+    Discretizes the PLD of one step of the SGM in one direction of adjacency.
+
+    When removing an example, the privacy loss is
+    ``L(x) = log(1 - q + q * exp((2x - 1) / (2 sigma^2)))`` with ``x`` drawn from
+    ``(1 - q) N(0, sigma^2) + q N(1, sigma^2)``; when adding an example, it is
+    ``-L(x)`` with ``x`` drawn from ``N(0, sigma^2)``.
+
+    The PLD is discretized by "connecting the dots" (Doroshenko et al.,
+    "Connect the Dots: Tighter Discrete Approximations of Privacy Loss
+    Distributions", PETS 2022): the discrete PLD on the grid of spacing
+    ``value_discretization_interval`` has the exact ``delta(epsilon)`` of the
+    mechanism at every grid point, and interpolates it linearly in
+    ``exp(epsilon)`` in between. Since ``delta`` is convex in ``exp(epsilon)``,
+    the discrete PLD dominates the true one. The mass ``P`` of every interval is
+    split between its two edges in proportion to ``exp(L)`` under the
+    distribution ``Q`` of the other neighbour, rather than rounded to one edge,
+    so the discretization errors of the steps do not add up.
+    """
+    h = value_discretization_interval
+    if q == 0:
+        return PrivacyLossDistribution(np.ones(1), 0, h, 0.0, tail_mass)
+    # no privacy
+    if sigma == 0:
+        return PrivacyLossDistribution(np.zeros(1), 0, h, 1.0, tail_mass)
+
+    # range of the privacy loss, up to the tails
+    z = -special.ndtri(tail_mass / 2)
+    x = np.array([-z * sigma, 1 + z * sigma])
+    l_min, l_max = np.log(1 - q + q * np.exp((2 * x - 1) / (2 * sigma ** 2)))
+    if not remove:
+        l_min, l_max = -l_max, -l_min
+    offset = math.floor(l_min / h)
+    grid = np.arange(offset, math.ceil(l_max / h) + 1)
+    losses = grid * h
+
+    # P(L <= loss), P(L > loss) and the same under Q, at every grid point, where
+    # P is the distribution of the mechanism with the example when removing it
+    # (without it when adding it) and Q the other one
+    if remove:
+        x = _log_ratio_threshold(q, sigma, losses)
+        p_cdf = (1 - q) * special.ndtr(x / sigma) + q * special.ndtr((x - 1) / sigma)
+        p_sf = (1 - q) * special.ndtr(-x / sigma) + q * special.ndtr((1 - x) / sigma)
+        q_cdf, q_sf = special.ndtr(x / sigma), special.ndtr(-x / sigma)
+    else:
+        x = _log_ratio_threshold(q, sigma, -losses)
+        p_cdf, p_sf = special.ndtr(-x / sigma), special.ndtr(x / sigma)
+        q_cdf = (1 - q) * special.ndtr(-x / sigma) + q * special.ndtr((1 - x) / sigma)
+        q_sf = (1 - q) * special.ndtr(x / sigma) + q * special.ndtr((x - 1) / sigma)
+
+    def interval_mass(cdf, sf):
+        # differences of the cdf in the lower half, of the sf in the upper half
+        return np.maximum(np.where(cdf[1:] < 0.5, np.diff(cdf), -np.diff(sf)), 0)
+
+    p_mass, q_mass = interval_mass(p_cdf, p_sf), interval_mass(q_cdf, q_sf)
+    exp_losses = np.exp(losses)
+    # E_Q[(exp(L) - exp(lower edge)) / (exp(upper edge) - exp(lower edge))] over every
+    # interval (dP = exp(L) dQ), the share of the interval given to its upper edge
+    upper = np.clip(
+        (p_mass - exp_losses[:-1] * q_mass) / np.diff(exp_losses), 0, q_mass
+    )
+    pmf = np.zeros(len(grid))
+    pmf[1:] += exp_losses[1:] * upper
+    pmf[:-1] += exp_losses[:-1] * (q_mass - upper)
+    # the mass below the grid is put on its first point; above it, the part of the
+    # mass that the last point can account for is put there and the rest is infinite
+    pmf[0] += p_cdf[0]
+    pmf[-1] += exp_losses[-1] * q_sf[-1]
+    infinity_mass = max(float(p_sf[-1] - exp_losses[-1] * q_sf[-1]), 0.0)
+    return PrivacyLossDistribution(pmf, offset, h, infinity_mass, tail_mass)
+
+
+def compute_pld(
+    q: float,
+    noise_multiplier: float,
+    steps: int,
+    value_discretization_interval: float = DEFAULT_VALUE_DISCRETIZATION_INTERVAL,
+    tail_mass: float = DEFAULT_TAIL_MASS,
+) -> Tuple[PrivacyLossDistribution, PrivacyLossDistribution]:
+    r"""
+    Computes the PLDs of the Sampled Gaussian Mechanism (SGM) iterated ``steps``
+    times, for the two directions of adjacency.
+
+    The discretized PLD of one step is cached, together with its self-compositions,
+    so that querying the PLD again after more steps only costs the missing
+    compositions.
+
+    Args:
+        q: Sampling rate of SGM.
+        noise_multiplier: The ratio of the standard deviation of the
+            additive Gaussian noise to the L2-sensitivity of the function
+            to which it is added.
+        steps: The number of iterations of the mechanism.
+        value_discretization_interval: Spacing of the grid of privacy losses.
+        tail_mass: Mass dropped from each tail of the distributions.
+
+    Returns:
+        The PLDs when removing and when adding an example.
+
+    Raises:
+        ValueError
+            If ``noise_multiplier`` is negative.
+    """
+    if noise_multiplier < 0:
+        raise ValueError(f"noise_multiplier should be non-negative, got {noise_multiplier}")
+    return tuple(
+        _compute_sgm_pld(
+            float(q),
+            float(noise_multiplier),
+            remove,
+            value_discretization_interval,
+            tail_mass,
+        ).self_compose(int(steps))
+        for remove in (True, False)
+    )
+
+
+def compose(
+    plds: Optional[Tuple[PrivacyLossDistribution, ...]],
+    other: Tuple[PrivacyLossDistribution, ...],
+) -> Tuple[PrivacyLossDistribution, ...]:
+    r"""
+    Composes two pairs of PLDs returned by ``compute_pld``, direction by direction.
+    ``plds`` can be ``None``, for a mechanism without privacy loss.
+    """
+    if plds is None:
+        return other
+    return tuple(a.compose(b) for a, b in zip(plds, other))
+
+
+def get_privacy_spent(
+    plds: Tuple[PrivacyLossDistribution, ...], delta: float
+) -> Tuple[float, float]:
+    r"""
+    Computes epsilon for a target ``delta`` from the PLDs of a mechanism.
+
+    Args:
+        plds: The PLDs of the mechanism, for the two directions of adjacency.
+        delta: The target delta.
+
+    Returns:
+        Pair of epsilon and ``np.nan``; the second value stands for the optimal
+        order alpha of ``privacy_analysis.get_privacy_spent``, which PLD accounting
+        does not have.
+    """
+    eps = max(pld.get_epsilon_for_delta(delta) for pld in plds)
+    return eps, np.nan
@@ -198,7 +198,7 @@ def _compute_log_a(q: float, sigma: float, alpha: float) -> float:
         return _compute_log_a_for_frac_alpha(q, sigma, alpha)
 
 
-def _log_erfc(x: float) -> float:
+def _log_erfc(x: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
     r"""Computes :math:`log(erfc(x))` with high accuracy for large ``x``.
 
     Helper function used in computation of :math:`log(A_\alpha)`
@@ -240,6 +240,203 @@ def _compute_rdp(q: float, sigma: float, alpha: float) -> float:
     return _compute_log_a(q, sigma, alpha) / (alpha - 1)
 
 
+def _compute_log_a_for_int_alphas(
+    q: Union[float, np.ndarray], sigma: Union[float, np.ndarray], alphas: np.ndarray
+) -> np.ndarray:
+    r"""Computes :math:`log(A_\alpha)` for an array of integer ``alphas`` at once.
+
+    Vectorized counterpart of ``_compute_log_a_for_int_alpha``: the binomial
+    terms of all orders are laid out on an ``[order, i]`` grid (terms with
+    ``i > alpha`` are masked out) and summed in the log space.
+
+    Args:
+        q: Sampling rate of SGM; a scalar, or one rate per order.
+        sigma: The standard deviation of the additive Gaussian noise; a scalar,
+            or one per order.
+        alphas: Integer orders at which RDP is computed.
+
+    Returns:
+        :math:`log(A_\alpha)` for every order in ``alphas``.
+    """
+    q, sigma, alphas = (x[:, None] for x in np.broadcast_arrays(q, sigma, alphas))
+    i = np.arange(int(alphas.max()) + 1, dtype=float)[None, :]
+    with np.errstate(divide="ignore"):
+        log_coef = (
+            np.log(special.binom(alphas, i))
+            + i * np.log(q)
+            + (alphas - i) * np.log(1 - q)
+        )
+    s = np.where(i <= alphas, log_coef + (i * i - i) / (2 * (sigma ** 2)), -np.inf)
+    return special.logsumexp(s, axis=1)
+
+
+def _compute_log_a_for_frac_alphas(
+    q: Union[float, np.ndarray],
+    sigma: Union[float, np.ndarray],
+    alphas: np.ndarray,
+    block: int = 32,
+) -> np.ndarray:
+    r"""Computes :math:`log(A_\alpha)` for an array of fractional ``alphas`` at once.
+
+    Vectorized counterpart of ``_compute_log_a_for_frac_alpha``: the terms of the
+    erfc series are evaluated in blocks of indices for all the orders whose series
+    has not stopped yet, and the signed terms are summed in the log space. Each
+    order stops at the same term as the scalar loop; the blocks double in size so
+    that long series take few iterations.
+
+    Args:
+        q: Sampling rate of SGM; a scalar, or one rate per order.
+        sigma: The standard deviation of the additive Gaussian noise; a scalar,
+            or one per order.
+        alphas: Fractional orders at which RDP is computed.
+        block: Number of terms of the series evaluated in the first iteration.
+
+    Returns:
+        :math:`log(A_\alpha)` for every order in ``alphas``.
+    """
+    q, sigma, alphas = np.broadcast_arrays(q, sigma, alphas)
+    z0 = sigma ** 2 * np.log(1 / q - 1) + 0.5
+
+    # running signed sums of the two parts of A_alpha, in the log space
+    log_a = np.full((len(alphas), 2), -np.inf)
+    sign_a = np.ones_like(log_a)
+    active = np.arange(len(alphas))  # orders whose series has not stopped yet
+    start = 0
+    while len(active) > 0:
+        alpha = alphas[active, None]
+        log_q, log_1mq = np.log(q[active, None]), np.log(1 - q[active, None])
+        s, z = sigma[active, None], z0[active, None]
+        i = np.arange(start, start + block, dtype=float)[None, :]
+        coef = special.binom(alpha, i)
+        j = alpha - i
+
+        with np.errstate(divide="ignore"):
+            log_coef = np.log(np.abs(coef))
+        log_t0 = log_coef + i * log_q + j * log_1mq
+        log_t1 = log_coef + j * log_q + i * log_1mq
+
+        log_e0 = math.log(0.5) + _log_erfc((i - z) / (math.sqrt(2) * s))
+        log_e1 = math.log(0.5) + _log_erfc((z - j) / (math.sqrt(2) * s))
+
+        log_s0 = log_t0 + (i * i - i) / (2 * (s ** 2)) + log_e0
+        log_s1 = log_t1 + (j * j - j) / (2 * (s ** 2)) + log_e1
+
+        # like the scalar loop, stop after the first term with both parts below -30
+        small = np.maximum(log_s0, log_s1) < -30
+        done = small.any(axis=1)
+        last = np.where(done, small.argmax(axis=1), block - 1)[:, None]
+        keep = np.arange(block)[None, :] <= last
+
+        for k, log_s in enumerate((log_s0, log_s1)):
+            log_s = np.where(keep, log_s, -np.inf)
+            log_b, sign_b = special.logsumexp(
+                log_s, axis=1, b=np.sign(coef), return_sign=True
+            )
+            log_a[active, k], sign_a[active, k] = special.logsumexp(
+                np.stack([log_a[active, k], log_b], axis=1),
+                axis=1,
+                b=np.stack([sign_a[active, k], sign_b], axis=1),
+                return_sign=True,
+            )
+
+        active = active[~done]
+        start += block
+        block *= 2
+
+    return np.logaddexp(log_a[:, 0], log_a[:, 1])
+
+
+def _compute_rdp_rows(
+    q: np.ndarray, sigma: np.ndarray, orders: np.ndarray
+) -> np.ndarray:
+    r"""Computes RDP of the Sampled Gaussian Mechanisms of rates ``q`` and noise
+    ``sigma`` at all ``orders`` at once.
+
+    Every entry of the flat arrays ``q``, ``sigma`` and ``orders`` (of the same
+    length) is one mechanism at one order; the entries are split between the
+    closed forms, the integer-order kernel and the fractional-order kernel.
+
+    Args:
+        q: Sampling rates of SGM.
+        sigma: The standard deviations of the additive Gaussian noise.
+        orders: The orders at which RDP is computed.
+
+    Returns:
+        RDP of every entry; can contain np.inf.
+    """
+    # no noise (or an infinite order) gives no privacy, unless nothing is sampled
+    rdp = np.full_like(orders, np.inf)
+    rdp[q == 0] = 0
+    regular = (q > 0) & (sigma > 0) & np.isfinite(orders)
+    full_batch = regular & (q == 1.0)
+    rdp[full_batch] = orders[full_batch] / (2 * sigma[full_batch] ** 2)
+    regular &= q < 1.0
+
+    is_int = regular & (np.floor(orders) == orders)
+    is_frac = regular & ~is_int
+    if is_int.any():
+        rdp[is_int] = _compute_log_a_for_int_alphas(
+            q[is_int], sigma[is_int], orders[is_int]
+        )
+    if is_frac.any():
+        rdp[is_frac] = _compute_log_a_for_frac_alphas(
+            q[is_frac], sigma[is_frac], orders[is_frac]
+        )
+    rdp[regular] /= orders[regular] - 1
+    return rdp
+
+
+def _compute_rdp_orders(q: float, sigma: float, orders: np.ndarray) -> np.ndarray:
+    r"""Computes RDP of the Sampled Gaussian Mechanism at all ``orders`` at once.
+
+    Vectorized counterpart of ``_compute_rdp``; it agrees with it to within
+    floating point rounding.
+
+    Args:
+        q: Sampling rate of SGM.
+        sigma: The standard deviation of the additive Gaussian noise.
+        orders: The orders at which RDP is computed.
+
+    Returns:
+        RDP at every order in ``orders``; can contain np.inf.
+    """
+    orders = np.asarray(orders, dtype=float)
+    q, sigma = np.broadcast_arrays(float(q), float(sigma), orders)[:2]
+    return _compute_rdp_rows(q, sigma, orders)
+
+
+def compute_rdp_grid(
+    q: Union[List[float], np.ndarray],
+    noise_multiplier: Union[List[float], np.ndarray],
+    orders: Union[List[float], np.ndarray],
+) -> np.ndarray:
+    r"""Computes the RDP guarantees of one step of the Sampled Gaussian Mechanism
+    for a whole grid of sampling rates and noise multipliers.
+
+    The ``[noise_multiplier, q, order]`` grid is evaluated at once, by the
+    same kernels as ``compute_rdp``; multiply by the number of steps to get
+    the RDP of the iterated mechanism.
+
+    Args:
+        q: An array of sampling rates of SGM.
+        noise_multiplier: An array of noise multipliers.
+        orders: An array of RDP orders.
+
+    Returns:
+        An array of shape ``[len(noise_multiplier), len(q), len(orders)]`` of
+        RDP guarantees; can contain ``np.inf``.
+    """
+    sigma, q, orders = np.meshgrid(
+        np.asarray(noise_multiplier, dtype=float),
+        np.asarray(q, dtype=float),
+        np.asarray(orders, dtype=float),
+        indexing="ij",
+    )
+    return _compute_rdp_rows(q.ravel(), sigma.ravel(), orders.ravel()).reshape(
+        q.shape
+    )
+
+
 def compute_rdp(
     q: float, noise_multiplier: float, steps: int, orders: Union[List[float], float]
 ) -> Union[List[float], float]:
@@ -262,7 +459,7 @@ def compute_rdp(
     if isinstance(orders, float):
         rdp = _compute_rdp(q, noise_multiplier, orders)
     else:
-        rdp = np.array([_compute_rdp(q, noise_multiplier, order) for order in orders])
+        rdp = _compute_rdp_orders(q, noise_multiplier, orders)
 
     return rdp * steps
 
@@ -309,3 +506,32 @@ def get_privacy_spent(
 
     idx_opt = np.nanargmin(eps)  # Ignore NaNs
     return eps[idx_opt], orders_vec[idx_opt]
+
+
+def get_privacy_spent_batch(
+    orders: Union[List[float], np.ndarray], rdp: np.ndarray, delta: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    r"""Batched counterpart of ``get_privacy_spent``: computes epsilon given RDP
+    values at multiple RDP orders for a whole array of mechanisms at once.
+
+    Args:
+        orders: An array of orders (alphas).
+        rdp: An array of RDP guarantees of shape ``[..., len(orders)]``.
+        delta: The target delta.
+
+    Returns:
+        Pair of arrays of shape ``rdp.shape[:-1]``: epsilons and optimal orders
+        alpha (``np.inf`` and ``np.nan`` for mechanisms with no privacy).
+    """
+    orders_vec = np.asarray(orders, dtype=float)
+    with np.errstate(invalid="ignore"):
+        eps = (
+            rdp
+            - (np.log(delta) + np.log(orders_vec)) / (orders_vec - 1)
+            + np.log((orders_vec - 1) / orders_vec)
+        )
+    eps = np.where(np.isnan(eps), np.inf, eps)
+    idx_opt = np.argmin(eps, axis=-1)
+    eps_opt = np.take_along_axis(eps, idx_opt[..., None], axis=-1)[..., 0]
+    alpha_opt = np.where(np.isinf(eps_opt), np.nan, orders_vec[idx_opt])
+    return eps_opt, alpha_opt
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+
+r"""
+Ledger of the Sampled Gaussian Mechanisms (SGM) run during training, for
+composing steps with different sampling rates and noise multipliers (e.g. a
+noise schedule, or the noisy normalization statistics computed before training).
+
+Every invocation is recorded as a ``(sample_rate, noise_multiplier, count)``
+entry, and consecutive invocations of the same mechanism are merged into one
+entry. Since composition does not depend on the order of the mechanisms, the
+privacy spent is computed from the distinct mechanisms of the ledger and their
+total counts, with their per-step RDP curves read from an LRU cache (see
+:func:`~opacus.calibration.rdp_curve`): a query costs
+``O(#distinct mechanisms)`` rather than ``O(steps)``.
+
+Steps on public data, which cost no privacy, can be recorded with a sample rate
+of 0.
+
+Example:
+    >>> ledger = PrivacyLedger()
+    >>> ledger.record(sample_rate=1.0, noise_multiplier=8.0, count=2)
+    >>> for epoch in range(epochs):
+    >>>     for _ in range(steps_per_epoch):
+    >>>         ledger.record(sample_rate, 1.5 if epoch < 40 else 1.0)
+    >>> epsilon, best_alpha = ledger.get_privacy_spent(1e-5, alphas)
+
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+from . import calibration, pld_analysis, privacy_analysis
+
+
+class LedgerEntry(NamedTuple):
+    r"""
+    ``count`` consecutive invocations of the SGM of sampling rate ``sample_rate``
+    and noise multiplier ``noise_multiplier``.
+    """
+    sample_rate: float
+    noise_multiplier: float
+    count: int
+
+
+class PrivacyLedger:
+    r"""
+    Records the SGM invocations of a training run and computes the privacy spent
+    by their composition.
+    """
+
+    def __init__(self):
+        self.entries: List[LedgerEntry] = []
+
+    @property
+    def steps(self) -> int:
+        r"""
+        Total number of recorded invocations.
+        """
+        return sum(entry.count for entry in self.entries)
+
+    def record(self, sample_rate: float, noise_multiplier: float, count: int = 1):
+        r"""
+        Records ``count`` invocations of the SGM, merged into the last entry if it
+        has the same ``sample_rate`` and ``noise_multiplier``.
+
+        Args:
+            sample_rate: The sampling rate (usually batch_size / n_data); 0 for
+                steps on public data
+            noise_multiplier: The noise multiplier
+            count: The number of invocations
+        """
+        if count < 0:
+            raise ValueError(f"count should be non-negative, got {count}")
+        if count == 0:
+            return
+        sample_rate, noise_multiplier = float(sample_rate), float(noise_multiplier)
+        if self.entries and self.entries[-1][:2] == (sample_rate, noise_multiplier):
+            last = self.entries[-1]
+            self.entries[-1] = last._replace(count=last.count + count)
+        else:
+            self.entries.append(LedgerEntry(sample_rate, noise_multiplier, count))
+
+    def with_steps(
+        self, steps: int, sample_rate: float, noise_multiplier: float
+    ) -> "PrivacyLedger":
+        r"""
+        Returns a copy of the ledger with its first ``steps`` invocations, followed
+        by invocations of the SGM of ``sample_rate`` and ``noise_multiplier`` up to
+        ``steps`` if the ledger records fewer.
+
+        Args:
+            steps: The number of invocations of the copy
+            sample_rate: The sampling rate of the missing invocations
+            noise_multiplier: The noise multiplier of the missing invocations
+        """
+        ledger = PrivacyLedger()
+        for entry in self.entries:
+            ledger.record(
+                entry.sample_rate,
+                entry.noise_multiplier,
+                min(entry.count, steps - ledger.steps),
+            )
+        ledger.record(sample_rate, noise_multiplier, steps - ledger.steps)
+        return ledger
+
+    def mechanisms(self) -> Dict[Tuple[float, float], int]:
+        r"""
+        Returns the total count of every distinct ``(sample_rate, noise_multiplier)``
+        of the ledger that spends privacy, in order of first invocation.
+        """
+        counts: Dict[Tuple[float, float], int] = OrderedDict()
+        for sample_rate, noise_multiplier, count in self.entries:
+            if sample_rate > 0:
+                key = (sample_rate, noise_multiplier)
+                counts[key] = counts.get(key, 0) + count
+        return counts
+
+    def get_rdp(self, alphas: Sequence[float]) -> np.ndarray:
+        r"""
+        Returns the RDP spent by all the recorded invocations at the orders ``alphas``.
+        """
+        rdp = np.zeros(len(alphas))
+        for (sample_rate, noise_multiplier), count in self.mechanisms().items():
+            rdp += calibration.rdp_curve(sample_rate, noise_multiplier, alphas) * count
+        return rdp
+
+    def get_privacy_spent(
+        self, target_delta: float, alphas: Sequence[float], accountant: str = "rdp"
+    ) -> Tuple[float, float]:
+        r"""
+        Computes the (epsilon, delta) privacy budget spent by all the recorded
+        invocations.
+
+        Args:
+            target_delta: The target delta
+            alphas: The orders at which to compute RDP
+            accountant: "rdp" or "pld" (see :mod:`~opacus.pld_analysis`). Both give
+                upper bounds on epsilon, so "pld" returns the smaller of the two.
+
+        Returns:
+            Pair of epsilon and optimal order alpha (NaN if the PLD epsilon is used).
+        """
+        if accountant not in ("rdp", "pld"):
+            raise ValueError(
+                f"Unknown accountant {accountant}. Expected one of 'rdp', 'pld'."
+            )
+        eps, best_alpha = privacy_analysis.get_privacy_spent(
+            alphas, self.get_rdp(alphas), target_delta
+        )
+        if accountant == "pld":
+            plds = None
+            for (sample_rate, noise_multiplier), count in self.mechanisms().items():
+                plds = pld_analysis.compose(
+                    plds, pld_analysis.compute_pld(sample_rate, noise_multiplier, count)
+                )
+            if plds is None:
+                return 0.0, float("nan")
+            eps_pld, _ = pld_analysis.get_privacy_spent(plds, target_delta)
+            if eps_pld <= eps:
+                eps, best_alpha = eps_pld, np.nan
+        return float(eps), float(best_alpha)
+
+    def __add__(self, other: "PrivacyLedger") -> "PrivacyLedger":
+        r"""
+        Returns a ledger with the entries of ``self`` followed by those of ``other``.
+        """
+        ledger = PrivacyLedger()
+        for entry in self.entries + other.entries:
+            ledger.record(*entry)
+        return ledger
+
+    def state_dict(self):
+        return {"entries": [tuple(entry) for entry in self.entries]}
+
+    def load_state_dict(self, state_dict):
+        self.entries = [LedgerEntry(*entry) for entry in state_dict["entries"]]
@@ -8,6 +8,7 @@ import torch.nn.functional as F
 from opacus import PerSampleGradientClipper
 from opacus.grad_sample import GradSampleModule
 from opacus.utils.clipping import ConstantFlatClipper, ConstantPerLayerClipper
+from opacus.utils.tensor_utils import calc_sample_norms, mean_over_batch_groups
 from torch.utils.data import DataLoader
 from torchvision import transforms
 from torchvision.datasets import FakeData
@@ -75,7 +76,7 @@ class PerSampleGradientClipper_test(unittest.TestCase):
             dim=-1,
         )
 
-    def setUp_clipped_model(self, clip_value=0.003, run_clipper_step=True):
+    def setUp_clipped_model(self, clip_value=0.003, run_clipper_step=True, group_size=None):
         # Deep copy
         self.clipped_model = SampleConvNet()  # create the structure
         self.clipped_model.load_state_dict(self.original_model.state_dict())  # fill it
@@ -90,7 +91,9 @@ class PerSampleGradientClipper_test(unittest.TestCase):
             if not isinstance(clip_value, list)
             else ConstantPerLayerClipper(clip_value)
         )
-        self.clipper = PerSampleGradientClipper(self.clipped_model, norm_clipper)
+        self.clipper = PerSampleGradientClipper(
+            self.clipped_model, norm_clipper, group_size=group_size
+        )
 
         for x, y in self.dl:
             logits = self.clipped_model(x)
@@ -164,3 +167,54 @@ class PerSampleGradientClipper_test(unittest.TestCase):
         self.assertTrue(
             torch.allclose(self.original_grads_norms, self.clipped_grads_norms)
         )
+
+    def test_grouped_clipping_to_high_value_does_nothing(self):
+        # with equal groups, the mean of the group means is the batch mean
+        self.setUp_clipped_model(clip_value=9999, run_clipper_step=True, group_size=4)
+        self.assertTrue(
+            torch.allclose(self.original_grads_norms, self.clipped_grads_norms)
+        )
+
+    def test_grouped_clipping_ragged_groups(self):
+        clip_value = 0.003
+        group_size = [5] * 12 + [4]
+        model = SampleConvNet()
+        model.load_state_dict(self.original_model.state_dict())
+        model = GradSampleModule(model)
+        for x, y in self.dl:
+            self.criterion(model(x), y).backward()
+        grad_samples = [
+            mean_over_batch_groups(p.grad_sample, group_size)
+            for p in model.parameters()
+            if p.requires_grad
+        ]
+        norms = calc_sample_norms((("", g) for g in grad_samples))[0]
+        factor = (clip_value / (norms + 1e-6)).clamp(max=1.0)
+        expected = [
+            torch.einsum("i,i...", factor, g).norm() / len(group_size)
+            for g in grad_samples
+        ]
+
+        self.setUp_clipped_model(
+            clip_value=clip_value, run_clipper_step=True, group_size=group_size
+        )
+        self.assertTrue(
+            torch.allclose(torch.stack(expected), self.clipped_grads_norms)
+        )
+
+    def test_mean_over_batch_groups(self):
+        tensor = torch.randn(10, 3, 2)
+        for group_size, sizes in [
+            (2, [2] * 5),
+            (4, [4, 4, 2]),
+            ([3, 3, 3, 1], [3, 3, 3, 1]),
+            ([10], [10]),
+        ]:
+            expected = torch.stack(
+                [chunk.mean(dim=0) for chunk in tensor.split(sizes)]
+            )
+            self.assertTrue(
+                torch.allclose(mean_over_batch_groups(tensor, group_size), expected)
+            )
+        with self.assertRaises(ValueError):
+            mean_over_batch_groups(tensor, [3, 3])
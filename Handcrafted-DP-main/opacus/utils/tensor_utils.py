@@ -3,7 +3,7 @@
 """
 Utils for generating stats from torch tensors.
 """
-from typing import Iterator, List, Tuple, Union
+from typing import Iterator, List, Sequence, Tuple, Union
 
 import numpy as np
 import torch
@@ -99,6 +99,51 @@ def sum_over_all_but_batch_and_last_n(
         return tensor.sum(dim=dims)
 
 
+def mean_over_batch_groups(
+    tensor: torch.Tensor, group_sizes: Union[int, Sequence[int]]
+) -> torch.Tensor:
+    r"""
+    Averages contiguous groups of samples along the batch dimension (the
+    first one), as done by BatchClipping before clipping.
+
+    Args:
+        tensor: An input tensor of shape ``(B, ...)``.
+        group_sizes: Either the size of every group, in which case the last
+            group holds the remaining ``B % group_sizes`` samples if ``B`` is
+            not a multiple of it, or the list of (possibly ragged) group sizes,
+            which must sum up to ``B``.
+
+    Example:
+        >>> tensor = torch.ones(10, 3)
+        >>> mean_over_batch_groups(tensor, 4).shape
+        torch.Size([3, 3])
+
+    Returns:
+        A tensor of shape ``(G, ...)`` where ``G`` is the number of groups
+    """
+    batch_size = tensor.shape[0]
+    if isinstance(group_sizes, int):
+        if batch_size % group_sizes == 0:
+            return tensor.reshape(
+                batch_size // group_sizes, group_sizes, *tensor.shape[1:]
+            ).mean(dim=1)
+        group_sizes = [group_sizes] * (batch_size // group_sizes) + [
+            batch_size % group_sizes
+        ]
+    if sum(group_sizes) != batch_size:
+        raise ValueError(
+            f"Group sizes sum up to {sum(group_sizes)}, but the batch size is {batch_size}"
+        )
+
+    sizes = torch.as_tensor(group_sizes, device=tensor.device)
+    segments = torch.repeat_interleave(
+        torch.arange(len(group_sizes), device=tensor.device), sizes
+    )
+    sums = tensor.new_zeros((len(group_sizes), *tensor.shape[1:]))
+    sums.index_add_(0, segments, tensor)
+    return sums / sizes.to(tensor.dtype).view(-1, *[1] * (tensor.dim() - 1))
+
+
 def unfold3d(
     tensor: torch.Tensor,
     kernel_size: Union[int, Tuple[int, int, int]],
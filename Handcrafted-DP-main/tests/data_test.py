@@ -0,0 +1,66 @@
+import unittest
+
+import torch
+from torch.utils.data import BatchSampler, DataLoader, RandomSampler, TensorDataset
+
+from data import TensorBatchLoader
+
+
+class TensorBatchLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.tensors = (torch.randn(23, 3, 4), torch.randint(10, (23,)))
+        self.dataset = TensorDataset(*self.tensors)
+
+    def assertSameBatches(self, loader, expected):
+        self.assertEqual(len(loader), len(expected))
+        batches = list(loader)
+        self.assertEqual(len(batches), len(list(expected)))
+        for batch, expected_batch in zip(batches, expected):
+            self.assertEqual(len(batch), len(expected_batch))
+            for t, expected_t in zip(batch, expected_batch):
+                self.assertTrue(torch.equal(t, expected_t))
+
+    def test_sequential(self):
+        for batch_size in (1, 5, 23, 30):
+            for drop_last in (False, True):
+                self.assertSameBatches(
+                    TensorBatchLoader(self.tensors, batch_size=batch_size, drop_last=drop_last),
+                    DataLoader(self.dataset, batch_size=batch_size, drop_last=drop_last))
+
+    def test_shuffled(self):
+        for drop_last in (False, True):
+            # one permutation of the samples per epoch, drawn from `generator`
+            perm = torch.randperm(23, generator=torch.Generator().manual_seed(0))
+            self.assertSameBatches(
+                TensorBatchLoader(self.tensors, batch_size=5, shuffle=True, drop_last=drop_last,
+                                  generator=torch.Generator().manual_seed(0)),
+                DataLoader(self.dataset, batch_size=5, sampler=perm.tolist(), drop_last=drop_last))
+
+            loader = TensorBatchLoader(self.tensors, batch_size=5, shuffle=True, drop_last=drop_last)
+            first, second = (torch.cat([target for _, target in loader]) for _ in range(2))
+            self.assertEqual(len(first), 20 if drop_last else 23)
+            if not drop_last:
+                self.assertTrue(torch.equal(first.sort().values, self.tensors[1].sort().values))
+                self.assertTrue(torch.equal(second.sort().values, self.tensors[1].sort().values))
+
+    def test_batch_sampler(self):
+        for drop_last in (False, True):
+            batch_sampler = BatchSampler(
+                RandomSampler(self.dataset, generator=torch.Generator().manual_seed(0)),
+                batch_size=5, drop_last=drop_last)
+            # the same batches for both loaders
+            batches = list(batch_sampler)
+            self.assertSameBatches(
+                TensorBatchLoader(self.tensors, batch_sampler=batches),
+                DataLoader(self.dataset, batch_sampler=batches))
+
+    @unittest.skipIf(not torch.cuda.is_available(), "needs CUDA")
+    def test_pinned(self):
+        device = torch.device("cuda")
+        loader = TensorBatchLoader(self.tensors, batch_size=5, shuffle=True, pin_memory=True,
+                                   device=device, generator=torch.Generator().manual_seed(0))
+        self.assertTrue(loader.pin_memory)
+        perm = torch.randperm(23, generator=torch.Generator().manual_seed(0))
+        expected = DataLoader(self.dataset, batch_size=5, sampler=perm.tolist())
+        batches = [tuple(t.cpu() for t in batch) for batch in loader]
+        self.assertSameBatches(batches, expected)
@@ -0,0 +1,52 @@
+import math
+import unittest
+
+import numpy as np
+import torch
+
+from dp_utils import NormClippingSketch
+
+
+class NormClippingSketchTest(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        # norms spread over several orders of magnitude
+        directions = torch.randn(1000, 16, dtype=torch.float64)
+        scales = torch.exp(torch.empty(1000, 1, dtype=torch.float64).uniform_(-5, 5))
+        self.x = directions * scales
+        self.norms = torch.linalg.norm(self.x, dim=-1).sort().values
+
+    def sketch(self, relative_accuracy=0.01):
+        sketch = NormClippingSketch(16, "cpu", relative_accuracy=relative_accuracy)
+        for batch in self.x.split(128):
+            sketch.update(batch)
+        return sketch
+
+    def test_quantile_error_bound(self):
+        for relative_accuracy in (0.1, 0.01, 0.001):
+            sketch = self.sketch(relative_accuracy)
+            gamma = math.exp(sketch.log_gamma)
+            for q in (0.0, 0.1, 0.5, 0.9, 0.99, 1.0):
+                # the norm of rank q * (n - 1) is in the bucket whose upper edge is returned
+                norm = self.norms[int(q * (len(self.norms) - 1))].item()
+                thresh = sketch.quantile(q)
+                self.assertLessEqual(norm, thresh * (1 + 1e-12))
+                self.assertLessEqual(thresh, norm * gamma * (1 + 1e-12))
+
+    def test_clipped_sum_exact(self):
+        sketch = self.sketch()
+        for q in (0.1, 0.5, 0.9):
+            thresh = sketch.quantile(q)
+            norms = torch.linalg.norm(self.x, dim=-1, keepdim=True)
+            expected = (self.x * (thresh / norms).clamp(max=1)).sum(0).numpy()
+            np.testing.assert_allclose(sketch.clipped_sum(thresh), expected, rtol=1e-9, atol=1e-9)
+
+    def test_out_of_range_norms(self):
+        sketch = NormClippingSketch(2, "cpu", min_norm=1e-2, max_norm=1e2)
+        x = torch.tensor([[0.0, 0.0], [1e-3, 0.0], [0.0, 1e3]], dtype=torch.float64)
+        sketch.update(x)
+        self.assertEqual(sketch.counts[0].item(), 2)
+        self.assertEqual(sketch.counts[-1].item(), 1)
+        thresh = sketch.quantile(0.5)
+        self.assertLessEqual(thresh, 1e-2)
+        np.testing.assert_allclose(sketch.clipped_sum(thresh), [1e-3, thresh])
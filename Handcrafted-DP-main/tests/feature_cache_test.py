@@ -0,0 +1,180 @@
+import fcntl
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+import torch
+from kymatio.scattering2d.frontend.torch_frontend import ScatteringTorch2D
+
+import feature_cache
+from feature_cache import FeatureShards, ShardBatchLoader, feature_cache_path, \
+    get_cached_scattered_dataset, write_feature_shards
+
+
+class ShuffledFileDataset(torch.utils.data.Dataset):
+    # like SemiSupervisedDataset: reads its samples from a file and shuffles
+    # them with an unseeded permutation at every construction
+    def __init__(self, filename):
+        data = np.load(filename)
+        p = np.random.permutation(len(data))
+        self.data = torch.from_numpy(data[p])
+        self.targets = list(p % 10)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, idx):
+        return self.data[idx], self.targets[idx]
+
+
+class FailingSampler(object):
+    # yields one batch, then fails
+    def __iter__(self):
+        yield [0, 1]
+        raise RuntimeError("sampler failed")
+
+    def __len__(self):
+        return 2
+
+
+class FeatureCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.cache_dir, "images.npy")
+        np.save(self.source, np.random.rand(20, 1, 8, 8).astype(np.float32))
+        self.scattering = ScatteringTorch2D(J=1, shape=(8, 8), L=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def get_features(self, data):
+        loader = torch.utils.data.DataLoader(data, batch_size=8)
+        return get_cached_scattered_dataset(loader, self.scattering, "cpu", "toy", "train",
+                                            self.cache_dir, shard_size=8, source=self.source)
+
+    def test_shuffled_dataset_hits_same_entry(self):
+        first, second = ShuffledFileDataset(self.source), ShuffledFileDataset(self.source)
+        self.assertNotEqual(first.targets, second.targets)
+        self.assertEqual(
+            feature_cache_path(self.cache_dir, "toy", "train", first, self.scattering,
+                               source=self.source),
+            feature_cache_path(self.cache_dir, "toy", "train", second, self.scattering,
+                               source=self.source),
+        )
+
+        features = self.get_features(first)
+        with mock.patch.object(feature_cache, "write_feature_shards") as write:
+            cached = self.get_features(second)
+        write.assert_not_called()
+        self.assertEqual(cached.meta, features.meta)
+        self.assertTrue(torch.equal(cached.targets, torch.tensor(first.targets)))
+
+    def test_source_change_invalidates(self):
+        data = ShuffledFileDataset(self.source)
+        path, _ = feature_cache_path(self.cache_dir, "toy", "train", data, self.scattering,
+                                     source=self.source)
+        np.save(self.source, np.random.rand(21, 1, 8, 8).astype(np.float32))
+        new_path, _ = feature_cache_path(self.cache_dir, "toy", "train", data, self.scattering,
+                                         source=self.source)
+        self.assertNotEqual(path, new_path)
+
+    def test_write_read_round_trip(self):
+        data = ShuffledFileDataset(self.source)
+        path = os.path.join(self.cache_dir, "entry")
+        loader = torch.utils.data.DataLoader(data, batch_size=6)
+        write_feature_shards(path, loader, self.scattering, "cpu", {"dataset": "toy"},
+                             shard_size=8)
+        self.assertEqual([name for name in os.listdir(self.cache_dir) if name.startswith(".tmp-")], [])
+
+        shards = FeatureShards(path)
+        expected = self.scattering(data.data)
+        self.assertEqual(shards.meta["dataset"], "toy")
+        self.assertEqual(len(shards.shards), 3)
+        self.assertEqual(len(shards), len(data))
+        for idx in (0, 7, 8, 19):
+            features, target = shards[idx]
+            self.assertTrue(torch.allclose(features, expected[idx]))
+            self.assertEqual(target.item(), data.targets[idx])
+
+        indices = [17, 3, 8, 3, 0]
+        features, targets = shards.get_batch(indices)
+        self.assertTrue(torch.allclose(features, expected[indices]))
+        self.assertEqual(targets.tolist(), [data.targets[i] for i in indices])
+
+    def test_failed_write_leaves_no_entry(self):
+        def scattering(x):
+            raise RuntimeError("transform failed")
+
+        path = os.path.join(self.cache_dir, "entry")
+        loader = torch.utils.data.DataLoader(ShuffledFileDataset(self.source), batch_size=8)
+        with self.assertRaises(RuntimeError):
+            write_feature_shards(path, loader, scattering, "cpu", {}, shard_size=8)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ["images.npy"])
+
+    def test_key_invalidation(self):
+        data = ShuffledFileDataset(self.source)
+        path, _ = feature_cache_path(self.cache_dir, "toy", "train", data, self.scattering)
+        subset = torch.utils.data.Subset(data, range(10))
+        for other in (
+            feature_cache_path(self.cache_dir, "toy", "test", data, self.scattering),
+            feature_cache_path(self.cache_dir, "toy", "train", subset, self.scattering),
+            feature_cache_path(self.cache_dir, "toy", "train", data, ScatteringTorch2D(J=1, shape=(8, 8), L=3)),
+            feature_cache_path(self.cache_dir, "toy", "train", data, self.scattering, dtype=np.float16),
+            feature_cache_path(self.cache_dir, "toy", "train", data, self.scattering, source=self.source),
+        ):
+            self.assertNotEqual(other[0], path)
+
+        data.transform = "normalize"
+        self.assertNotEqual(feature_cache_path(self.cache_dir, "toy", "train", data, self.scattering)[0], path)
+
+    def test_lock(self):
+        data = ShuffledFileDataset(self.source)
+        path, _ = feature_cache_path(self.cache_dir, "toy", "train", data, self.scattering,
+                                     source=self.source)
+        results = []
+        with open(path + ".lock", "w") as lock:
+            # another job is writing the entry
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            waiting = threading.Thread(target=lambda: results.append(self.get_features(data)))
+            waiting.start()
+            time.sleep(0.5)
+            self.assertTrue(waiting.is_alive())
+            self.assertFalse(os.path.exists(path))
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        waiting.join(timeout=30)
+        self.assertFalse(waiting.is_alive())
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(len(results[0]), len(data))
+
+    def test_shard_batch_loader(self):
+        shards = self.get_features(ShuffledFileDataset(self.source))
+        sampler = torch.utils.data.BatchSampler(
+            torch.utils.data.SequentialSampler(range(len(shards))), batch_size=6, drop_last=False)
+        loader = ShardBatchLoader(shards, sampler, prefetch=2)
+        self.assertEqual(len(loader), 4)
+        batches = list(loader)
+        self.assertEqual(len(batches), 4)
+        for (data, target), indices in zip(batches, sampler):
+            expected_data, expected_target = shards.get_batch(indices)
+            self.assertTrue(torch.equal(data, expected_data))
+            self.assertTrue(torch.equal(target, expected_target))
+
+        # stopping early releases the prefetch thread
+        for _ in loader:
+            break
+        self.assertEqual(threading.active_count(), 1)
+
+    def test_shard_batch_loader_error(self):
+        shards = self.get_features(ShuffledFileDataset(self.source))
+        loader = ShardBatchLoader(shards, FailingSampler(), prefetch=1)
+        batches = iter(loader)
+        data, _ = next(batches)
+        self.assertEqual(len(data), 2)
+        with self.assertRaisesRegex(RuntimeError, "sampler failed"):
+            next(batches)
+        self.assertEqual(threading.active_count(), 1)
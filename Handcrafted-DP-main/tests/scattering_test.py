@@ -0,0 +1,106 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+from kymatio.scattering2d.frontend.torch_frontend import ScatteringTorch2D
+
+
+def relative_error(x, reference):
+    # largest error relative to the largest reference coefficient
+    return ((x - reference).abs().max() / reference.abs().max()).item()
+
+
+class ScatteringModesTest(unittest.TestCase):
+    # the optional modes of the torch Scattering2D against the default forward
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.x = torch.randn(3, 2, 16, 16)
+        self.kwargs = dict(J=2, shape=(16, 16), L=4)
+
+    def test_batched(self):
+        for max_order in (1, 2):
+            kwargs = dict(self.kwargs, max_order=max_order)
+            reference = ScatteringTorch2D(**kwargs)
+            batched = ScatteringTorch2D(batched=True, **kwargs)
+            self.assertTrue(torch.equal(batched(self.x), reference(self.x)))
+
+        reference = ScatteringTorch2D(out_type="list", **self.kwargs)(self.x)
+        batched = ScatteringTorch2D(out_type="list", batched=True, **self.kwargs)(self.x)
+        self.assertEqual(len(batched), len(reference))
+        for coef, expected in zip(batched, reference):
+            self.assertEqual(coef["j"], expected["j"])
+            self.assertEqual(coef["theta"], expected["theta"])
+            self.assertTrue(torch.equal(coef["coef"], expected["coef"]))
+
+    def test_real_input(self):
+        x = self.x.clone().requires_grad_()
+        reference = ScatteringTorch2D(**self.kwargs)(x)
+        (expected_grad,) = torch.autograd.grad(reference.sum(), x)
+
+        for batched in (False, True):
+            x = self.x.clone().requires_grad_()
+            out = ScatteringTorch2D(real_input=True, batched=batched, **self.kwargs)(x)
+            (grad,) = torch.autograd.grad(out.sum(), x)
+            self.assertLess(relative_error(out, reference.detach()), 1e-6)
+            # the gradients of the first-order coefficients go through irfft2, and
+            # are about 2e-6 away from those computed in double precision
+            self.assertLess(relative_error(grad, expected_grad), 1e-5)
+
+    def test_precision(self):
+        reference = ScatteringTorch2D(**self.kwargs)(self.x)
+        for precision, tolerance in (("complex64", 1e-6), ("float16", 5e-4), ("bfloat16", 5e-3)):
+            out = ScatteringTorch2D(precision=precision, **self.kwargs)(self.x)
+            self.assertEqual(out.dtype, torch.float32)
+            self.assertEqual(out.shape, reference.shape)
+            self.assertLess(relative_error(out, reference), tolerance, precision)
+
+        with self.assertRaisesRegex(ValueError, "precision"):
+            ScatteringTorch2D(precision="float64", **self.kwargs)
+        for precision in ("complex64", "float16"):
+            with self.assertRaisesRegex(RuntimeError, "mutually exclusive"):
+                ScatteringTorch2D(precision=precision, real_input=True, **self.kwargs)
+
+
+@unittest.skipIf(importlib.util.find_spec("sklearn") is None, "needs scikit-learn")
+class ScatteringTransformerTest(unittest.TestCase):
+    # the chunked, parallel transform of the scikit-learn transformer against a
+    # single call of the transform
+
+    def setUp(self):
+        from kymatio.sklearn import Scattering2D
+
+        np.random.seed(0)
+        self.x = np.random.randn(7, 16 * 16).astype(np.float32)
+        self.make = lambda **kwargs: Scattering2D(J=2, shape=(16, 16), L=4, **kwargs)
+        self.expected = self.make().scattering(self.x.reshape(-1, 16, 16)).reshape(7, -1)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_parallel_modes(self):
+        # a budget of a couple of samples per chunk
+        memory_budget = 2 * 4 * (self.x[:1].nbytes + self.expected[:1].nbytes)
+        for kwargs in ({}, dict(n_jobs=2, prefer="threads"), dict(n_jobs=2, prefer="processes")):
+            transformer = self.make(memory_budget=memory_budget, **kwargs)
+            np.testing.assert_array_equal(transformer.transform(self.x), self.expected)
+
+    def test_out(self):
+        transformer = self.make(memory_budget=1)
+        out = np.empty_like(self.expected)
+        self.assertIs(transformer.transform(self.x, out=out), out)
+        np.testing.assert_array_equal(out, self.expected)
+
+        path = os.path.join(self.tmp_dir, "features.npy")
+        transformer.transform(self.x, out=path)
+        np.testing.assert_array_equal(np.load(path), self.expected)
+
+        with self.assertRaises(ValueError):
+            transformer.transform(self.x, out=np.empty((7, 1), np.float32))
+        with self.assertRaises(ValueError):
+            transformer.transform(self.x[:0])
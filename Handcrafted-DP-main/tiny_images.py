@@ -5,12 +5,14 @@ import numpy as np
 import torch
 import torch.nn as nn
 from opacus import PrivacyEngine
+from opacus.privacy_ledger import PrivacyLedger
 
 from train_utils import get_device, train, test
 from data import get_data, SemiSupervisedSampler, get_scatter_transform, \
-    get_scattered_loader, get_scattered_dataset
+    get_scattered_loader, get_scattered_dataset, TensorBatchLoader
+from feature_cache import get_cached_scattered_dataset, ShardBatchLoader
 from models import CNNS, get_num_params, ScatterLinear
-from dp_utils import ORDERS, get_privacy_spent, get_renyi_divergence, scatter_normalization
+from dp_utils import ORDERS, scatter_normalization, get_privacy_spent_ledger, normalization_ledger
 from log import Logger
 
 
@@ -18,7 +20,8 @@ def main(tiny_images=None, model="cnn", augment=False, use_scattering=False,
          batch_size=2048, mini_batch_size=256, lr=1, lr_start=None, optim="SGD",
          momentum=0.9, noise_multiplier=1, max_grad_norm=0.1,
          epochs=100, bn_noise_multiplier=None, max_epsilon=None,
-         data_size=550000, delta=1e-6, logdir=None):
+         data_size=550000, delta=1e-6, logdir=None, accountant="rdp",
+         feature_cache_dir=None):
     logger = Logger(logdir)
 
     device = get_device()
@@ -47,8 +50,22 @@ def main(tiny_images=None, model="cnn", augment=False, use_scattering=False,
         scattering, K, (h, w) = get_scatter_transform("cifar10_500K")
         scattering.to(device)
 
+    on_disk = False
+    if use_scattering and feature_cache_dir is not None and not augment:
+        # stream the scattering features to memory-mapped shards on disk (once),
+        # and read them back in random batches instead of re-computing them every epoch
+        subset = torch.utils.data.Subset(train_data_aug, range(data_size))
+        loader = torch.utils.data.DataLoader(subset, batch_size=500, shuffle=False, num_workers=4)
+        # the features and labels depend on the pseudo-labelled tiny images file
+        source = tiny_images if isinstance(tiny_images, str) else None
+        train_data_aug = get_cached_scattered_dataset(loader, scattering, device,
+                                                      "cifar10_500K", "train", feature_cache_dir,
+                                                      source=source)
+        pre_scattered = True
+        on_disk = True
+
     # if the whole data fits in memory, pre-compute the scattering
-    if use_scattering and data_size <= 50000:
+    elif use_scattering and data_size <= 50000:
         loader = torch.utils.data.DataLoader(train_data_aug, batch_size=100, shuffle=False, num_workers=4)
         train_data_aug = get_scattered_dataset(loader, scattering, device, data_size)
         pre_scattered = True
@@ -58,25 +75,31 @@ def main(tiny_images=None, model="cnn", augment=False, use_scattering=False,
     num_batches = int(np.ceil(50000 / mini_batch_size)) # cifar-10 equivalent
 
     train_batch_sampler = SemiSupervisedSampler(data_size, num_batches, mini_batch_size)
-    train_loader_aug = torch.utils.data.DataLoader(train_data_aug,
-                                                   batch_sampler=train_batch_sampler,
-                                                   num_workers=0 if pre_scattered else 4,
-                                                   pin_memory=not pre_scattered)
+    if on_disk:
+        train_loader_aug = ShardBatchLoader(train_data_aug, train_batch_sampler, pin_memory=True)
+    elif pre_scattered:
+        train_loader_aug = TensorBatchLoader(train_data_aug.tensors, batch_sampler=train_batch_sampler)
+    else:
+        train_loader_aug = torch.utils.data.DataLoader(train_data_aug,
+                                                       batch_sampler=train_batch_sampler,
+                                                       num_workers=4,
+                                                       pin_memory=True)
 
-    rdp_norm = 0
+    norm_ledger = PrivacyLedger()
     if model == "cnn":
         if use_scattering:
             save_dir = f"bn_stats/cifar10_500K"
             os.makedirs(save_dir, exist_ok=True)
-            bn_stats, rdp_norm = scatter_normalization(train_loader,
-                                                       scattering,
-                                                       K,
-                                                       device,
-                                                       data_size,
-                                                       num_sup,
-                                                       noise_multiplier=bn_noise_multiplier,
-                                                       orders=ORDERS,
-                                                       save_dir=save_dir)
+            bn_stats, _ = scatter_normalization(train_loader,
+                                                scattering,
+                                                K,
+                                                device,
+                                                data_size,
+                                                num_sup,
+                                                noise_multiplier=bn_noise_multiplier,
+                                                orders=ORDERS,
+                                                save_dir=save_dir)
+            norm_ledger = normalization_ledger(data_size, num_sup, bn_noise_multiplier)
             model = CNNS["cifar10"](K, input_norm="BN", bn_stats=bn_stats)
             model = model.to(device)
 
@@ -88,15 +111,16 @@ def main(tiny_images=None, model="cnn", augment=False, use_scattering=False,
     elif model == "linear":
         save_dir = f"bn_stats/cifar10_500K"
         os.makedirs(save_dir, exist_ok=True)
-        bn_stats, rdp_norm = scatter_normalization(train_loader,
-                                                   scattering,
-                                                   K,
-                                                   device,
-                                                   data_size,
-                                                   num_sup,
-                                                   noise_multiplier=bn_noise_multiplier,
-                                                   orders=ORDERS,
-                                                   save_dir=save_dir)
+        bn_stats, _ = scatter_normalization(train_loader,
+                                            scattering,
+                                            K,
+                                            device,
+                                            data_size,
+                                            num_sup,
+                                            noise_multiplier=bn_noise_multiplier,
+                                            orders=ORDERS,
+                                            save_dir=save_dir)
+        norm_ledger = normalization_ledger(data_size, num_sup, bn_noise_multiplier)
         model = ScatterLinear(K, (h, w), input_norm="BN", bn_stats=bn_stats)
         model = model.to(device)
 
@@ -107,7 +131,8 @@ def main(tiny_images=None, model="cnn", augment=False, use_scattering=False,
     model.to(device)
 
     if pre_scattered:
-        test_loader = get_scattered_loader(test_loader, scattering, device)
+        test_loader = get_scattered_loader(test_loader, scattering, device,
+                                           cache_dir=feature_cache_dir, dataset="cifar10", split="test")
 
     print(f"model has {get_num_params(model)} parameters")
 
@@ -138,11 +163,8 @@ def main(tiny_images=None, model="cnn", augment=False, use_scattering=False,
             print(f"sample_rate={privacy_engine.sample_rate}, "
                   f"mul={privacy_engine.noise_multiplier}, "
                   f"steps={privacy_engine.steps}")
-            rdp_sgd = get_renyi_divergence(
-                privacy_engine.sample_rate, privacy_engine.noise_multiplier
-            ) * privacy_engine.steps
-            epsilon, _ = get_privacy_spent(rdp_norm + rdp_sgd, target_delta=delta)
-            epsilon2, _ = get_privacy_spent(rdp_sgd, target_delta=delta)
+            epsilon, _ = get_privacy_spent_ledger(norm_ledger + privacy_engine.ledger, target_delta=delta, accountant=accountant)
+            epsilon2, _ = get_privacy_spent_ledger(privacy_engine.ledger, target_delta=delta, accountant=accountant)
             print(f"ε = {epsilon:.3f} (sgd only: ε = {epsilon2:.3f})")
 
             if max_epsilon is not None and epsilon >= max_epsilon:
@@ -181,7 +203,10 @@ if __name__ == '__main__':
     parser.add_argument('--use_scattering', action="store_true")
     parser.add_argument('--bn_noise_multiplier', type=float, default=0)
     parser.add_argument('--logdir', default=None)
+    parser.add_argument('--accountant', default="rdp", choices=["rdp", "pld"])
     parser.add_argument('--data_size', type=int, default=550_000)
     parser.add_argument('--delta', type=float, default=1e-6)
+    parser.add_argument('--feature_cache_dir', default=None,
+                        help="directory of the on-disk cache of scattering features")
     args = parser.parse_args()
     main(**vars(args))
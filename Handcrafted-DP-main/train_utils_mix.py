@@ -1,8 +1,8 @@
 import torch
 import math
 import torch.nn.functional as F
-import copy
 
+from flat_mix import ModelMixer
 
 
 def get_device():
@@ -12,8 +12,16 @@ def get_device():
     return device
 
 
-def train(model, model2, train_loader, optimizer, optimizer2, epoch, n_acc_steps=1):
+def get_mixer(model, model2):
+    # ModelMix as done in `train`: sign 0 counts as +1 when widening the gap,
+    # and the mix is alpha * model + (1 - alpha) * model2
+    return ModelMixer(model, model2, zero_sign_to_one=True, alpha_on_anchor=False)
+
+
+def train(model, model2, train_loader, optimizer, optimizer2, epoch, n_acc_steps=1, mixer=None):
     device = next(model.parameters()).device
+    if mixer is None:
+        mixer = get_mixer(model, model2)
     model.train()
     model2.train()
     num_examples = 0
@@ -67,24 +75,9 @@ def train(model, model2, train_loader, optimizer, optimizer2, epoch, n_acc_steps
             lr_temp = optimizer.param_groups[0]['lr']
             tau = lr_temp * multifactor
             #tau = 0
-            copydict = copy.deepcopy(temp_model.state_dict())
-            temp_dict = temp_model.state_dict()
-            temp_dict2 = temp_model2.state_dict()
-            for j in temp_dict.keys():
-                gap_opr = torch.abs(temp_dict[j] - temp_dict2[j])
-                if (torch.min(gap_opr) < tau):
-                    gap_opr = torch.clamp(gap_opr, 0, tau)
-                    gap_opr = torch.add(-gap_opr, tau)
-                    sign_opr = torch.sign(temp_dict[j] - temp_dict2[j])
-                    sign_opr[sign_opr == 0] = 1
-                    temp_dict[j] = torch.add(temp_dict[j], gap_opr * sign_opr / 2)
-                    temp_dict2[j] = torch.add(temp_dict2[j], -gap_opr * sign_opr / 2)
-
-                dictShape = temp_dict[j].shape
-                alpha1 = torch.rand(dictShape).cuda(device)
-                temp_dict[j] = alpha1 * temp_dict[j] + (torch.ones(dictShape).cuda(device) - alpha1) * temp_dict2[j]
-            temp_model.load_state_dict(temp_dict)
-            temp_model2.load_state_dict(copydict)
+            mixer.snapshot()
+            mixer.mix(tau)
+            mixer.swap_anchor()
             
             temp_optimizer.step()
             temp_optimizer.zero_grad()
@@ -9,8 +9,8 @@ from opacus import PrivacyEngine
 
 from models import StandardizeLayer
 from train_utils import get_device, train, test
-from data import get_data
-from dp_utils import ORDERS, get_privacy_spent, get_renyi_divergence
+from data import get_data, TensorBatchLoader
+from dp_utils import ORDERS, get_privacy_spent_ledger
 from log import Logger
 
 #path = "transfer/features/cifar100_resnext"
@@ -18,7 +18,7 @@ path = "transfer/features/simclr_r50_2x_sk1"
 
 def main(feature_path=path, batch_size=2048, mini_batch_size=256,
          lr=1, optim="SGD", momentum=0.9, nesterov=False, noise_multiplier=1,
-         max_grad_norm=0.1, max_epsilon=None, epochs=100, logdir=None):
+         max_grad_norm=0.1, max_epsilon=None, epochs=100, logdir=None, accountant="rdp"):
 
     logger = Logger(logdir)
 
@@ -32,14 +32,16 @@ def main(feature_path=path, batch_size=2048, mini_batch_size=256,
     y_train = np.asarray(train_data.targets)
     y_test = np.asarray(test_data.targets)
 
-    trainset = torch.utils.data.TensorDataset(torch.from_numpy(x_train), torch.from_numpy(y_train))
-    testset = torch.utils.data.TensorDataset(torch.from_numpy(x_test), torch.from_numpy(y_test))
+    trainset = (torch.from_numpy(x_train), torch.from_numpy(y_train))
+    testset = (torch.from_numpy(x_test), torch.from_numpy(y_test))
 
     bs = batch_size
     assert bs % mini_batch_size == 0
     n_acc_steps = bs // mini_batch_size
-    train_loader = torch.utils.data.DataLoader(trainset, batch_size=mini_batch_size, shuffle=True, num_workers=1, pin_memory=True, drop_last=True)
-    test_loader = torch.utils.data.DataLoader(testset, batch_size=mini_batch_size, shuffle=False, num_workers=1, pin_memory=True)
+    train_loader = TensorBatchLoader(trainset, batch_size=mini_batch_size, shuffle=True, drop_last=True,
+                                     pin_memory=True, device=device)
+    test_loader = TensorBatchLoader(testset, batch_size=mini_batch_size, shuffle=False,
+                                    pin_memory=True, device=device)
 
     n_features = x_train.shape[-1]
     try:
@@ -78,10 +80,7 @@ def main(feature_path=path, batch_size=2048, mini_batch_size=256,
         test_loss, test_acc = test(model, test_loader)
 
         if noise_multiplier > 0:
-            rdp_sgd = get_renyi_divergence(
-                privacy_engine.sample_rate, privacy_engine.noise_multiplier
-            ) * privacy_engine.steps
-            epsilon, _ = get_privacy_spent(rdp_sgd)
+            epsilon, _ = get_privacy_spent_ledger(privacy_engine.ledger, accountant=accountant)
             print(f"ε = {epsilon:.3f}")
 
             if max_epsilon is not None and epsilon >= max_epsilon:
@@ -105,5 +104,6 @@ if __name__ == '__main__':
     parser.add_argument('--feature_path', default=path)
     parser.add_argument('--max_epsilon', type=float, default=None)
     parser.add_argument('--logdir', default=None)
+    parser.add_argument('--accountant', default="rdp", choices=["rdp", "pld"])
     args = parser.parse_args()
     main(**vars(args))
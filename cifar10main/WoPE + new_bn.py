@@ -19,7 +19,9 @@ from opacus.utils import module_modification
 
 from gradient_utils import get_first_batch_data, prune_grad_percentage, copy_model, prune_grad_val, trunc_grad, normalize_grad
 from gradient_utils import model_mix, model_momemtum_mix, dot_product, recompute_bn_gradient, generate_mask, multiply_mask
+from augment_utils import get_augmented_loaders
 from mix_data_utils import mixup_data, mixup_public_data, mixup_criterion
+from flat_mix import ModelMixer
 
 model_names = sorted(name for name in resnet.__dict__
                      if name.islower() and not name.startswith("__")
@@ -58,6 +60,10 @@ use_prune_after_norm = False
 prune_percentage_2 = 0
 use_public_mask = False
 mask_percentage = 90
+# mix only the unmasked entries (see ModelMixer.set_mask). Without a mixer seed only the
+# unmasked entries draw an alpha, so the results differ from the dense-mask mixing; the
+# dense masks are still built for multiply_mask, so this does not save mask memory here.
+sparse_mask = False
 
 use_prune = False  # prune per sample gradient before adding them
 prune_percentage = 0
@@ -110,6 +116,8 @@ parser.add_argument('--pretrained', dest='pretrained', action='store_true', help
 
 parser.add_argument('--half', dest='half', action='store_true',
                     help='use half-precision(16-bit) ')
+parser.add_argument('--batch-augment', dest='batch_augment', action='store_true',
+                    help='augment whole batches on the training device instead of per sample in DataLoader workers')
 parser.add_argument('--save-dir', dest='save_dir',
                     help='The directory used to save the trained models',
                     default='save_temp', type=str)
@@ -166,7 +174,17 @@ def main():
     normalize = transforms.Normalize(mean=[0.485, 0.456, 0.406],
                                      std=[0.229, 0.224, 0.225])
 
-    if use_SVHN:
+    if args.batch_augment:
+        if use_SVHN:
+            train_loader, val_loader = get_augmented_loaders(
+                'svhn', args.batch_size, 1000, device=device)
+        elif use_CIFAR10:
+            train_loader, val_loader = get_augmented_loaders(
+                'cifar10', batch_select, 2000, device=device)
+        elif use_FMNIST:
+            train_loader, val_loader = get_augmented_loaders(
+                'fmnist', batch_select, 2000, device=device)
+    elif use_SVHN:
         train_loader = torch.utils.data.DataLoader(
             datasets.SVHN(root='./data', split='train', transform=transforms.Compose([
                 transforms.RandomHorizontalFlip(),
@@ -233,6 +251,9 @@ def main():
         model.half()
         criterion.half()
 
+    # ModelMix over flat parameter buffers, replaces gradient_utils.model_mix
+    mixer = ModelMixer(model, model2) if use_mix else None
+
     optimizer = torch.optim.SGD(model.parameters(), args.lr,
                                 momentum=args.momentum,
                                 weight_decay=args.weight_decay)
@@ -279,8 +300,8 @@ def main():
         # train for one epoch
         print('current lr {:.5e}'.format(optimizer.param_groups[0]['lr']))
 
-        train(train_loader, model, model2, store_model, criterion, optimizer, optimizer2, public_input, public_target,
-              epoch, norm_vec, var_vec)
+        train(train_loader, model, model2, store_model, mixer, criterion, optimizer, optimizer2, public_input,
+              public_target, epoch, norm_vec, var_vec)
         if compute_varmean:
             print("norm vector: ", norm_vec)
             print("variance vector: ", var_vec)
@@ -313,7 +334,7 @@ def main():
     print("accuracy list: ", acc_vec)
 
 
-def train(train_loader, model, model2, store_model, criterion,
+def train(train_loader, model, model2, store_model, mixer, criterion,
           optimizer, optimizer2, public_input, public_target, epoch, norm_vec, var_vec):
     """
         Run one train epoch
@@ -364,6 +385,8 @@ def train(train_loader, model, model2, store_model, criterion,
                     public_input, public_target, mask_percentage)
             else:
                 mask = {}
+            if mixer is not None:
+                mixer.set_mask(mask, sparse=sparse_mask)
 
         '''
         if math.floor(i / true_batch) % 2 == 0:
@@ -489,11 +512,11 @@ def train(train_loader, model, model2, store_model, criterion,
 
             if use_mix:
                 # model_mix(temp_model, temp_model2, tau)
-                item_net_dict = copy.deepcopy(temp_model.state_dict())
+                mixer.snapshot()
                 tau = lr_temp * gap_rate
-                model_mix(temp_model, temp_model2, tau, mask)
+                mixer.mix(tau)
                 #model_momemtum_mix(temp_model, temp_model2, tau, mask)
-                temp_model2.load_state_dict(item_net_dict)
+                mixer.swap_anchor()
 
             temp_optimizer.step()
 
@@ -0,0 +1,157 @@
+import numpy as np
+import torch
+import torchvision.datasets as datasets
+
+# Batched data augmentation.
+#
+# The torchvision path decodes, flips, crops and normalizes every sample in a
+# DataLoader worker and collates the results, which makes the data loading of
+# the small ResNets bound by per-sample Python overhead. Here the whole uint8
+# dataset is kept as one [N, C, H, W] tensor (on the training device if
+# wanted), and every batch is augmented at once: the random flip and pad-crop
+# of the batch are a single gather, followed by the normalization.
+#
+# The randomness of a batch is drawn from a generator seeded with
+# (seed, epoch, batch index), so runs are reproducible and do not depend on
+# the device the augmentation runs on.
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+
+def dataset_tensors(dataset):
+    # the images of a torchvision dataset as a uint8 [N, C, H, W] tensor, and its labels
+    data = dataset.data
+    if not torch.is_tensor(data):
+        data = torch.from_numpy(np.asarray(data))
+    if data.dim() == 3:
+        # grayscale, e.g. FashionMNIST
+        data = data.unsqueeze(1)
+    elif not isinstance(dataset, datasets.SVHN):
+        # CIFAR10 stores NHWC images, SVHN NCHW ones
+        data = data.permute(0, 3, 1, 2)
+    targets = dataset.labels if isinstance(dataset, datasets.SVHN) else dataset.targets
+    return data.contiguous(), torch.as_tensor(targets, dtype=torch.long)
+
+
+def batch_seed(*keys):
+    # a 63-bit seed mixing the integers `keys`
+    seed = 0
+    for key in keys:
+        seed = (seed * 1000003 + key) % (1 << 63)
+    return seed
+
+
+def augment_batch(images, generator=None, flip=True, crop=32, padding=4, mean=None, std=None):
+    # randomly flip, zero-pad by `padding` and randomly crop to `crop`x`crop`,
+    # then normalize, a uint8 [B, C, H, W] batch.
+    # The flip and crop offsets are drawn on the CPU from `generator` and the
+    # batch is transformed on its own device.
+    dev = images.device
+    batch_size, _, height, width = images.shape
+    if padding > 0:
+        images = torch.nn.functional.pad(images, (padding, padding, padding, padding))
+
+    offset_y = torch.randint(height + 2 * padding - crop + 1, (batch_size, 1), generator=generator)
+    offset_x = torch.randint(width + 2 * padding - crop + 1, (batch_size, 1), generator=generator)
+    cols = torch.arange(crop)
+    if flip:
+        # crop-then-flip has the same distribution as flip-then-crop
+        flipped = torch.rand(batch_size, 1, generator=generator) < 0.5
+        cols = torch.where(flipped, crop - 1 - cols, cols)
+    rows = (offset_y + torch.arange(crop)).to(dev)
+    cols = (offset_x + cols).to(dev)
+
+    # [B, crop, crop, C] -> [B, C, crop, crop]
+    index = torch.arange(batch_size, device=dev)
+    images = images[index[:, None, None], :, rows[:, :, None], cols[:, None, :]]
+    images = images.permute(0, 3, 1, 2).float().div_(255)
+
+    if mean is not None:
+        # not in-place: a 3-channel normalization also expands grayscale images
+        mean = torch.as_tensor(mean, dtype=images.dtype, device=dev).view(1, -1, 1, 1)
+        std = torch.as_tensor(std, dtype=images.dtype, device=dev).view(1, -1, 1, 1)
+        images = (images - mean) / std
+    return images.contiguous()
+
+
+class AugmentedBatchLoader(object):
+    # iterates over the (input, target) batches of a torchvision image dataset,
+    # like a DataLoader with the RandomHorizontalFlip, RandomCrop, ToTensor and
+    # Normalize transforms, but augmenting whole batches (see `augment_batch`).
+    # With `augment=False` only ToTensor and Normalize are applied, as for the
+    # validation data. Every pass over the loader starts a new epoch.
+
+    def __init__(self, dataset, batch_size, shuffle=True, augment=True, crop=32, padding=4,
+                 mean=IMAGENET_MEAN, std=IMAGENET_STD, device=None, seed=0, drop_last=False):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.augment = augment
+        self.crop = crop
+        self.padding = padding
+        self.mean = mean
+        self.std = std
+        self.device = torch.device(device) if device is not None else torch.device("cpu")
+        self.seed = seed
+        self.drop_last = drop_last
+        self.epoch = 0
+
+        self.data, self.targets = dataset_tensors(dataset)
+        self.data = self.data.to(self.device)
+        self.targets = self.targets.to(self.device)
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.targets) // self.batch_size
+        return (len(self.targets) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        epoch = self.epoch
+        self.epoch += 1
+        num_samples = len(self.targets)
+        if self.shuffle:
+            generator = torch.Generator().manual_seed(batch_seed(self.seed, epoch))
+            order = torch.randperm(num_samples, generator=generator).to(self.device)
+        else:
+            order = None
+
+        for i in range(len(self)):
+            start = i * self.batch_size
+            end = min(start + self.batch_size, num_samples)
+            if order is None:
+                images, target = self.data[start:end], self.targets[start:end]
+            else:
+                indices = order[start:end]
+                images, target = self.data[indices], self.targets[indices]
+
+            if self.augment:
+                generator = torch.Generator().manual_seed(batch_seed(self.seed, epoch, i))
+                images = augment_batch(images, generator, flip=True, crop=self.crop,
+                                       padding=self.padding, mean=self.mean, std=self.std)
+            else:
+                images = augment_batch(images, flip=False, crop=images.shape[-1], padding=0,
+                                       mean=self.mean, std=self.std)
+            yield images, target
+
+
+def get_augmented_loaders(name, batch_size, val_batch_size, device=None, root='./data', seed=0):
+    # train and validation loaders of "svhn", "cifar10" or "fmnist", with the
+    # augmentation of the training scripts done by `AugmentedBatchLoader`
+    if name == "svhn":
+        train_set = datasets.SVHN(root=root, split='train', download=True)
+        val_set = datasets.SVHN(root=root, split='test', download=True)
+    elif name == "cifar10":
+        train_set = datasets.CIFAR10(root=root, train=True, download=True)
+        val_set = datasets.CIFAR10(root=root, train=False)
+    elif name == "fmnist":
+        train_set = datasets.FashionMNIST(root=root, train=True, download=True)
+        val_set = datasets.FashionMNIST(root=root, train=False)
+    else:
+        raise ValueError(f"unknown dataset {name}")
+
+    train_loader = AugmentedBatchLoader(train_set, batch_size, shuffle=True, augment=True,
+                                        device=device, seed=seed)
+    val_loader = AugmentedBatchLoader(val_set, val_batch_size, shuffle=False, augment=False,
+                                      device=device, seed=seed)
+    return train_loader, val_loader
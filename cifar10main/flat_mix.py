@@ -0,0 +1,382 @@
+import torch
+
+
+def bind_parameters(params, flat):
+    # make every parameter a view into `flat` (parameters keep their identity,
+    # so optimizers, hooks and GradSampleModule still see the same objects)
+    offset = 0
+    for p in params:
+        n = p.numel()
+        p.data = flat[offset:offset + n].view_as(p)
+        offset += n
+    assert offset == flat.numel()
+
+
+def flatten_parameters(params):
+    # move a list of parameters into one contiguous buffer and return the buffer
+    params = list(params)
+    if len(params) == 0:
+        raise ValueError("no parameters to flatten")
+    dtype, device = params[0].dtype, params[0].device
+    for p in params:
+        if p.dtype != dtype or p.device != device:
+            raise ValueError(f"all parameters must share one dtype and device, "
+                             f"got {p.dtype} on {p.device} and {dtype} on {device}")
+
+    flat = torch.empty(sum(p.numel() for p in params), dtype=dtype, device=device)
+    offset = 0
+    for p in params:
+        n = p.numel()
+        flat[offset:offset + n].copy_(p.data.reshape(-1))
+        offset += n
+    bind_parameters(params, flat)
+    return flat
+
+
+_MASK32 = 0xFFFFFFFF
+
+
+def _lowbias32(x):
+    # 32-bit integer hash (lowbias32 by C. Wellons) on a python int
+    x ^= x >> 16
+    x = (x * 0x7feb352d) & _MASK32
+    x ^= x >> 15
+    x = (x * 0x846ca68b) & _MASK32
+    x ^= x >> 16
+    return x
+
+
+def _lowbias32_(x, tmp):
+    # same hash, in place on an int64 tensor holding 32-bit values. int64
+    # products may wrap around, the low 32 bits are still exact
+    torch.bitwise_right_shift(x, 16, out=tmp)
+    x.bitwise_xor_(tmp)
+    x.mul_(0x7feb352d).bitwise_and_(_MASK32)
+    torch.bitwise_right_shift(x, 15, out=tmp)
+    x.bitwise_xor_(tmp)
+    x.mul_(0x846ca68b).bitwise_and_(_MASK32)
+    torch.bitwise_right_shift(x, 16, out=tmp)
+    x.bitwise_xor_(tmp)
+
+
+def counter_keys(seed, step):
+    # two 32-bit keys derived from (seed, step)
+    seed = (seed ^ (seed >> 32)) & _MASK32
+    k0 = _lowbias32(seed ^ _lowbias32((step + 0x9e3779b9) & _MASK32))
+    k1 = _lowbias32(k0 ^ 0x85ebca6b)
+    return k0, k1
+
+
+def counter_uniform_(out, seed, step, offset, scratch=None, index=None):
+    """
+    Fill `out` with uniform [0, 1) values that are a pure function of
+    (seed, step, offset + i) for element i: no generator state is involved,
+    so any slice of the sequence can be produced on its own, in any order and
+    on any device, with identical results. If `index` is given, element i
+    gets the value at position offset + index[i] instead. `scratch` is an
+    optional pair of int64 tensors with at least out.numel() elements.
+    """
+    n = out.numel()
+    if scratch is None:
+        x = torch.empty(n, dtype=torch.int64, device=out.device)
+        tmp = torch.empty_like(x)
+    else:
+        x, tmp = scratch[0][:n], scratch[1][:n]
+    k0, k1 = counter_keys(seed, step)
+    if index is None:
+        torch.arange(offset, offset + n, out=x)
+    else:
+        x.copy_(index).add_(offset)
+    x.bitwise_and_(_MASK32).bitwise_xor_(k0)
+    _lowbias32_(x, tmp)
+    x.bitwise_xor_(k1)
+    _lowbias32_(x, tmp)
+    # top 24 bits -> [0, 1), exact in float32
+    x.bitwise_right_shift_(8)
+    torch.mul(x, 2.0 ** -24, out=out.view(-1))
+    return out
+
+
+class ModelMixer(object):
+    """
+    ModelMix over flat parameter buffers.
+
+    The parameters of `model` and `model2` are moved into two contiguous buffers
+    (the parameters become views into them), and the tau gap-widening, the sign
+    computation and the random convex combination run as a few in-place ops over
+    those buffers, with scratch space allocated once. There is no deepcopy and no
+    load_state_dict.
+
+    With the default arguments, `mix(tau)` gives bit-identical results to
+    `gradient_utils.model_mix(model, model2, tau, mask, train_fc_only)` for the
+    same RNG state (alpha is still drawn from the default CPU generator, in
+    parameter order). The other arguments cover the variants inlined in the
+    training scripts:
+
+        skip_bn: do not mix parameters whose name contains "bn"
+        zero_sign_to_one: treat sign(model - model2) == 0 as +1 when widening
+            the gap (train_utils_mix.train)
+        alpha_on_anchor: if True the result is (1 - alpha) * model + alpha * model2,
+            otherwise alpha * model + (1 - alpha) * model2
+        seed: if given, alpha is not drawn from the torch generator but derived
+            from (seed, step, element index) by `counter_uniform_`, and the mix
+            runs over chunks of `chunk_size` elements. Only chunk-sized scratch
+            is allocated and a full-size alpha never exists. `step` counts the
+            calls to `mix()`; set it to resume a run reproducibly
+
+    `set_mask(mask, sparse=True)` keeps only the (sorted) flat indices of the
+    mixed entries, and the convex combination gathers, mixes and scatters
+    those entries only, so its cost and the mask memory scale with the mask
+    density (alpha_on_anchor must be True). The gap widening still covers
+    every entry, as in model_mix. With a seed the result is identical to the
+    dense mask; with the torch generator only the selected entries draw an
+    alpha, so the random stream differs from the dense path.
+
+    The mixer also manages model2 as the ModelMix anchor ("previous model"):
+    `update_anchor()` copies model into model2 with a single copy_, and
+    `snapshot()` + `swap_anchor()` make model2 the model as it was at the time
+    of the snapshot (one copy_ into a spare bank, then the banks are swapped).
+
+    The mixer must be created after the models have been moved to their device
+    (and converted to half precision, if any): `model.cuda()` afterwards would
+    replace the parameter storage and detach it from the flat buffers.
+    """
+
+    def __init__(self, model, model2, train_fc_only=False, skip_bn=False,
+                 zero_sign_to_one=False, alpha_on_anchor=True, seed=None,
+                 chunk_size=1 << 18):
+        named = dict(model.named_parameters())
+        named2 = dict(model2.named_parameters())
+        if list(named.keys()) != list(named2.keys()):
+            raise ValueError("model and model2 must have the same parameters")
+
+        def is_mixed(name):
+            if train_fc_only and "linear" not in name:
+                return False
+            if skip_bn and "bn" in name:
+                return False
+            return True
+
+        # mixed parameters go first, so that the mixed region is a prefix of the buffers
+        mixed = [name for name in named if is_mixed(name)]
+        self.names = mixed + [name for name in named if not is_mixed(name)]
+        self.numels = [named[name].numel() for name in self.names]
+        self.num_mixed = sum(named[name].numel() for name in mixed)
+
+        self.flat = flatten_parameters(named[name] for name in self.names)
+        self.params2 = [named2[name] for name in self.names]
+        self.flat2 = flatten_parameters(self.params2)
+        if self.flat.device != self.flat2.device:
+            raise ValueError("model1 and model2 are not on the same device!")
+
+        # buffers (e.g. BatchNorm running stats) are not mixed but follow the anchor
+        buffers2 = dict(model2.named_buffers())
+        self.buffers = [(buf, buffers2[name]) for name, buf in model.named_buffers()]
+        self._spare = None
+        self._spare_buffers = None
+
+        self.zero_sign_to_one = zero_sign_to_one
+        self.alpha_on_anchor = alpha_on_anchor
+        self.seed = seed
+        self.step = 0
+
+        n = self.num_mixed
+        if seed is not None:
+            n = min(n, chunk_size)
+            self.chunk_size = chunk_size
+            self._counter = (torch.empty(n, dtype=torch.int64, device=self.flat.device),
+                             torch.empty(n, dtype=torch.int64, device=self.flat.device))
+        else:
+            self.chunk_size = max(n, 1)
+        self._diff = self.flat.new_empty(n)
+        self._gap = self.flat.new_empty(n)
+        self._alpha = self.flat.new_empty(n)
+        # alpha is drawn on the CPU like torch.rand(shape).cuda(dev) does
+        if seed is not None:
+            self._rand = None
+        elif self._alpha.device.type == "cpu" and self._alpha.dtype == torch.get_default_dtype():
+            self._rand = self._alpha
+        else:
+            self._rand = torch.empty(n, pin_memory=self._alpha.is_cuda)
+        self._mask = None
+        self._has_mask = False
+        self._index = None
+        self._sparse = None
+
+    def set_mask(self, mask, sparse=False):
+        # mask: {name: 0/1 tensor} as returned by gradient_utils.generate_mask;
+        # where the mask is 0 alpha is 0, i.e. the entry is not mixed. Masks
+        # given as flat index tensors (generate_mask(..., as_indices=True))
+        # always select the sparse mode
+        self._index = None
+        if not mask:
+            self._has_mask = False
+            return
+        if sparse or any(not m.is_floating_point() for m in mask.values()):
+            self._set_sparse_mask(mask)
+            return
+        if self._mask is None:
+            self._mask = self.flat.new_empty(self.num_mixed)
+        self._mask.fill_(1)
+        offset = 0
+        for name, n in zip(self.names, self.numels):
+            if offset >= self.num_mixed:
+                break
+            if name in mask:
+                self._mask[offset:offset + n].copy_(mask[name].reshape(-1))
+            offset += n
+        self._has_mask = True
+
+    def _set_sparse_mask(self, mask):
+        if not self.alpha_on_anchor:
+            # masked entries would have to be overwritten with model2
+            raise ValueError("sparse masks need alpha_on_anchor=True")
+        self._mask = None
+        self._has_mask = False
+        index = []
+        offset = 0
+        for name, n in zip(self.names, self.numels):
+            if offset >= self.num_mixed:
+                break
+            if name not in mask:
+                idx = torch.arange(n, device=self.flat.device)
+            elif mask[name].is_floating_point():
+                idx = torch.nonzero(mask[name].reshape(-1)).squeeze(1)
+            else:
+                idx = mask[name].to(self.flat.device, torch.int64)
+            index.append(idx + offset)
+            offset += n
+        self._index = torch.cat(index)
+
+        # position of each chunk in the index list, and the largest chunk
+        starts = torch.arange(0, self.num_mixed + self.chunk_size, self.chunk_size,
+                              device=self.flat.device)
+        self._bounds = torch.searchsorted(self._index, starts).tolist()
+        k = max((e - s for s, e in zip(self._bounds[:-1], self._bounds[1:])), default=0)
+        if self._sparse is None or self._sparse[0].numel() < k:
+            # (model entries, model2 entries, alpha, CPU alpha)
+            self._sparse = [self.flat.new_empty(k) for _ in range(3)]
+            if self.seed is not None:
+                self._sparse.append(None)
+            elif self.flat.device.type == "cpu" and self.flat.dtype == torch.get_default_dtype():
+                self._sparse.append(self._sparse[2])
+            else:
+                self._sparse.append(torch.empty(k, pin_memory=self.flat.is_cuda))
+
+    @torch.no_grad()
+    def mix(self, tau):
+        for chunk, lo in enumerate(range(0, self.num_mixed, self.chunk_size)):
+            self._mix_range(chunk, lo, min(lo + self.chunk_size, self.num_mixed), tau)
+        self.step += 1
+
+    def _mix_range(self, chunk, lo, hi, tau):
+        a = self.flat[lo:hi]
+        b = self.flat2[lo:hi]
+        n = hi - lo
+        diff, gap, alpha = self._diff[:n], self._gap[:n], self._alpha[:n]
+
+        # widen the gap between the two models to at least tau. Where the gap
+        # is already >= tau the update below is exactly 0, so the per-tensor
+        # `torch.min(gap_opr) < tau` test of model_mix is not needed
+        torch.sub(a, b, out=diff)
+        torch.abs(diff, out=gap)
+        gap.clamp_(min=0, max=tau).neg_().add_(tau)
+        diff.sign_()
+        if self.zero_sign_to_one:
+            # {-1, 0, 1} -> {-1, 1, 1}
+            diff.add_(0.5).sign_()
+        gap.mul_(diff).div_(2)
+        a.add_(gap)
+        b.sub_(gap)
+
+        if self._index is not None:
+            self._mix_sparse(self._index[self._bounds[chunk]:self._bounds[chunk + 1]])
+            return
+
+        # random convex combination of the two models
+        if self.seed is not None:
+            counter_uniform_(alpha, self.seed, self.step, lo, self._counter)
+        else:
+            self._rand.uniform_()
+            if alpha is not self._rand:
+                alpha.copy_(self._rand)
+        if self._has_mask:
+            alpha.mul_(self._mask[lo:hi])
+        if self.alpha_on_anchor:
+            torch.mul(alpha, b, out=gap)
+            alpha.neg_().add_(1)
+        else:
+            torch.neg(alpha, out=gap).add_(1).mul_(b)
+        a.mul_(alpha).add_(gap)
+
+    def _mix_sparse(self, index):
+        # random convex combination of the entries at `index` only
+        k = index.numel()
+        a, b, alpha, rand = [t[:k] if t is not None else None for t in self._sparse]
+        torch.index_select(self.flat, 0, index, out=a)
+        torch.index_select(self.flat2, 0, index, out=b)
+        if self.seed is not None:
+            counter_uniform_(alpha, self.seed, self.step, 0, self._counter, index=index)
+        else:
+            rand.uniform_()
+            if alpha is not rand:
+                alpha.copy_(rand)
+        b.mul_(alpha)
+        alpha.neg_().add_(1)
+        a.mul_(alpha).add_(b)
+        self.flat.index_copy_(0, index, a)
+
+    @torch.no_grad()
+    def update_anchor(self):
+        # model2 <- model
+        self.flat2.copy_(self.flat)
+        for buf, buf2 in self.buffers:
+            buf2.copy_(buf)
+
+    @torch.no_grad()
+    def snapshot(self):
+        # save model into the spare bank, to become the anchor at `swap_anchor()`
+        if self._spare is None:
+            self._spare = torch.empty_like(self.flat2)
+            self._spare_buffers = [buf.clone() for buf, _ in self.buffers]
+        self._spare.copy_(self.flat)
+        for (buf, _), spare in zip(self.buffers, self._spare_buffers):
+            spare.copy_(buf)
+
+    @torch.no_grad()
+    def swap_anchor(self):
+        # model2 <- model as of the last `snapshot()`, by swapping banks (no copy)
+        if self._spare is None:
+            raise ValueError("swap_anchor called before snapshot")
+        self.flat2, self._spare = self._spare, self.flat2
+        bind_parameters(self.params2, self.flat2)
+        for (_, buf2), spare in zip(self.buffers, self._spare_buffers):
+            buf2.copy_(spare)
+
+
+if __name__ == "__main__":
+    # CPU benchmark: generator-drawn alpha vs counter-based alpha
+    import sys
+    import time
+
+    numel = int(sys.argv[1]) if len(sys.argv) > 1 else 1 << 24
+    reps = 10
+
+    def make_models():
+        torch.manual_seed(0)
+        return torch.nn.Linear(numel, 1, bias=False), torch.nn.Linear(numel, 1, bias=False)
+
+    for name, kwargs in [("generator", {}), ("counter", {"seed": 0})]:
+        model, model2 = make_models()
+        mixer = ModelMixer(model, model2, **kwargs)
+        tensors = [mixer._diff, mixer._gap, mixer._alpha] + list(getattr(mixer, "_counter", ()))
+        if mixer._rand is not None and mixer._rand is not mixer._alpha:
+            tensors.append(mixer._rand)
+        scratch = sum(t.numel() * t.element_size() for t in tensors)
+        mixer.mix(0.1)
+        start = time.perf_counter()
+        for _ in range(reps):
+            mixer.mix(0.1)
+        elapsed = (time.perf_counter() - start) / reps
+        print(f"{name:>9}: {elapsed * 1e3:8.2f} ms/mix, scratch {scratch / 2 ** 20:8.2f} MiB "
+              f"({numel} parameters)")
@@ -64,7 +64,9 @@ def normalize_grad(model, clip_norm):
             param.grad /= sum_norm / clip_norm
 
 
-def generate_mask(model, optimizer, criterion, inputs, targets, mask_percentage):
+def generate_mask(model, optimizer, criterion, inputs, targets, mask_percentage, as_indices=False):
+    # as_indices: return the flat indices of the 1 entries of every mask
+    # instead of dense 0/1 tensors (for ModelMixer.set_mask)
     dev = next(model.parameters()).device
     all_param = torch.empty(0).cuda(dev)
     outputs = model(inputs)
@@ -78,6 +80,9 @@ def generate_mask(model, optimizer, criterion, inputs, targets, mask_percentage)
     percentile_value = np.percentile(all_param.cpu().numpy(), mask_percentage)
     for name, param in model.named_parameters():
         # if "bn" in name or linear" in name: continue
+        if as_indices:
+            mask[name] = torch.nonzero(param.grad.abs().reshape(-1) >= percentile_value).squeeze(1)
+            continue
         mask[name] = torch.where(param.grad.abs() < torch.tensor(percentile_value).cuda(dev),
                                  torch.tensor(0.0).cuda(dev), torch.tensor(1.0).cuda(dev))
     return mask
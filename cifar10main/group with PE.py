@@ -23,7 +23,9 @@ from resnet import BasicCNN
 from gradient_utils import get_first_batch_data, prune_grad_percentage, copy_model, prune_grad_val, trunc_grad, \
     normalize_grad
 from gradient_utils import model_mix, dot_product, recompute_bn_gradient, generate_mask, multiply_mask
+from augment_utils import get_augmented_loaders
 from mix_data_utils import mixup_data, mixup_public_data, mixup_criterion
+from flat_mix import ModelMixer
 
 model_names = sorted(name for name in resnet.__dict__
                      if name.islower() and not name.startswith("__")
@@ -54,7 +56,9 @@ clip_norm = 8
 
 use_group = False
 small_batch = 1
-small_batch_num = int(batch_select / small_batch)
+# write the per-sample gradients of each batch into buffers allocated once for batch_select samples
+use_grad_sample_arena = False
+use_flat_grad_sample = False  # lay these buffers out as one [batch, params] matrix (needs use_grad_sample_arena)
 
 print_detail_norm = False
 
@@ -117,6 +121,8 @@ parser.add_argument('-e', '--evaluate', dest='evaluate', action='store_true',
 # parser.add_argument('--pretrained', dest='pretrained', action='store_true',  help='use pre-trained model')
 parser.add_argument('--half', dest='half', action='store_true',
                     help='use half-precision(16-bit) ')
+parser.add_argument('--batch-augment', dest='batch_augment', action='store_true',
+                    help='augment whole batches on the training device instead of per sample in DataLoader workers')
 parser.add_argument('--save-dir', dest='save_dir',
                     help='The directory used to save the trained models',
                     default='save_temp', type=str)
@@ -171,7 +177,17 @@ def main():
     normalize = transforms.Normalize(mean=[0.485, 0.456, 0.406],
                                      std=[0.229, 0.224, 0.225])
 
-    if use_SVHN:
+    if args.batch_augment:
+        if use_SVHN:
+            train_loader, val_loader = get_augmented_loaders(
+                'svhn', args.batch_size, 1000, device=device)
+        elif use_CIFAR10:
+            train_loader, val_loader = get_augmented_loaders(
+                'cifar10', batch_select, 2000, device=device)
+        elif use_FMNIST:
+            train_loader, val_loader = get_augmented_loaders(
+                'fmnist', batch_select, 2000, device=device)
+    elif use_SVHN:
         train_loader = torch.utils.data.DataLoader(
             datasets.SVHN(root='./data', split='train', transform=transforms.Compose([
                 transforms.RandomHorizontalFlip(),
@@ -236,11 +252,17 @@ def main():
         model2.half()
         criterion.half()
 
+    # model2 is the ModelMix anchor; both models now live in flat buffers
+    mixer = ModelMixer(model, model2, skip_bn=True, alpha_on_anchor=False)
+
     optimizer = torch.optim.SGD(model.parameters(), args.lr,
                                 momentum=args.momentum,
                                 weight_decay=args.weight_decay)
     privacy_engine = PrivacyEngine(model, batch_size=batch_select, sample_size=len(train_loader.dataset),
-                                   alphas=range(2, 32), noise_multiplier=noise_scale, max_grad_norm=clip_norm)
+                                   alphas=range(2, 32), noise_multiplier=noise_scale, max_grad_norm=clip_norm,
+                                   group_size=small_batch if use_group else None,
+                                   grad_sample_capacity=batch_select if use_grad_sample_arena else None,
+                                   flat_grad_sample=use_flat_grad_sample)
     privacy_engine.attach(optimizer)
     lr_scheduler = torch.optim.lr_scheduler.MultiStepLR(optimizer, milestones=[100,150], last_epoch=args.start_epoch - 1)
     lr_scheduler = torch.optim.lr_scheduler.ExponentialLR(optimizer, gamma=0.994, last_epoch=args.start_epoch - 1)
@@ -297,7 +319,7 @@ def main():
         # noise_scale = 0.005
         # clip_norm = 8
 
-        train(train_loader, model, model2, criterion, optimizer, epoch, norm_vec, var_vec)
+        train(train_loader, model, model2, mixer, criterion, optimizer, epoch, norm_vec, var_vec)
         print("norm vector: ", norm_vec)
         print("variance vector: ", var_vec)
         lr_scheduler.step()
@@ -326,7 +348,11 @@ def main():
     print("accuracy list: ", acc_vec)
 
 
-def calc_persample_norm(model):
+def calc_persample_norm(model, grad_sample_module=None):
+    # with use_flat_grad_sample, the per-sample gradients are the rows of one matrix
+    flat = getattr(grad_sample_module, "grad_sample_flat", None)
+    if flat is not None:
+        return flat[:batch_select].norm(2, -1)
     sum_norms = torch.zeros(batch_select).cuda(device)
     for name, param in model.named_parameters():
         norms = param.grad_sample.view(len(param.grad_sample), -1).norm(2, -1)
@@ -377,27 +403,6 @@ def print_var_mean(model):
     return (torch.sqrt(mean_norm).item(), torch.sqrt(var_norm).item())
 
 
-def model_mix(model, model2, tau):
-    temp_dict = copy.deepcopy(model.state_dict())
-    temp_dict2 = copy.deepcopy(model2.state_dict())
-    for name, param in model.named_parameters():
-        if "bn" in name or name not in temp_dict.keys():
-            continue
-        dictShape = temp_dict[name].shape
-        gap_opr = torch.abs(temp_dict[name] - temp_dict2[name])
-        if torch.min(gap_opr) < tau:
-            gap_opr = torch.clamp(gap_opr, min=0, max=tau)
-            gap_opr = torch.add(-gap_opr, tau)
-            sign_opr = torch.sign(temp_dict[name] - temp_dict2[name])
-            temp_dict[name] += gap_opr * sign_opr / 2
-            temp_dict2[name] -= gap_opr * sign_opr / 2
-
-        oness = torch.ones(dictShape).cuda(device)
-        alpha1 = torch.rand(dictShape).cuda(device)
-        temp_dict[name] = alpha1 * temp_dict[name] + (oness - alpha1) * temp_dict2[name]
-    model.load_state_dict(temp_dict)
-
-
 def model_mix2(model, model2, tau, mask={}):
     temp_dict = model.state_dict()
     temp_dict2 = model2.state_dict()
@@ -424,7 +429,7 @@ def model_mix2(model, model2, tau, mask={}):
     model.load_state_dict(temp_dict)
 
 
-def train(train_loader, model, model2, criterion, optimizer, epoch, norm_vec, var_vec):
+def train(train_loader, model, model2, mixer, criterion, optimizer, epoch, norm_vec, var_vec):
     """
         Run one train epoch
     """
@@ -448,6 +453,8 @@ def train(train_loader, model, model2, criterion, optimizer, epoch, norm_vec, va
     store_grad = {}
     loss_val = 0
     norms_list = []
+    # drop the clipped gradients of an incomplete true batch of the previous epoch
+    optimizer.zero_grad()
 
     # loss_val, norm_val, norm_times = 0, 0, 0
     for i, (input, target) in enumerate(train_loader):
@@ -479,7 +486,8 @@ def train(train_loader, model, model2, criterion, optimizer, epoch, norm_vec, va
         # temp_model.eval()
         output = temp_model(input_var)
         loss = criterion(output, target_var)
-        temp_optimizer.zero_grad()
+        # the engine's zero_grad would also drop the clipped gradients accumulated over the true batch
+        temp_optimizer.original_zero_grad()
         loss.backward()
 
         if (i + 1) % true_batch == 0:
@@ -491,54 +499,44 @@ def train(train_loader, model, model2, criterion, optimizer, epoch, norm_vec, va
             # norm_times += 1
 
         if print_detail_norm and i > 0 and i % (args.print_freq * 2) == 0:
+            sum_norms = calc_persample_norm(temp_model, temp_optimizer.privacy_engine.module)
             print("per sample mean: ", average_norm)
             print("per sample median: ", sum_norms.median())
             print("per sample max: ", sum_norms.max())
             print("true grad norm: ", calc_real_norm(temp_model) / batch_select)
 
-        grad_sample_list = {}
-        if use_group:
-            multiply_matrix = torch.zeros(small_batch_num, batch_select).cuda(device)
-            for j in range(batch_select):
-                multiply_matrix[int(j / small_batch)][j] = 1 / torch.tensor(small_batch)
-            for name, param in temp_model.named_parameters():
-                grad_sample_list[name] = torch.einsum('ij, j...->i...', multiply_matrix, param.grad_sample)
-        else:
-            for name, param in temp_model.named_parameters():
-                grad_sample_list[name] = param.grad_sample
-
         if use_norm:
-            sum_norms = calc_persample_norm_list(grad_sample_list)
-            sum_norms = torch.clamp(sum_norms, min=clip_norm)
-            clip_factor = clip_norm / sum_norms
-
-            for name, param in temp_model.named_parameters():
-                if name not in store_grad:
-                    store_grad[name] = torch.einsum("i,i...", clip_factor, grad_sample_list[name]) / sum_norms.shape[0]
-                else:
-                    store_grad[name] += torch.einsum("i,i...", clip_factor, grad_sample_list[name]) / sum_norms.shape[0]
+            # the engine's clipper averages the groups of small_batch samples (group_size),
+            # clips them and accumulates them over the true batch
+            temp_optimizer.virtual_step()
         else:
             for name, param in temp_model.named_parameters():
-                list_size = grad_sample_list[name].shape[0]
+                list_size = param.grad_sample.shape[0]
                 if name not in store_grad:
-                    store_grad[name] = grad_sample_list[name].sum(0).squeeze() / list_size
+                    store_grad[name] = param.grad_sample.sum(0).squeeze() / list_size
                 else:
-                    store_grad[name] += grad_sample_list[name].sum(0).squeeze() / list_size
+                    store_grad[name] += param.grad_sample.sum(0).squeeze() / list_size
+                del param.grad_sample
 
         if (i + 1) % true_batch == 0:
             if use_mix:
-                model_mix(temp_model, temp_model2, tau)
+                mixer.mix(tau)
 
+            if use_norm:
+                # .grad is the mean of the clipped gradients of the true batch
+                temp_optimizer.privacy_engine.clipper.pre_step()
             for name, param in temp_model.named_parameters():
                 if clip_type == 2.0:
                     noise = torch.randn(param.grad.shape).cuda(device)
                 if clip_type == 1.0:
                     laplace_dist = torch.distributions.laplace.Laplace(0, 1)
                     noise = laplace_dist.sample(param.grad.shape).cuda(device)
-                param.grad = store_grad[name] / true_batch + noise * noise_scale
+                if use_norm:
+                    param.grad += noise * noise_scale
+                else:
+                    param.grad = store_grad[name] / true_batch + noise * noise_scale
 
-            temp_dict = copy.deepcopy(temp_model.state_dict())
-            temp_model2.load_state_dict(temp_dict)
+            mixer.update_anchor()
             # temp_optimizer.step()
             store_grad = {}
             temp_optimizer.original_step()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+
+r"""
+Calibration of the noise multiplier of DP-SGD to a target privacy budget.
+
+The epsilon spent by DP-SGD decreases with the noise multiplier ``sigma``, and
+``log(epsilon)`` is close to linear in ``log(sigma)``. The noise multiplier that
+meets a target epsilon is thus found with Brent's method on
+``log(epsilon) - log(target_epsilon)`` as a function of ``log(sigma)``, which
+converges in a handful of evaluations of the privacy accountant.
+
+Three things keep repeated calibrations cheap:
+
+* the RDP curves of the Sampled Gaussian Mechanism are memoized on
+  ``(sample_rate, sigma, orders)`` in an LRU cache (see ``rdp_curve``);
+* every solution is recorded by the ``NoiseCalibrator``, and the next search
+  starts from the closest recorded solution, in a narrow bracket around it;
+* ``NoiseCalibrator.calibrate_grid`` solves a whole grid of
+  ``(target_epsilon, sample_rate, steps)`` targets, in an order where
+  consecutive targets are neighbours.
+
+Example:
+    >>> orders = [1 + x / 10.0 for x in range(1, 100)] + list(range(12, 64))
+    >>> sigma = calibrate_noise_multiplier(
+    ...     target_epsilon=3.0, target_delta=1e-5, sample_rate=0.01, steps=5000,
+    ...     orders=orders,
+    ... )
+
+"""
+
+import math
+from functools import lru_cache
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import optimize
+
+from . import privacy_analysis
+
+
+# epsilons are clipped to this range before taking their log
+_MIN_EPSILON = 1e-300
+_MAX_EPSILON = 1e300
+
+# half-width of the initial bracket around a warm start, in log(sigma)
+_WARM_STEP = math.log(1.05)
+
+
+@lru_cache(maxsize=4096)
+def _rdp_curve(q: float, sigma: float, orders: Tuple[float, ...]) -> np.ndarray:
+    rdp = privacy_analysis.compute_rdp(q, sigma, 1, list(orders))
+    rdp.flags.writeable = False
+    return rdp
+
+
+def rdp_curve(q: float, sigma: float, orders: Sequence[float]) -> np.ndarray:
+    r"""
+    RDP of one step of the Sampled Gaussian Mechanism at all ``orders``, memoized
+    on ``(q, sigma, orders)`` in an LRU cache. The returned array is read-only.
+
+    Args:
+        q: Sampling rate of SGM.
+        sigma: The standard deviation of the additive Gaussian noise.
+        orders: The orders at which RDP is computed.
+
+    Returns:
+        The RDP guarantees of one step at all ``orders``.
+    """
+    return _rdp_curve(float(q), float(sigma), tuple(float(o) for o in orders))
+
+
+def get_epsilon(
+    sample_rate: float,
+    sigma: float,
+    steps: float,
+    orders: Sequence[float],
+    target_delta: float,
+    rdp_init: float = 0,
+) -> float:
+    r"""
+    Epsilon spent after ``steps`` steps of DP-SGD, at ``target_delta``.
+
+    Args:
+        sample_rate: The sampling rate (usually batch_size / n_data)
+        sigma: The noise multiplier
+        steps: The number of steps
+        orders: The list of orders at which to compute RDP
+        target_delta: The privacy budget's delta
+        rdp_init: RDP already spent before these steps, at all ``orders``
+
+    Returns:
+        The privacy budget's epsilon
+    """
+    rdp = rdp_init + rdp_curve(sample_rate, sigma, orders) * steps
+    return privacy_analysis.get_privacy_spent(orders, rdp, target_delta)[0]
+
+
+def find_noise_multiplier(
+    eps_fn: Callable[[float], float],
+    target_epsilon: float,
+    sigma_guess: float = 1.0,
+    sigma_min: float = 0.01,
+    sigma_max: float = 2000.0,
+    rtol: float = 1e-4,
+) -> float:
+    r"""
+    Finds the smallest noise multiplier, up to a relative tolerance ``rtol``,
+    whose epsilon is at most ``target_epsilon``.
+
+    The search brackets the solution starting from ``sigma_guess`` (the closer the
+    guess, the narrower the bracket) and then runs Brent's method on
+    ``log(eps_fn(sigma))`` against ``log(sigma)``.
+
+    Args:
+        eps_fn: Function returning the epsilon spent with a given noise multiplier;
+            it must be non-increasing
+        target_epsilon: The privacy budget's epsilon
+        sigma_guess: Starting point of the search
+        sigma_min: Smallest noise multiplier returned
+        sigma_max: Largest noise multiplier searched
+        rtol: Relative tolerance on the noise multiplier
+
+    Returns:
+        The noise multiplier; its epsilon is at most ``target_epsilon``, unless
+        it is ``sigma_min``.
+
+    Raises:
+        ValueError
+            If even ``sigma_max`` spends more than ``target_epsilon``.
+    """
+
+    def f(log_sigma: float) -> float:
+        eps = min(max(eps_fn(math.exp(log_sigma)), _MIN_EPSILON), _MAX_EPSILON)
+        return math.log(eps) - math.log(target_epsilon)
+
+    log_min, log_max = math.log(sigma_min), math.log(sigma_max)
+    lo = hi = min(max(math.log(sigma_guess), log_min), log_max)
+    f_lo = f_hi = f(lo)
+    step = _WARM_STEP
+    if f_hi > 0:
+        # not enough noise: move the bracket up
+        while f_hi > 0:
+            if hi >= log_max:
+                raise ValueError("The privacy budget is too low.")
+            lo, f_lo = hi, f_hi
+            hi = min(hi + step, log_max)
+            f_hi = f(hi)
+            step *= 2
+    else:
+        # enough noise: move the bracket down
+        while f_lo <= 0:
+            if lo <= log_min:
+                return sigma_min
+            hi, f_hi = lo, f_lo
+            lo = max(lo - step, log_min)
+            f_lo = f(lo)
+            step *= 2
+
+    if f_hi == 0:
+        return math.exp(hi)
+    root = optimize.brentq(f, lo, hi, xtol=rtol)
+    # the root is within rtol of the solution, on either side of it
+    for log_sigma in (root, root + rtol):
+        if log_sigma < hi and f(log_sigma) <= 0:
+            return math.exp(log_sigma)
+    return math.exp(hi)
+
+
+class NoiseCalibrator:
+    r"""
+    Calibrates noise multipliers to target privacy budgets, warm-starting every
+    search from the closest solution found so far.
+
+    Solutions are grouped in families of comparable problems (e.g. the same
+    accountant, ``delta`` and orders), and located in a family by a point of
+    coordinates such as ``(log(sample_rate), log(steps), log(target_epsilon))``.
+    """
+
+    def __init__(
+        self, sigma_min: float = 0.01, sigma_max: float = 2000.0, rtol: float = 1e-4
+    ):
+        r"""
+        Args:
+            sigma_min: Smallest noise multiplier returned
+            sigma_max: Largest noise multiplier searched
+            rtol: Relative tolerance on the noise multipliers
+        """
+        self.sigma_min = sigma_min
+        self.sigma_max = sigma_max
+        self.rtol = rtol
+        self.solutions: Dict[Hashable, List[Tuple[np.ndarray, float]]] = {}
+
+    def warm_start(self, family: Hashable, point: Sequence[float]) -> Optional[float]:
+        r"""
+        Returns the recorded solution of ``family`` closest to ``point``, if any.
+        """
+        solutions = self.solutions.get(family)
+        if not solutions:
+            return None
+        point = np.asarray(point, dtype=float)
+        distances = [np.abs(p - point).sum() for p, _ in solutions]
+        return solutions[int(np.argmin(distances))][1]
+
+    def solve(
+        self,
+        eps_fn: Callable[[float], float],
+        target_epsilon: float,
+        family: Hashable,
+        point: Sequence[float],
+        sigma_min: Optional[float] = None,
+        sigma_guess: float = 1.0,
+    ) -> float:
+        r"""
+        Finds the noise multiplier meeting ``target_epsilon`` with
+        ``find_noise_multiplier``, warm-started from the closest solution of
+        ``family``, and records the result at ``point``.
+
+        Args:
+            eps_fn: Function returning the epsilon spent with a given noise multiplier
+            target_epsilon: The privacy budget's epsilon
+            family: Key of the family of comparable problems
+            point: Coordinates of this problem in its family
+            sigma_min: Overrides the calibrator's smallest noise multiplier
+            sigma_guess: Starting point of the search if ``family`` has no solution
+
+        Returns:
+            The noise multiplier
+        """
+        warm_start = self.warm_start(family, point)
+        sigma = find_noise_multiplier(
+            eps_fn,
+            target_epsilon,
+            sigma_guess=sigma_guess if warm_start is None else warm_start,
+            sigma_min=self.sigma_min if sigma_min is None else sigma_min,
+            sigma_max=self.sigma_max,
+            rtol=self.rtol,
+        )
+        self.solutions.setdefault(family, []).append(
+            (np.asarray(point, dtype=float), sigma)
+        )
+        return sigma
+
+    def calibrate(
+        self,
+        target_epsilon: float,
+        target_delta: float,
+        sample_rate: float,
+        steps: float,
+        orders: Sequence[float],
+        rdp_init: float = 0,
+        sigma_min: Optional[float] = None,
+        sigma_guess: float = 1.0,
+    ) -> float:
+        r"""
+        Computes the noise multiplier to reach a total budget of
+        (target_epsilon, target_delta) after ``steps`` steps of DP-SGD with the
+        RDP accountant.
+
+        Args:
+            target_epsilon: The privacy budget's epsilon
+            target_delta: The privacy budget's delta
+            sample_rate: The sampling rate (usually batch_size / n_data)
+            steps: The number of steps
+            orders: The list of orders at which to compute RDP
+            rdp_init: RDP already spent before these steps, at all ``orders``
+            sigma_min: Overrides the calibrator's smallest noise multiplier
+            sigma_guess: Starting point of the search if no similar target was
+                calibrated before
+
+        Returns:
+            The noise multiplier
+        """
+        orders = tuple(float(o) for o in orders)
+
+        def eps_fn(sigma: float) -> float:
+            return get_epsilon(sample_rate, sigma, steps, orders, target_delta, rdp_init)
+
+        return self.solve(
+            eps_fn,
+            target_epsilon,
+            family=("rdp", target_delta, orders),
+            point=(math.log(sample_rate), math.log(steps), math.log(target_epsilon)),
+            sigma_min=sigma_min,
+            sigma_guess=sigma_guess,
+        )
+
+    def calibrate_grid(
+        self,
+        targets: Iterable[Tuple[float, float, float]],
+        target_delta: float,
+        orders: Sequence[float],
+    ) -> List[float]:
+        r"""
+        Calibrates the noise multipliers of a grid of targets in one call.
+
+        The targets are solved sorted by steps, sample rate and epsilon, so that
+        every search is warm-started from a neighbour.
+
+        Args:
+            targets: ``(target_epsilon, sample_rate, steps)`` triples
+            target_delta: The privacy budget's delta
+            orders: The list of orders at which to compute RDP
+
+        Returns:
+            The noise multipliers, in the order of ``targets``
+        """
+        targets = list(targets)
+        sigmas = [0.0] * len(targets)
+        for k in sorted(range(len(targets)), key=lambda k: targets[k][::-1]):
+            target_epsilon, sample_rate, steps = targets[k]
+            sigmas[k] = self.calibrate(
+                target_epsilon, target_delta, sample_rate, steps, orders
+            )
+        return sigmas
+
+
+_calibrator = NoiseCalibrator()
+
+
+def calibrate_noise_multiplier(
+    target_epsilon: float,
+    target_delta: float,
+    sample_rate: float,
+    steps: float,
+    orders: Sequence[float],
+    rdp_init: float = 0,
+) -> float:
+    r"""
+    ``NoiseCalibrator.calibrate`` on the calibrator shared by the whole process.
+    """
+    return _calibrator.calibrate(
+        target_epsilon, target_delta, sample_rate, steps, orders, rdp_init
+    )
+
+
+def calibrate_noise_multipliers(
+    targets: Iterable[Tuple[float, float, float]],
+    target_delta: float,
+    orders: Sequence[float],
+) -> List[float]:
+    r"""
+    ``NoiseCalibrator.calibrate_grid`` on the calibrator shared by the whole process.
+    """
+    return _calibrator.calibrate_grid(targets, target_delta, orders)
+
+
+def get_calibrator() -> NoiseCalibrator:
+    r"""
+    Returns the calibrator shared by the whole process.
+    """
+    return _calibrator
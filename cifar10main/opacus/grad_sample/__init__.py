@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 
-from .conv import compute_conv_grad_sample  # noqa
+from .conv import compute_conv_grad_norm, compute_conv_grad_sample  # noqa
 from .dp_multihead_attention import compute_sequence_bias_grad_sample  # noqa
 from .dp_rnn import compute_rnn_linear_grad_sample  # noqa
 from .embedding import compute_embedding_grad_sample  # noqa
@@ -9,17 +9,25 @@ from .grad_sample_module import GradSampleModule
 from .group_norm import compute_group_norm_grad_sample  # noqa
 from .instance_norm import compute_instance_norm_grad_sample  # noqa
 from .layer_norm import compute_layer_norm_grad_sample  # noqa
-from .linear import compute_linear_grad_sample  # noqa
+from .linear import compute_linear_grad_norm, compute_linear_grad_sample  # noqa
+from .planner import GHOST, MATERIALIZE, LayerNormPlan
 from .utils import (
     create_or_accumulate_grad_sample,
     create_or_extend_grad_sample,
+    create_or_extend_grad_sample_norm,
+    register_ghost_sampler,
     register_grad_sampler,
 )
 
 
 __all__ = [
     "GradSampleModule",
+    "LayerNormPlan",
+    "GHOST",
+    "MATERIALIZE",
     "register_grad_sampler",
     "create_or_accumulate_grad_sample",
     "create_or_extend_grad_sample",
+    "create_or_extend_grad_sample_norm",
+    "register_ghost_sampler",
 ]
@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 
-from typing import Union
+from typing import Dict, Tuple, Union
 
 import numpy as np
 import torch
 import torch.nn as nn
 from opacus.utils.tensor_utils import unfold3d
 
-from .utils import create_or_extend_grad_sample, register_grad_sampler
+from .planner import MATERIALIZE
+from .utils import (
+    create_or_extend_grad_sample,
+    create_or_extend_grad_sample_norm,
+    register_ghost_sampler,
+    register_grad_sampler,
+)
 
 
 @register_grad_sampler([nn.Conv1d, nn.Conv2d, nn.Conv3d])
@@ -78,3 +84,100 @@ def compute_conv_grad_sample(
 
     if layer.bias is not None:
         create_or_extend_grad_sample(layer.bias, torch.sum(B, dim=2), batch_dim)
+
+
+def _unfold_conv2d(
+    layer: nn.Conv2d, A: torch.Tensor, B: torch.Tensor
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Unfolds the activations and backprops of a ``nn.Conv2d`` layer to shapes
+    ``[n, groups, p, q]`` and ``[n, groups, o, q]``, with p=(num_in_channels/groups)*kernel_sz,
+    o=num_out_channels/groups and q the number of output positions
+    """
+    n = A.shape[0]
+    A = torch.nn.functional.unfold(
+        A,
+        layer.kernel_size,
+        padding=layer.padding,
+        stride=layer.stride,
+        dilation=layer.dilation,
+    )
+    A = A.reshape(n, layer.groups, -1, A.shape[-1])
+    B = B.reshape(n, layer.groups, -1, A.shape[-1])
+    return A, B
+
+
+def compute_conv_weighted_sum(
+    layer: nn.Conv2d,
+    A: torch.Tensor,
+    B: torch.Tensor,
+    weights: Dict[str, torch.Tensor],
+) -> Dict[str, torch.Tensor]:
+    """
+    Computes the sum of the per sample gradients of a ``nn.Conv2d`` layer weighted
+    by ``weights``, without materializing them
+
+    Args:
+        layer: Layer
+        A: Activations
+        B: Backpropagations
+        weights: Per sample weights, by parameter name
+    """
+    sums = {}
+    if "weight" in weights:
+        A_unfolded, B_unfolded = _unfold_conv2d(layer, A, B)
+        grad = torch.einsum(
+            "n,ngoq,ngpq->gop", weights["weight"], B_unfolded, A_unfolded
+        )
+        sums["weight"] = grad.reshape(layer.weight.shape)
+    if "bias" in weights:
+        sums["bias"] = torch.einsum("n,no...->o", weights["bias"], B)
+    return sums
+
+
+def compute_conv_norm_costs(
+    layer: nn.Conv2d, A: torch.Tensor, B: torch.Tensor
+) -> Tuple[int, int]:
+    """
+    Per sample sizes of the Gram matrices (T x T for T output positions, for every
+    group) and of the weight gradient of a ``nn.Conv2d`` layer
+    """
+    positions = B[0, 0].numel()
+    return layer.groups * positions * positions, layer.weight.numel()
+
+
+@register_ghost_sampler(nn.Conv2d, compute_conv_weighted_sum, compute_conv_norm_costs)
+def compute_conv_grad_norm(
+    layer: nn.Conv2d, A: torch.Tensor, B: torch.Tensor, strategy: str
+) -> None:
+    """
+    Computes per sample gradient norms for ``nn.Conv2d`` layer, without
+    keeping the per sample gradients
+
+    Args:
+        layer: Layer
+        A: Activations
+        B: Backpropagations
+        strategy: ``"ghost"`` or ``"materialize"``
+    """
+    if layer.weight.requires_grad:
+        A_unfolded, B_unfolded = _unfold_conv2d(layer, A, B)
+        if strategy == MATERIALIZE:
+            grad_sample = torch.einsum("ngoq,ngpq->ngop", B_unfolded, A_unfolded)
+            norms = grad_sample.reshape(len(grad_sample), -1).norm(2, dim=1)
+        else:
+            # ||B A^T||^2 = sum_{q,q'} (A^T A)_{qq'} (B^T B)_{qq'}, for every group
+            norms = (
+                (
+                    torch.einsum("ngpq,ngpr->ngqr", A_unfolded, A_unfolded)
+                    * torch.einsum("ngoq,ngor->ngqr", B_unfolded, B_unfolded)
+                )
+                .sum(dim=(1, 2, 3))
+                .clamp(min=0)
+                .sqrt()
+            )
+        create_or_extend_grad_sample_norm(layer.weight, norms)
+    if layer.bias is not None and layer.bias.requires_grad:
+        create_or_extend_grad_sample_norm(
+            layer.bias, B.reshape(B.shape[0], B.shape[1], -1).sum(dim=2).norm(2, dim=1)
+        )
@@ -1,13 +1,15 @@
 #!/usr/bin/env python3
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 from functools import partial
-from typing import Iterable, List, Tuple
+from typing import Dict, Iterable, List, Tuple
 
 import torch
 import torch.nn as nn
 from opacus.layers.dp_rnn import DPRNNBase, DPRNNCellBase, RNNLinear
 from opacus.utils.module_inspection import requires_grad
 
+from .planner import LayerNormPlan, plan_layer
+
 
 class UnsupportedModuleError(ValueError):
     pass
@@ -16,16 +18,41 @@ class UnsupportedModuleError(ValueError):
 class GradSampleModule(nn.Module):
     r"""
     Extends nn.Module so that its parameter tensors have an extra field called .grad_sample.
+
+    With ``ghost_clipping=True``, the layers that have a ghost sampler (``nn.Linear`` and
+    ``nn.Conv2d``) do not get a ``.grad_sample``. Their parameters get a
+    ``.grad_sample_norm`` field with the per-sample gradient norms instead, computed from
+    the activations and backprops, which are kept until ``ghost_weighted_sums()`` turns
+    them into the weighted sum of the per-sample gradients. How the norms of each layer
+    are computed is decided on its first batch and recorded in ``norm_plan`` (see
+    :mod:`opacus.grad_sample.planner`); entries set before the first batch are kept.
     """
     GRAD_SAMPLERS = {}
+    GHOST_SAMPLERS = {}
 
-    def __init__(self, m: nn.Module, *, batch_first=True, loss_reduction="mean"):
+    def __init__(
+        self,
+        m: nn.Module,
+        *,
+        batch_first=True,
+        loss_reduction="mean",
+        ghost_clipping=False,
+        grad_sample_capacity=None,
+        flat_grad_sample=False,
+    ):
         super().__init__()
         self._module = m
         self.hooks_enabled = False
         self.batch_first = batch_first
         self.loss_reduction = loss_reduction
+        self.ghost_clipping = ghost_clipping
+        self.norm_plan: Dict[str, LayerNormPlan] = {}
+        self._module_names = {module: name for name, module in m.named_modules()}
+        self.grad_sample_flat = None
+        self.grad_sample_flat_params = []
         self.add_hooks(loss_reduction=loss_reduction, batch_first=batch_first)
+        if grad_sample_capacity is not None:
+            self.reserve_grad_sample(grad_sample_capacity, flat=flat_grad_sample)
 
     def forward(self, x):
         return self._module(x)
@@ -54,6 +81,134 @@ class GradSampleModule(nn.Module):
                     p.grad_sample.requires_grad_(False)
 
                 del p.grad_sample
+            if hasattr(p, "grad_sample_norm"):
+                del p.grad_sample_norm
+        for module in self._module.modules():
+            if hasattr(module, "ghost_inputs"):
+                del module.ghost_inputs
+
+    def reserve_grad_sample(self, capacity: int, flat: bool = False) -> None:
+        """
+        Preallocates, for every parameter that gets a ``.grad_sample``, an arena
+        (``param.grad_sample_arena``) with room for the per-sample gradients of
+        ``capacity`` samples, e.g. the virtual batch size when several mini-batches
+        are backpropagated before clipping. Each mini-batch is then written into the
+        next slice of the arena and ``.grad_sample`` is a view of the filled region,
+        instead of being concatenated with ``torch.cat``. The arenas are reused
+        across steps, so a ``.grad_sample`` must not be kept past ``zero_grad()``.
+        Batches that do not fit fall back to ``torch.cat``. Call it after moving
+        the model to its device.
+
+        With ``flat=True`` the arenas are column blocks of a single ``[capacity, P]``
+        buffer (``grad_sample_flat``, with ``P`` the total size of the parameters in
+        ``grad_sample_flat_params``), so that the per-sample gradients of a batch form
+        one matrix, which the clipper reduces in one pass.
+
+        Args:
+            capacity: Number of samples to reserve room for
+            flat: Whether to lay out all arenas in one buffer
+        """
+        self.release_grad_sample()
+        sampled = {
+            p
+            for module in self.trainable_modules()
+            if type(module) in self.GRAD_SAMPLERS
+            and not (self.ghost_clipping and type(module) in self.GHOST_SAMPLERS)
+            for p in module.parameters(recurse=False)
+        }
+        # in the order of self.parameters(), which is the order used by the clipper
+        params = [p for p in self.parameters() if p.requires_grad and p in sampled]
+
+        if not flat or len(params) == 0:
+            for p in params:
+                p.grad_sample_arena = torch.empty(
+                    (capacity,) + p.shape, dtype=p.dtype, device=p.device
+                )
+            return
+
+        if any(
+            p.dtype != params[0].dtype or p.device != params[0].device for p in params
+        ):
+            raise ValueError(
+                "A flat grad_sample needs all parameters to share one dtype and device"
+            )
+        self.grad_sample_flat = torch.empty(
+            capacity,
+            sum(p.numel() for p in params),
+            dtype=params[0].dtype,
+            device=params[0].device,
+        )
+        self.grad_sample_flat_params = params
+        for p, view in zip(params, self.flat_views(self.grad_sample_flat)):
+            p.grad_sample_arena = view
+
+    def flat_views(self, flat: torch.Tensor) -> List[torch.Tensor]:
+        """
+        Splits the last dimension of a tensor laid out like ``grad_sample_flat``
+        (``[..., P]``) into views shaped like the parameters of ``grad_sample_flat_params``.
+
+        Args:
+            flat: Tensor of shape ``[..., P]``
+
+        Returns:
+            The views, one per parameter
+        """
+        views = []
+        offset = 0
+        for p in self.grad_sample_flat_params:
+            n = p.numel()
+            views.append(flat[..., offset : offset + n].view(flat.shape[:-1] + p.shape))
+            offset += n
+        return views
+
+    def release_grad_sample(self) -> None:
+        """
+        Frees the arenas allocated by ``reserve_grad_sample()``.
+        """
+        for p in self.parameters():
+            if hasattr(p, "grad_sample_arena"):
+                del p.grad_sample_arena
+        self.grad_sample_flat = None
+        self.grad_sample_flat_params = []
+
+    def ghost_weighted_sums(
+        self, weights: Dict[torch.Tensor, torch.Tensor]
+    ) -> Dict[torch.Tensor, torch.Tensor]:
+        """
+        Computes the sums of the per-sample gradients of the ghost clipped parameters
+        weighted by per-sample factors, and releases the kept activations and backprops.
+
+        Args:
+            weights: Per-sample weights (tensors of shape ``[B]``), by parameter
+
+        Returns:
+            The weighted sums, by parameter
+        """
+        sums = {}
+        for module in self.trainable_modules():
+            if not hasattr(module, "ghost_inputs"):
+                continue
+            _, weighted_sum_fn, _ = self.GHOST_SAMPLERS[type(module)]
+            params = {
+                name: p
+                for name, p in module.named_parameters(recurse=False)
+                if p in weights
+            }
+            start = 0
+            for A, B in module.ghost_inputs:
+                n = A.shape[0]
+                module_sums = weighted_sum_fn(
+                    module,
+                    A,
+                    B,
+                    {name: weights[p][start : start + n] for name, p in params.items()},
+                )
+                for name, summed in module_sums.items():
+                    p = params[name]
+                    sums[p] = sums[p] + summed if p in sums else summed
+                start += n
+            del module.ghost_inputs
+        return sums
 
     def to_standard_module(self) -> nn.Module:
         """
@@ -167,6 +322,7 @@ class GradSampleModule(nn.Module):
 
     def _close(self):
         self.del_grad_sample()
+        self.release_grad_sample()
         self.remove_hooks()
 
     def capture_activations_hook(
@@ -205,8 +361,22 @@ class GradSampleModule(nn.Module):
         activations, backprops = self.rearrange_grad_samples(
             module, backprops, loss_reduction, batch_first
         )
-        grad_sampler_fn = self.GRAD_SAMPLERS[type(module)]
-        grad_sampler_fn(module, activations, backprops)
+        if self.ghost_clipping and type(module) in self.GHOST_SAMPLERS:
+            ghost_sampler_fn, _, costs_fn = self.GHOST_SAMPLERS[type(module)]
+            name = self._module_names[module]
+            if name not in self.norm_plan:
+                self.norm_plan[name] = plan_layer(
+                    costs_fn, module, activations, backprops
+                )
+            ghost_sampler_fn(
+                module, activations, backprops, self.norm_plan[name].strategy
+            )
+            if not hasattr(module, "ghost_inputs"):
+                module.ghost_inputs = []
+            module.ghost_inputs.append((activations, backprops))
+        else:
+            grad_sampler_fn = self.GRAD_SAMPLERS[type(module)]
+            grad_sampler_fn(module, activations, backprops)
 
         if (
             not isinstance(module.activations, list) or len(module.activations) == 0
@@ -1,10 +1,18 @@
 #!/usr/bin/env python3
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 
+from typing import Dict, Tuple
+
 import torch
 import torch.nn as nn
 
-from .utils import create_or_extend_grad_sample, register_grad_sampler
+from .planner import MATERIALIZE
+from .utils import (
+    create_or_extend_grad_sample,
+    create_or_extend_grad_sample_norm,
+    register_ghost_sampler,
+    register_grad_sampler,
+)
 
 
 @register_grad_sampler(nn.Linear)
@@ -29,3 +37,75 @@ def compute_linear_grad_sample(
             torch.einsum("n...k->nk", B),
             batch_dim,
         )
+
+
+def compute_linear_weighted_sum(
+    layer: nn.Linear,
+    A: torch.Tensor,
+    B: torch.Tensor,
+    weights: Dict[str, torch.Tensor],
+) -> Dict[str, torch.Tensor]:
+    """
+    Computes the sum of the per sample gradients of a ``nn.Linear`` layer weighted
+    by ``weights``, without materializing them
+
+    Args:
+        layer: Layer
+        A: Activations
+        B: Backpropagations
+        weights: Per sample weights, by parameter name
+    """
+    sums = {}
+    if "weight" in weights:
+        sums["weight"] = torch.einsum("n,n...i,n...j->ij", weights["weight"], B, A)
+    if "bias" in weights:
+        sums["bias"] = torch.einsum("n,n...k->k", weights["bias"], B)
+    return sums
+
+
+def compute_linear_norm_costs(
+    layer: nn.Linear, A: torch.Tensor, B: torch.Tensor
+) -> Tuple[int, int]:
+    """
+    Per sample sizes of the Gram matrix (T x T for T positions) and of the weight
+    gradient of a ``nn.Linear`` layer
+    """
+    positions = A[0].numel() // A.shape[-1]
+    return positions * positions, layer.weight.numel()
+
+
+@register_ghost_sampler(
+    nn.Linear, compute_linear_weighted_sum, compute_linear_norm_costs
+)
+def compute_linear_grad_norm(
+    layer: nn.Linear, A: torch.Tensor, B: torch.Tensor, strategy: str
+) -> None:
+    """
+    Computes per sample gradient norms for ``nn.Linear`` layer, without
+    keeping the per sample gradients
+
+    Args:
+        layer: Layer
+        A: Activations
+        B: Backpropagations
+        strategy: ``"ghost"`` or ``"materialize"``
+    """
+    n = A.shape[0]
+    A = A.reshape(n, -1, A.shape[-1])
+    B = B.reshape(n, -1, B.shape[-1])
+    if layer.weight.requires_grad:
+        if strategy == MATERIALIZE:
+            norms = torch.einsum("nti,ntj->nij", B, A).reshape(n, -1).norm(2, dim=1)
+        elif A.shape[1] == 1:
+            norms = A.norm(2, dim=(1, 2)) * B.norm(2, dim=(1, 2))
+        else:
+            # ||sum_t b_t a_t^T||^2 = sum_{t,s} (a_t . a_s) (b_t . b_s)
+            norms = (
+                (torch.bmm(A, A.transpose(1, 2)) * torch.bmm(B, B.transpose(1, 2)))
+                .sum(dim=(1, 2))
+                .clamp(min=0)
+                .sqrt()
+            )
+        create_or_extend_grad_sample_norm(layer.weight, norms)
+    if layer.bias is not None and layer.bias.requires_grad:
+        create_or_extend_grad_sample_norm(layer.bias, B.sum(dim=1).norm(2, dim=1))
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 
-from typing import Sequence, Type, Union
+from typing import Callable, Sequence, Type, Union
 
 import torch
 import torch.nn as nn
@@ -37,6 +37,46 @@ def register_grad_sampler(
     return decorator
 
 
+def register_ghost_sampler(
+    target_class_or_classes: Union[Type[nn.Module], Sequence[Type[nn.Module]]],
+    weighted_sum: Callable,
+    costs: Callable,
+):
+    """
+    Registers the decorated function as the ghost norm sampler of ``target_class_or_classes``,
+    used by ``GradSampleModule(..., ghost_clipping=True)`` instead of the ``grad_sampler``.
+    A ghost norm sampler stores the per-sample gradient norms of the layer parameters
+    in ``param.grad_sample_norm`` (see ``create_or_extend_grad_sample_norm``), with the
+    strategy planned for the layer (see :mod:`opacus.grad_sample.planner`), and
+    ``costs`` gives the costs of the two strategies. ``weighted_sum`` later computes
+    the sum of the per-sample gradients weighted by per-sample factors, from the same
+    activations and backprops:
+
+    >>> def compute_weighted_sum(module, activations, backprops, weights):
+    >>>    # weights: {param_name: tensor of shape [B]}
+    >>>    return {param_name: summed_grad}
+    >>>
+    >>> def compute_costs(module, activations, backprops):
+    >>>    return ghost_cost, materialize_cost
+    >>>
+    >>> @register_ghost_sampler(nn.MyCustomClass, compute_weighted_sum, compute_costs)
+    >>> def compute_grad_norm(module, activations, backprops, strategy):
+    >>>    pass
+    """
+
+    def decorator(f):
+        target_classes = (
+            target_class_or_classes
+            if isinstance(target_class_or_classes, Sequence)
+            else [target_class_or_classes]
+        )
+        for target_class in target_classes:
+            GradSampleModule.GHOST_SAMPLERS[target_class] = (f, weighted_sum, costs)
+        return f
+
+    return decorator
+
+
 def create_or_extend_grad_sample(
     param: torch.Tensor, grad_sample: torch.Tensor, batch_dim: int
 ) -> None:
@@ -44,6 +84,11 @@ def create_or_extend_grad_sample(
     Creates a ``grad_sample`` attribute in the given parameter, or appends to it
     if the ``grad_sample`` attribute already exists.
 
+    If the parameter has a ``grad_sample_arena`` (see
+    ``GradSampleModule.reserve_grad_sample``) with enough room left, the per-sample
+    gradients are written into it and ``grad_sample`` is a view of its filled
+    region, so that appending does not reallocate and copy the previous ones.
+
     Args:
         param: Parameter to which ``grad_sample`` will be added
         grad_sample: Per-sample gradients tensor. Must be of the same
@@ -52,6 +97,26 @@ def create_or_extend_grad_sample(
             ``grad_sample``
     """
 
+    arena = getattr(param, "grad_sample_arena", None)
+    if (
+        arena is not None
+        and batch_dim == 0
+        and grad_sample.shape[1:] == arena.shape[1:]
+        and grad_sample.dtype == arena.dtype
+        and grad_sample.device == arena.device
+    ):
+        if not hasattr(param, "grad_sample"):
+            start = 0
+        elif param.grad_sample.data_ptr() == arena.data_ptr():
+            start = param.grad_sample.shape[0]
+        else:
+            start = None  # grad_sample already outgrew the arena
+        if start is not None and start + grad_sample.shape[0] <= arena.shape[0]:
+            end = start + grad_sample.shape[0]
+            arena[start:end].copy_(grad_sample)
+            param.grad_sample = arena[:end]
+            return
+
     if hasattr(param, "grad_sample"):
         param.grad_sample = torch.cat((param.grad_sample, grad_sample), batch_dim)
     else:
@@ -81,3 +146,21 @@ def create_or_accumulate_grad_sample(
             dtype=grad_sample.dtype,
         )
         param.grad_sample[: grad_sample.shape[0]] = grad_sample
+
+
+def create_or_extend_grad_sample_norm(
+    param: torch.Tensor, norms: torch.Tensor
+) -> None:
+    """
+    Creates a ``grad_sample_norm`` attribute in the given parameter, or appends to it
+    if the ``grad_sample_norm`` attribute already exists.
+
+    Args:
+        param: Parameter to which ``grad_sample_norm`` will be added
+        norms: Per-sample gradient norms, tensor of shape ``[B]``
+    """
+
+    if hasattr(param, "grad_sample_norm"):
+        param.grad_sample_norm = torch.cat((param.grad_sample_norm, norms), 0)
+    else:
+        param.grad_sample_norm = norms
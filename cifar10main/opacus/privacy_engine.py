@@ -14,13 +14,14 @@ from opacus.utils.tensor_utils import calc_sample_norms_one_layer
 from scipy.stats import planck
 from torch import Tensor, nn
 
-from . import privacy_analysis
+from . import calibration, privacy_analysis
 from .dp_model_inspector import DPModelInspector
 from .layers.dp_ddp import (
     DifferentiallyPrivateDistributedDataParallel,
     average_gradients,
 )
 from .per_sample_gradient_clip import PerSampleGradientClipper
+from .privacy_ledger import PrivacyLedger
 from .utils import clipping
 
 
@@ -40,40 +41,33 @@ def get_noise_multiplier(
     Computes the noise level sigma to reach a total budget of (target_epsilon, target_delta)
     at the end of epochs, with a given sample_rate
 
+    The search is done by the calibrator shared by the whole process (see
+    ``opacus.calibration``), which memoizes RDP curves and warm-starts from the
+    closest noise level it has calibrated before.
+
     Args:
         target_epsilon: the privacy budget's epsilon
         target_delta: the privacy budget's delta
         sample_rate: the sampling rate (usually batch_size / n_data)
         epochs: the number of epochs to run
         alphas: the list of orders at which to compute RDP
+        sigma_min: the smallest noise level returned
+        sigma_max: the starting point of the search, if no similar budget was
+            calibrated before
 
     Returns:
         The noise level sigma to ensure privacy budget of (target_epsilon, target_delta)
 
     """
-    eps = float("inf")
-    while eps > target_epsilon:
-        sigma_max = 2 * sigma_max
-        rdp = privacy_analysis.compute_rdp(
-            sample_rate, sigma_max, epochs / sample_rate, alphas
-        )
-        eps = privacy_analysis.get_privacy_spent(alphas, rdp, target_delta)[0]
-        if sigma_max > 2000:
-            raise ValueError("The privacy budget is too low.")
-
-    while sigma_max - sigma_min > 0.01:
-        sigma = (sigma_min + sigma_max) / 2
-        rdp = privacy_analysis.compute_rdp(
-            sample_rate, sigma, epochs / sample_rate, alphas
-        )
-        eps = privacy_analysis.get_privacy_spent(alphas, rdp, target_delta)[0]
-
-        if eps < target_epsilon:
-            sigma_max = sigma
-        else:
-            sigma_min = sigma
-
-    return sigma
+    return calibration.get_calibrator().calibrate(
+        target_epsilon,
+        target_delta,
+        sample_rate,
+        epochs / sample_rate,
+        alphas,
+        sigma_min=sigma_min,
+        sigma_guess=sigma_max,
+    )
 
 
 class PrivacyEngine:
@@ -115,6 +109,11 @@ class PrivacyEngine:
         epochs: Optional[float] = None,
         loss_reduction: str = "mean",
         poisson: bool = False,
+        group_size: Optional[int] = None,
+        ghost_clipping: bool = False,
+        grad_sample_capacity: Optional[int] = None,
+        flat_grad_sample: bool = False,
+        accountant: str = "rdp",
         **misc_settings,
     ):
         r"""
@@ -137,16 +136,45 @@ class PrivacyEngine:
             target_delta: The target delta. If unset, we will set it for you.
             loss_reduction: Indicates if the loss reduction (for aggregating the gradients)
                 is a sum or a mean operation. Can take values "sum" or "mean"
+            group_size: If set, BatchClipping is used: the per-sample gradients are
+                averaged over contiguous groups of ``group_size`` samples and the
+                group means are clipped (see
+                :class:`~opacus.per_sample_gradient_clip.PerSampleGradientClipper`)
+            ghost_clipping: If on, ``nn.Linear`` and ``nn.Conv2d`` layers do not store
+                per-sample gradients: their per-sample gradient norms and clipped sums
+                are computed from the activations and backprops (see
+                :class:`~opacus.grad_sample.GradSampleModule`)
+            grad_sample_capacity: If set, the per-sample gradients are written into
+                arenas preallocated for this many samples (e.g. the virtual batch size)
+                instead of being grown with ``torch.cat`` (see
+                :meth:`~opacus.grad_sample.GradSampleModule.reserve_grad_sample`)
+            flat_grad_sample: If on (with ``grad_sample_capacity``), the arenas form a
+                single ``[B, P]`` matrix, so that flat clipping takes one norm reduction
+                and one matrix product per batch
+            accountant: The privacy accountant used by ``get_privacy_spent``: "rdp"
+                for RDP at ``alphas``, or "pld" for the privacy loss distribution
+                accountant (see :mod:`~opacus.pld_analysis`), capped by the RDP
+                epsilon at ``alphas``; it is usually tighter after many steps
             **misc_settings: Other arguments to the init
         """
 
+        if accountant not in ("rdp", "pld"):
+            raise ValueError(
+                f"Unknown accountant {accountant}. Expected one of 'rdp', 'pld'."
+            )
+
         self.steps = 0
+        self.accountant = accountant
         self.poisson = poisson
         self.loss_reduction = loss_reduction
         self.batch_size = batch_size
         self.sample_size = sample_size
         self.sample_rate = sample_rate
         self._set_sample_rate()
+        self.group_size = group_size
+        if group_size is not None and hasattr(self, "avg_batch_size"):
+            # with BatchClipping, gradients are averaged over the number of groups
+            self.avg_batch_size /= group_size
 
         if isinstance(
             module, DifferentiallyPrivateDistributedDataParallel
@@ -159,7 +187,12 @@ class PrivacyEngine:
             n_replicas = 1
 
         self.module = GradSampleModule(
-            module, batch_first=batch_first, loss_reduction=loss_reduction
+            module,
+            batch_first=batch_first,
+            loss_reduction=loss_reduction,
+            ghost_clipping=ghost_clipping,
+            grad_sample_capacity=grad_sample_capacity,
+            flat_grad_sample=flat_grad_sample,
         )
 
         if poisson:
@@ -197,6 +230,7 @@ class PrivacyEngine:
 
         self.device = next(module.parameters()).device
         self.steps = 0
+        self.ledger = PrivacyLedger()
 
         if self.noise_multiplier < 0:
             raise ValueError(
@@ -249,10 +283,18 @@ class PrivacyEngine:
     def state_dict(self):
         return {
             "steps": self.steps,
+            "ledger": self.ledger.state_dict(),
         }
 
     def load_state_dict(self, state_dict):
         self.steps = state_dict["steps"]
+        self.ledger = PrivacyLedger()
+        if "ledger" in state_dict:
+            self.ledger.load_state_dict(state_dict["ledger"])
+        else:
+            # checkpoints without a ledger get their steps recorded at the current
+            # sample rate and noise multiplier
+            self.ledger.record(self.sample_rate, self.noise_multiplier, self.steps)
 
     def detach(self):
         r"""
@@ -327,6 +369,7 @@ class PrivacyEngine:
             norm_clipper,
             self.batch_first,
             self.loss_reduction,
+            self.group_size,
         )
 
         if isinstance(self.module._module, torch.nn.parallel.DistributedDataParallel):
@@ -350,6 +393,10 @@ class PrivacyEngine:
             if hasattr(self.privacy_engine.module, "ddp_hooks"):
                 # We just update the accountant
                 self.privacy_engine.steps += 1
+                self.privacy_engine.ledger.record(
+                    self.privacy_engine.sample_rate,
+                    self.privacy_engine.noise_multiplier,
+                )
 
             else:
                 self.privacy_engine.step(is_empty)
@@ -424,7 +471,15 @@ class PrivacyEngine:
 
         This method converts from an (alpha, epsilon)-DP guarantee for all alphas that
         the ``PrivacyEngine`` was initialized with. It returns the optimal alpha together
-        with the best epsilon.
+        with the best epsilon. With the "pld" accountant, epsilon is read from the
+        privacy loss distribution of all the steps (and the returned alpha is NaN),
+        unless the RDP epsilon is smaller.
+
+        The steps are composed from ``self.ledger``, which records the sample rate
+        and noise multiplier of every step, so that they can change during training.
+        If ``self.steps`` was set by hand and no longer matches the ledger, the
+        first ``self.steps`` steps of the ledger are used, completed with steps at
+        the current sample rate and noise multiplier, and a warning is issued.
 
         Args:
             target_delta: The Target delta. If None, it will default to the privacy
@@ -439,11 +494,17 @@ class PrivacyEngine:
                     "If self.target_delta is not specified, target_delta should be set as argument to get_privacy_spent."
                 )
             target_delta = self.target_delta
-        rdp = self.get_renyi_divergence() * self.steps
-        eps, best_alpha = privacy_analysis.get_privacy_spent(
-            self.alphas, rdp, target_delta
-        )
-        return float(eps), float(best_alpha)
+        ledger = self.ledger
+        if self.steps != ledger.steps:
+            warnings.warn(
+                f"The privacy engine took {self.steps} steps but its ledger records "
+                f"{ledger.steps}. Computing the privacy spent by {self.steps} steps; "
+                f"record the steps in ``self.ledger`` instead of setting ``steps``."
+            )
+            ledger = ledger.with_steps(
+                self.steps, self.sample_rate, self.noise_multiplier
+            )
+        return ledger.get_privacy_spent(target_delta, self.alphas, self.accountant)
 
     def zero_grad(self):
         """
@@ -483,6 +544,7 @@ class PrivacyEngine:
 
         """
         self.steps += 1
+        self.ledger.record(self.sample_rate, self.noise_multiplier)
         if not is_empty:
             self.clipper.clip_and_accumulate()
             clip_values, batch_size = self.clipper.pre_step()
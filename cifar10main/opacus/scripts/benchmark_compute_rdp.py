@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+
+"""
+Command-line script comparing the RDP of the Sampled Gaussian Mechanism
+computed order by order with the vectorized computation over all orders
+used by :func:`~opacus.privacy_analysis.compute_rdp`.
+
+Example:
+
+    To call this script from command line, you can enter:
+
+    >>>  python benchmark_compute_rdp.py --reps 20
+
+    which prints the time per call of both computations, and their largest
+    difference, for a few sampling rates and noise multipliers.
+"""
+import argparse
+import time
+
+import numpy as np
+from opacus import privacy_analysis
+
+
+def benchmark(q: float, sigma: float, orders, reps: int):
+    """
+    Times the scalar and vectorized RDP computations.
+
+    Args:
+        q : The sampling rate
+        sigma : The noise multiplier
+        orders : The RDP orders
+        reps : The number of calls to average the time over
+
+    Returns:
+        The time per call of the scalar and vectorized computations, in seconds,
+        and the largest absolute difference of their results.
+    """
+    start = time.perf_counter()
+    for _ in range(reps):
+        scalar = [privacy_analysis._compute_rdp(q, sigma, order) for order in orders]
+    scalar_time = (time.perf_counter() - start) / reps
+
+    start = time.perf_counter()
+    for _ in range(reps):
+        vectorized = privacy_analysis._compute_rdp_orders(q, sigma, orders)
+    vectorized_time = (time.perf_counter() - start) / reps
+
+    error = np.max(np.abs(np.array(scalar) - vectorized))
+    return scalar_time, vectorized_time, error
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the scalar and vectorized RDP computations"
+    )
+    parser.add_argument(
+        "-r",
+        "--reps",
+        type=int,
+        default=20,
+        help="Number of calls to average the time over (default: 20)",
+    )
+    parser.add_argument(
+        "-a",
+        "--alphas",
+        action="store",
+        dest="alphas",
+        type=float,
+        nargs="+",
+        default=[1 + x / 10.0 for x in range(1, 100)] + list(range(12, 64)),
+        help="List of alpha values (alpha orders of Renyi-DP evaluation). "
+        "A default list is provided. Else, space separated numbers. E.g.,"
+        "-a 10 100",
+    )
+    args = parser.parse_args()
+
+    for q, sigma in [(256 / 50000, 1.1), (0.01, 0.7), (0.1, 3.0)]:
+        scalar_time, vectorized_time, error = benchmark(
+            q, sigma, args.alphas, args.reps
+        )
+        print(
+            f"q={q:.4f} sigma={sigma}: scalar {scalar_time * 1e3:7.2f} ms, "
+            f"vectorized {vectorized_time * 1e3:6.2f} ms "
+            f"({scalar_time / vectorized_time:5.1f}x), max abs diff {error:.1e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+import unittest
+
+from opacus import calibration
+from opacus.privacy_engine import DEFAULT_ALPHAS, get_noise_multiplier
+
+
+class Calibration_test(unittest.TestCase):
+    def setUp(self):
+        self.delta = 1e-5
+        self.calibrator = calibration.NoiseCalibrator()
+
+    def _epsilon(self, sigma, sample_rate, steps):
+        return calibration.get_epsilon(
+            sample_rate, sigma, steps, DEFAULT_ALPHAS, self.delta
+        )
+
+    def test_calibrate_meets_target(self):
+        for eps, sample_rate, steps in [(1.0, 0.01, 1000), (3.0, 256 / 50000, 7800)]:
+            sigma = self.calibrator.calibrate(
+                eps, self.delta, sample_rate, steps, DEFAULT_ALPHAS
+            )
+            self.assertLessEqual(self._epsilon(sigma, sample_rate, steps), eps)
+            # tight up to the tolerance of the search
+            self.assertGreater(self._epsilon(sigma * 0.999, sample_rate, steps), eps)
+
+    def test_calibrate_grid_matches_single_calls(self):
+        targets = [
+            (eps, sample_rate, steps)
+            for eps in (1.0, 4.0)
+            for sample_rate in (0.004, 0.02)
+            for steps in (500, 5000)
+        ]
+        sigmas = self.calibrator.calibrate_grid(targets, self.delta, DEFAULT_ALPHAS)
+        for (eps, sample_rate, steps), sigma in zip(targets, sigmas):
+            expected = calibration.NoiseCalibrator().calibrate(
+                eps, self.delta, sample_rate, steps, DEFAULT_ALPHAS
+            )
+            self.assertAlmostEqual(sigma, expected, delta=2e-4 * expected)
+
+    def test_warm_start(self):
+        family = ("rdp", self.delta, tuple(DEFAULT_ALPHAS))
+        self.assertIsNone(self.calibrator.warm_start(family, (0, 0, 0)))
+        sigma = self.calibrator.calibrate(1.0, self.delta, 0.01, 1000, DEFAULT_ALPHAS)
+        self.assertEqual(self.calibrator.warm_start(family, (0, 0, 0)), sigma)
+
+    def test_rdp_curve_is_cached(self):
+        curve = calibration.rdp_curve(0.01, 1.234, DEFAULT_ALPHAS)
+        self.assertIs(calibration.rdp_curve(0.01, 1.234, DEFAULT_ALPHAS), curve)
+        self.assertFalse(curve.flags.writeable)
+
+    def test_privacy_budget_too_low(self):
+        with self.assertRaises(ValueError):
+            get_noise_multiplier(1e-6, self.delta, 0.5, 100, DEFAULT_ALPHAS)
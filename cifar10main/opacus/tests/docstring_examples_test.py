@@ -18,6 +18,7 @@ from opacus.utils.module_modification import (
 from opacus.utils.tensor_utils import (
     calc_sample_norms,
     calc_sample_norms_one_layer,
+    mean_over_batch_groups,
     sum_over_all_but_batch_and_last_n,
 )
 
@@ -179,6 +180,9 @@ class DocstringExamplesTest(unittest.TestCase):
             torch.Size([1, 4, 5]),
         )
 
+        tensor = torch.ones(10, 3)
+        self.assertEqual(mean_over_batch_groups(tensor, 4).shape, torch.Size([3, 3]))
+
     def test_stats_example(self):
         # IMPORTANT: When changing this code you also need to update
         # the docstrings for opacus.utils.stats.Stat
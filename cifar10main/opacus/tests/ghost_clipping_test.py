@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+import unittest
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from opacus import PerSampleGradientClipper
+from opacus.grad_sample import GHOST, MATERIALIZE, GradSampleModule
+from opacus.utils.clipping import ConstantFlatClipper, ConstantPerLayerClipper
+from opacus.utils.tensor_utils import calc_sample_norms_one_layer
+
+
+class SampleGhostNet(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv1 = nn.Conv2d(3, 8, 3, padding=1)
+        self.gn = nn.GroupNorm(2, 8)
+        self.conv2 = nn.Conv2d(8, 8, 3, stride=2, groups=2, bias=False)
+        self.fc1 = nn.Linear(7, 5)
+        self.fc2 = nn.Linear(8 * 7 * 5, 10)
+
+    def forward(self, x):
+        # x of shape [B, 3, 16, 16]
+        x = F.relu(self.gn(self.conv1(x)))  # -> [B, 8, 16, 16]
+        x = self.conv2(x)  # -> [B, 8, 7, 7]
+        x = x.view(x.shape[0], -1, x.shape[-1])  # -> [B, 56, 7]
+        x = self.fc1(x)  # -> [B, 56, 5]
+        return self.fc2(x.flatten(1))  # -> [B, 10]
+
+
+class GhostClipping_test(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = SampleGhostNet()
+        self.x = torch.randn(6, 3, 16, 16)
+        self.y = torch.randint(0, 10, (6,))
+        self.criterion = nn.CrossEntropyLoss()
+
+    def _grad_sample_module(self, ghost_clipping, strategy=None):
+        model = SampleGhostNet()
+        model.load_state_dict(self.model.state_dict())
+        model = GradSampleModule(model, ghost_clipping=ghost_clipping)
+        if strategy is not None:
+            # plan every layer on a first batch, then force the strategy
+            self.criterion(model(self.x), self.y).backward()
+            model.zero_grad()
+            for name, plan in model.norm_plan.items():
+                model.norm_plan[name] = plan._replace(strategy=strategy)
+        return model
+
+    def _clipped_grads(self, ghost_clipping, norm_clipper, n_batches=1, strategy=None):
+        model = self._grad_sample_module(ghost_clipping, strategy)
+        clipper = PerSampleGradientClipper(model, norm_clipper)
+        for _ in range(n_batches):
+            self.criterion(model(self.x), self.y).backward()
+        clipper.clip_and_accumulate()
+        clipper.pre_step()
+        return [p.grad for p in model.parameters()]
+
+    def test_plan(self):
+        model = self._grad_sample_module(ghost_clipping=True)
+        self.criterion(model(self.x), self.y).backward()
+        plan = model.norm_plan
+        self.assertEqual(set(plan), {"conv1", "conv2", "fc1", "fc2"})
+        # 16x16 output positions against a 8x3x3x3 weight
+        self.assertEqual(plan["conv1"].strategy, MATERIALIZE)
+        self.assertEqual(plan["conv1"].ghost_cost, 256 * 256)
+        self.assertEqual(plan["conv1"].materialize_cost, 8 * 3 * 3 * 3)
+        # no positions: the ghost norm is a product of two vector norms
+        self.assertEqual(plan["fc2"].strategy, GHOST)
+
+    def test_norms_match_grad_samples(self):
+        for strategy in (None, GHOST, MATERIALIZE):
+            model = self._grad_sample_module(ghost_clipping=False)
+            ghost_model = self._grad_sample_module(True, strategy)
+            for m in (model, ghost_model):
+                self.criterion(m(self.x), self.y).backward()
+
+            for (name, p), p_ghost in zip(
+                model.named_parameters(), ghost_model.parameters()
+            ):
+                if "gn" in name:
+                    self.assertTrue(hasattr(p_ghost, "grad_sample"))
+                    continue
+                self.assertFalse(hasattr(p_ghost, "grad_sample"))
+                self.assertTrue(
+                    torch.allclose(
+                        calc_sample_norms_one_layer(p.grad_sample),
+                        p_ghost.grad_sample_norm,
+                        rtol=1e-4,
+                        atol=1e-6,
+                    ),
+                    name,
+                )
+
+    def test_clipped_grads_match(self):
+        for norm_clipper in (
+            ConstantFlatClipper(0.01),
+            ConstantPerLayerClipper([0.01] * 9),
+        ):
+            for n_batches in (1, 2):
+                grads = self._clipped_grads(False, norm_clipper, n_batches)
+                for strategy in (None, GHOST):
+                    ghost_grads = self._clipped_grads(
+                        True, norm_clipper, n_batches, strategy
+                    )
+                    for g, g_ghost in zip(grads, ghost_grads):
+                        self.assertTrue(
+                            torch.allclose(g, g_ghost, rtol=1e-4, atol=1e-7)
+                        )
+
+    def test_zero_grad_releases_ghost_inputs(self):
+        model = self._grad_sample_module(ghost_clipping=True)
+        self.criterion(model(self.x), self.y).backward()
+        self.assertTrue(hasattr(model._module.fc1, "ghost_inputs"))
+        model.zero_grad()
+        self.assertFalse(hasattr(model._module.fc1, "ghost_inputs"))
+        self.assertFalse(hasattr(model._module.fc1.weight, "grad_sample_norm"))
+
+    def test_clipper_zero_grad_releases_ghost_inputs(self):
+        # backward, zero_grad (as called by the optimizer of a PrivacyEngine),
+        # backward, clip: only the second batch is clipped
+        model = self._grad_sample_module(ghost_clipping=True)
+        clipper = PerSampleGradientClipper(model, ConstantFlatClipper(0.01))
+        self.criterion(model(torch.randn(8, 3, 16, 16)), torch.randint(0, 10, (8,))).backward()
+        clipper.zero_grad()
+        self.assertFalse(hasattr(model._module.fc1, "ghost_inputs"))
+        self.criterion(model(self.x), self.y).backward()
+        clipper.clip_and_accumulate()
+        clipper.pre_step()
+
+        grads = self._clipped_grads(False, ConstantFlatClipper(0.01))
+        for p, g in zip(model.parameters(), grads):
+            self.assertTrue(torch.allclose(p.grad, g, rtol=1e-4, atol=1e-7))
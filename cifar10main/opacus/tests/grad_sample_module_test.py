@@ -159,3 +159,39 @@ class GradSampleModule_test(unittest.TestCase):
     def test_disable_hooks(self):
         self.grad_sample_module.disable_hooks()
         assert not self.grad_sample_module.hooks_enabled
+
+
+class GradSampleArena_test(unittest.TestCase):
+    def setUp(self):
+        self.original_model = nn.Sequential(nn.Linear(6, 5), nn.ReLU(), nn.Linear(5, 3))
+        self.x = torch.randn(4, 6)
+
+    def _grad_samples(self, n_batches, capacity=None):
+        model = nn.Sequential(nn.Linear(6, 5), nn.ReLU(), nn.Linear(5, 3))
+        model.load_state_dict(self.original_model.state_dict())
+        model = GradSampleModule(model, grad_sample_capacity=capacity)
+        for _ in range(n_batches):
+            model(self.x).sum().backward()
+        return model
+
+    def test_arena_matches_cat(self):
+        for n_batches in (1, 2, 3):
+            expected = self._grad_samples(n_batches)
+            # the third batch does not fit in the arena and falls back to torch.cat
+            model = self._grad_samples(n_batches, capacity=8)
+            for p_expected, p in zip(expected.parameters(), model.parameters()):
+                assert_allclose(p.grad_sample, p_expected.grad_sample)
+                self.assertEqual(
+                    p.grad_sample.data_ptr() == p.grad_sample_arena.data_ptr(),
+                    n_batches <= 2,
+                )
+
+    def test_arena_is_reused(self):
+        model = self._grad_samples(2, capacity=8)
+        arenas = [p.grad_sample_arena for p in model.parameters()]
+        model.zero_grad()
+        model(self.x).sum().backward()
+        for p, arena in zip(model.parameters(), arenas):
+            self.assertIs(p.grad_sample_arena, arena)
+            self.assertEqual(p.grad_sample.data_ptr(), arena.data_ptr())
+            self.assertEqual(p.grad_sample.shape[0], 4)
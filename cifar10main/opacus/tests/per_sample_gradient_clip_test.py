@@ -8,6 +8,7 @@ import torch.nn.functional as F
 from opacus import PerSampleGradientClipper
 from opacus.grad_sample import GradSampleModule
 from opacus.utils.clipping import ConstantFlatClipper, ConstantPerLayerClipper
+from opacus.utils.tensor_utils import calc_sample_norms, mean_over_batch_groups
 from torch.utils.data import DataLoader
 from torchvision import transforms
 from torchvision.datasets import FakeData
@@ -75,13 +76,22 @@ class PerSampleGradientClipper_test(unittest.TestCase):
             dim=-1,
         )
 
-    def setUp_clipped_model(self, clip_value=0.003, run_clipper_step=True):
+    def setUp_clipped_model(
+        self,
+        clip_value=0.003,
+        run_clipper_step=True,
+        group_size=None,
+        grad_sample_capacity=None,
+        flat_grad_sample=False,
+    ):
         # Deep copy
         self.clipped_model = SampleConvNet()  # create the structure
         self.clipped_model.load_state_dict(self.original_model.state_dict())  # fill it
 
         self.clipped_model = GradSampleModule(
-            self.clipped_model
+            self.clipped_model,
+            grad_sample_capacity=grad_sample_capacity,
+            flat_grad_sample=flat_grad_sample,
         )  # TODO change this as we refactor clipper
 
         # Intentionally clipping to a very small value
@@ -90,7 +100,9 @@ class PerSampleGradientClipper_test(unittest.TestCase):
             if not isinstance(clip_value, list)
             else ConstantPerLayerClipper(clip_value)
         )
-        self.clipper = PerSampleGradientClipper(self.clipped_model, norm_clipper)
+        self.clipper = PerSampleGradientClipper(
+            self.clipped_model, norm_clipper, group_size=group_size
+        )
 
         for x, y in self.dl:
             logits = self.clipped_model(x)
@@ -164,3 +176,91 @@ class PerSampleGradientClipper_test(unittest.TestCase):
         self.assertTrue(
             torch.allclose(self.original_grads_norms, self.clipped_grads_norms)
         )
+
+    def test_grouped_clipping_to_high_value_does_nothing(self):
+        # with equal groups, the mean of the group means is the batch mean
+        self.setUp_clipped_model(clip_value=9999, run_clipper_step=True, group_size=4)
+        self.assertTrue(
+            torch.allclose(self.original_grads_norms, self.clipped_grads_norms)
+        )
+
+    def test_grouped_clipping_ragged_groups(self):
+        clip_value = 0.003
+        group_size = [5] * 12 + [4]
+        model = SampleConvNet()
+        model.load_state_dict(self.original_model.state_dict())
+        model = GradSampleModule(model)
+        for x, y in self.dl:
+            self.criterion(model(x), y).backward()
+        grad_samples = [
+            mean_over_batch_groups(p.grad_sample, group_size)
+            for p in model.parameters()
+            if p.requires_grad
+        ]
+        norms = calc_sample_norms((("", g) for g in grad_samples))[0]
+        factor = (clip_value / (norms + 1e-6)).clamp(max=1.0)
+        expected = [
+            torch.einsum("i,i...", factor, g).norm() / len(group_size)
+            for g in grad_samples
+        ]
+
+        self.setUp_clipped_model(
+            clip_value=clip_value, run_clipper_step=True, group_size=group_size
+        )
+        self.assertTrue(
+            torch.allclose(torch.stack(expected), self.clipped_grads_norms)
+        )
+
+    def test_mean_over_batch_groups(self):
+        tensor = torch.randn(10, 3, 2)
+        for group_size, sizes in [
+            (2, [2] * 5),
+            (4, [4, 4, 2]),
+            ([3, 3, 3, 1], [3, 3, 3, 1]),
+            ([10], [10]),
+        ]:
+            expected = torch.stack(
+                [chunk.mean(dim=0) for chunk in tensor.split(sizes)]
+            )
+            self.assertTrue(
+                torch.allclose(mean_over_batch_groups(tensor, group_size), expected)
+            )
+        with self.assertRaises(ValueError):
+            mean_over_batch_groups(tensor, [3, 3])
+
+    def _clipped_grads(self):
+        return [p.grad for p in self.clipped_model.parameters() if p.requires_grad]
+
+    def test_flat_grad_sample_matches(self):
+        for group_size in (None, 4):
+            self.setUp_clipped_model(clip_value=0.003, group_size=group_size)
+            expected = self._clipped_grads()
+            self.setUp_clipped_model(
+                clip_value=0.003,
+                group_size=group_size,
+                grad_sample_capacity=self.DATA_SIZE,
+                flat_grad_sample=True,
+            )
+            self.assertIsNotNone(self.clipped_model.grad_sample_flat)
+            grads = self._clipped_grads()
+            for g, g_expected in zip(grads, expected):
+                self.assertTrue(torch.allclose(g, g_expected, rtol=1e-4, atol=1e-8))
+
+    def test_flat_grad_sample_accumulates(self):
+        model = SampleConvNet()
+        model.load_state_dict(self.original_model.state_dict())
+        model = GradSampleModule(
+            model, grad_sample_capacity=self.DATA_SIZE, flat_grad_sample=True
+        )
+        clipper = PerSampleGradientClipper(model, ConstantFlatClipper(0.003))
+        x, y = next(iter(self.dl))
+        for x_half, y_half in zip(x.split(32), y.split(32)):
+            self.criterion(model(x_half), y_half).backward()
+            clipper.clip_and_accumulate()
+        clipper.pre_step()
+
+        grads = [p.grad for p in model.parameters() if p.requires_grad]
+        self.setUp_clipped_model(clip_value=0.003)
+        expected = self._clipped_grads()
+        for g, g_expected in zip(grads, expected):
+            self.assertTrue(torch.allclose(g, g_expected, rtol=1e-4, atol=1e-8))
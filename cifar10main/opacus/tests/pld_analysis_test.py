@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+import math
+import unittest
+
+import numpy as np
+import torch.nn as nn
+from opacus import PrivacyEngine, pld_analysis, privacy_analysis
+from opacus.privacy_engine import DEFAULT_ALPHAS
+from scipy import optimize, stats
+
+
+def analytic_gaussian_epsilon(sigma, steps, delta):
+    # without subsampling, the composition of T steps is a Gaussian mechanism
+    # of sensitivity sqrt(T) / sigma, whose (epsilon, delta) curve is known
+    mu = math.sqrt(steps) / sigma
+
+    def analytic_delta(eps):
+        return (
+            stats.norm.cdf(-eps / mu + mu / 2)
+            - math.exp(eps) * stats.norm.cdf(-eps / mu - mu / 2)
+            - delta
+        )
+
+    return optimize.brentq(analytic_delta, 0, 100)
+
+
+class PLDAnalysis_test(unittest.TestCase):
+    def test_gaussian_matches_analytic(self):
+        sigma, steps, delta = 4.0, 5, 1e-5
+        expected = analytic_gaussian_epsilon(sigma, steps, delta)
+        plds = pld_analysis.compute_pld(1.0, sigma, steps)
+        eps, _ = pld_analysis.get_privacy_spent(plds, delta)
+        self.assertAlmostEqual(eps, expected, delta=1e-4)
+        for pld in plds:
+            self.assertAlmostEqual(pld.get_delta_for_epsilon(eps), delta, delta=1e-7)
+
+    def test_gaussian_upper_bound(self):
+        # the discretized PLD never under-estimates epsilon
+        # (rounding the losses to the nearest grid point does, for sigma=2 and one step)
+        for sigma, steps, delta in [(2.0, 1, 1e-5), (4.0, 5, 1e-5), (2.0, 100, 1e-6)]:
+            expected = analytic_gaussian_epsilon(sigma, steps, delta)
+            for h in (1e-1, 1e-2, 1e-3, 1e-4):
+                plds = pld_analysis.compute_pld(
+                    1.0, sigma, steps, value_discretization_interval=h
+                )
+                eps, _ = pld_analysis.get_privacy_spent(plds, delta)
+                self.assertGreaterEqual(eps, expected)
+
+    def test_tighter_than_rdp(self):
+        q, sigma, steps, delta = 0.01, 1.0, 1000, 1e-5
+        eps, _ = pld_analysis.get_privacy_spent(
+            pld_analysis.compute_pld(q, sigma, steps), delta
+        )
+        rdp = privacy_analysis.compute_rdp(q, sigma, steps, DEFAULT_ALPHAS)
+        eps_rdp, _ = privacy_analysis.get_privacy_spent(DEFAULT_ALPHAS, rdp, delta)
+        self.assertLess(eps, eps_rdp)
+        self.assertGreater(eps, 0.8 * eps_rdp)
+
+    def test_tighter_than_rdp_long_run(self):
+        # 200 epochs of CIFAR-10 at batch sizes 256 and 500: the discretization
+        # errors of the tens of thousands of steps must not add up
+        for q, sigma, steps in [(256 / 50000, 1.1, 39000), (0.01, 1.0, 20000)]:
+            eps, _ = pld_analysis.get_privacy_spent(
+                pld_analysis.compute_pld(q, sigma, steps), 1e-5
+            )
+            rdp = privacy_analysis.compute_rdp(q, sigma, steps, DEFAULT_ALPHAS)
+            eps_rdp, _ = privacy_analysis.get_privacy_spent(DEFAULT_ALPHAS, rdp, 1e-5)
+            self.assertLess(eps, eps_rdp)
+
+    def test_self_compose_matches_sequential(self):
+        remove, add = pld_analysis.compute_pld(0.05, 1.5, 1)
+        sequential = remove
+        for _ in range(10):
+            sequential = sequential.compose(remove)
+        squared = remove.self_compose(11)
+        # the two orders of composition only differ by the cut tails
+        for eps in (0.0, 0.5, 1.0):
+            self.assertAlmostEqual(
+                sequential.get_delta_for_epsilon(eps),
+                squared.get_delta_for_epsilon(eps),
+                delta=1e-12,
+            )
+
+    def test_no_privacy(self):
+        eps, _ = pld_analysis.get_privacy_spent(
+            pld_analysis.compute_pld(0.1, 0.0, 10), 1e-5
+        )
+        self.assertEqual(eps, np.inf)
+
+    def test_privacy_engine_accountant(self):
+        kwargs = dict(sample_rate=0.01, noise_multiplier=1.0, max_grad_norm=1.0)
+        rdp_engine = PrivacyEngine(nn.Linear(4, 2), **kwargs)
+        pld_engine = PrivacyEngine(nn.Linear(4, 2), accountant="pld", **kwargs)
+        for engine in (rdp_engine, pld_engine):
+            engine.steps = 1000
+            engine.ledger.record(engine.sample_rate, engine.noise_multiplier, 1000)
+        eps_rdp, _ = rdp_engine.get_privacy_spent(1e-5)
+        eps_pld, alpha = pld_engine.get_privacy_spent(1e-5)
+        self.assertLess(eps_pld, eps_rdp)
+        self.assertTrue(math.isnan(alpha))
+
+        with self.assertRaises(ValueError):
+            PrivacyEngine(nn.Linear(4, 2), accountant="prv", **kwargs)
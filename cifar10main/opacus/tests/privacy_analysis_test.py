@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+import unittest
+
+import numpy as np
+from opacus import privacy_analysis
+from opacus.privacy_engine import DEFAULT_ALPHAS
+
+
+class PrivacyAnalysis_test(unittest.TestCase):
+    def setUp(self):
+        self.orders = DEFAULT_ALPHAS + [1.01, 64.5, 128, 256, np.inf]
+
+    def test_compute_rdp_matches_scalar(self):
+        for q in (1e-4, 0.01, 0.1, 0.5, 0.99):
+            for sigma in (0.5, 1.0, 2.0, 10.0):
+                expected = np.array(
+                    [privacy_analysis._compute_rdp(q, sigma, o) for o in self.orders],
+                    dtype=float,
+                )
+                rdp = privacy_analysis.compute_rdp(q, sigma, 1, self.orders)
+                finite = np.isfinite(expected)
+                self.assertTrue((np.isfinite(rdp) == finite).all())
+                np.testing.assert_allclose(
+                    rdp[finite], expected[finite], rtol=0, atol=1e-10
+                )
+
+    def test_compute_rdp_edge_cases(self):
+        orders = [1.5, 2, 32]
+        self.assertTrue((privacy_analysis.compute_rdp(0, 1.0, 10, orders) == 0).all())
+        self.assertTrue(np.isinf(privacy_analysis.compute_rdp(0.1, 0, 10, orders)).all())
+        np.testing.assert_allclose(
+            privacy_analysis.compute_rdp(1.0, 2.0, 10, orders),
+            [10 * o / 8 for o in orders],
+        )
+        self.assertAlmostEqual(
+            privacy_analysis.compute_rdp(0.1, 1.0, 10, 2.5),
+            10 * privacy_analysis._compute_rdp(0.1, 1.0, 2.5),
+        )
+
+    def test_compute_rdp_grid(self):
+        qs, sigmas = [0, 1e-3, 0.1, 1.0], [0, 0.7, 2.0]
+        rdp = privacy_analysis.compute_rdp_grid(qs, sigmas, self.orders)
+        self.assertEqual(rdp.shape, (len(sigmas), len(qs), len(self.orders)))
+        for i, sigma in enumerate(sigmas):
+            for j, q in enumerate(qs):
+                np.testing.assert_allclose(
+                    rdp[i, j],
+                    privacy_analysis.compute_rdp(q, sigma, 1, self.orders),
+                    rtol=1e-12,
+                    atol=0,
+                )
+
+    def test_get_privacy_spent_batch(self):
+        rdp = privacy_analysis.compute_rdp_grid([0.01, 0.1], [0, 1.0], DEFAULT_ALPHAS)
+        eps, alpha = privacy_analysis.get_privacy_spent_batch(
+            DEFAULT_ALPHAS, rdp * 100, 1e-5
+        )
+        self.assertTrue(np.isinf(eps[0]).all() and np.isnan(alpha[0]).all())
+        for j in range(2):
+            self.assertEqual(
+                (eps[1, j], alpha[1, j]),
+                privacy_analysis.get_privacy_spent(DEFAULT_ALPHAS, rdp[1, j] * 100, 1e-5),
+            )
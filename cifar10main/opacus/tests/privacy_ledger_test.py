@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+import unittest
+import warnings
+
+import numpy as np
+import torch
+import torch.nn as nn
+from opacus import PrivacyEngine, privacy_analysis
+from opacus.privacy_engine import DEFAULT_ALPHAS
+from opacus.privacy_ledger import LedgerEntry, PrivacyLedger
+
+
+class PrivacyLedger_test(unittest.TestCase):
+    def test_record_merges_runs(self):
+        ledger = PrivacyLedger()
+        for _ in range(3):
+            ledger.record(0.01, 1.0)
+        ledger.record(0.01, 2.0, count=5)
+        ledger.record(0.0, 0.0)  # a step on public data
+        ledger.record(0.01, 1.0)
+        self.assertEqual(
+            ledger.entries,
+            [
+                LedgerEntry(0.01, 1.0, 3),
+                LedgerEntry(0.01, 2.0, 5),
+                LedgerEntry(0.0, 0.0, 1),
+                LedgerEntry(0.01, 1.0, 1),
+            ],
+        )
+        self.assertEqual(ledger.steps, 10)
+        self.assertEqual(ledger.mechanisms(), {(0.01, 1.0): 4, (0.01, 2.0): 5})
+
+    def test_rdp_matches_composition(self):
+        ledger = PrivacyLedger()
+        ledger.record(1.0, 8.0, count=2)
+        ledger.record(0.02, 1.5, count=100)
+        ledger.record(0.02, 1.0, count=50)
+        expected = sum(
+            privacy_analysis.compute_rdp(q, sigma, steps, DEFAULT_ALPHAS)
+            for q, sigma, steps in [(1.0, 8.0, 2), (0.02, 1.5, 100), (0.02, 1.0, 50)]
+        )
+        np.testing.assert_allclose(ledger.get_rdp(DEFAULT_ALPHAS), expected)
+
+        eps_rdp, _ = ledger.get_privacy_spent(1e-5, DEFAULT_ALPHAS)
+        eps_pld, _ = ledger.get_privacy_spent(1e-5, DEFAULT_ALPHAS, accountant="pld")
+        self.assertLess(eps_pld, eps_rdp)
+
+    def test_pld_capped_by_rdp(self):
+        ledger = PrivacyLedger()
+        ledger.record(0.02, 1.0, count=100)
+        eps_rdp, alpha = ledger.get_privacy_spent(1e-5, DEFAULT_ALPHAS)
+        # with only the orders 2 and 3, RDP is loose and PLD is used
+        eps_pld, alpha_pld = ledger.get_privacy_spent(1e-5, [2, 3], accountant="pld")
+        self.assertLess(eps_pld, eps_rdp)
+        self.assertTrue(np.isnan(alpha_pld))
+        # with a single step at a high noise, both are close and the smaller one wins
+        ledger = PrivacyLedger()
+        ledger.record(1.0, 50.0)
+        eps_rdp, alpha = ledger.get_privacy_spent(1e-5, DEFAULT_ALPHAS)
+        eps, best_alpha = ledger.get_privacy_spent(1e-5, DEFAULT_ALPHAS, accountant="pld")
+        self.assertLessEqual(eps, eps_rdp)
+        self.assertTrue(np.isnan(best_alpha) or best_alpha == alpha)
+
+    def test_add(self):
+        a, b = PrivacyLedger(), PrivacyLedger()
+        a.record(0.01, 1.0, count=2)
+        b.record(0.01, 1.0, count=3)
+        b.record(0.1, 1.0)
+        self.assertEqual(
+            (a + b).entries, [LedgerEntry(0.01, 1.0, 5), LedgerEntry(0.1, 1.0, 1)]
+        )
+        self.assertEqual(a.steps, 2)
+
+    def test_privacy_engine_checkpoint(self):
+        torch.manual_seed(0)
+        model = nn.Linear(4, 2)
+        optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+        engine = PrivacyEngine(
+            model, sample_rate=0.05, noise_multiplier=1.0, max_grad_norm=1.0
+        )
+        engine.attach(optimizer)
+        for noise_multiplier in (1.0, 1.0, 2.0):
+            engine.noise_multiplier = noise_multiplier
+            optimizer.zero_grad()
+            model(torch.randn(8, 4)).sum().backward()
+            optimizer.step()
+        self.assertEqual(
+            engine.ledger.entries,
+            [LedgerEntry(0.05, 1.0, 2), LedgerEntry(0.05, 2.0, 1)],
+        )
+
+        restored = PrivacyEngine(
+            nn.Linear(4, 2), sample_rate=0.05, noise_multiplier=2.0, max_grad_norm=1.0
+        )
+        restored.load_state_dict(engine.state_dict())
+        self.assertEqual(restored.ledger.entries, engine.ledger.entries)
+        self.assertEqual(restored.get_privacy_spent(1e-5), engine.get_privacy_spent(1e-5))
+
+        # older checkpoints only have the number of steps
+        legacy = PrivacyEngine(
+            nn.Linear(4, 2), sample_rate=0.05, noise_multiplier=2.0, max_grad_norm=1.0
+        )
+        legacy.load_state_dict({"steps": 3})
+        self.assertEqual(legacy.ledger.entries, [LedgerEntry(0.05, 2.0, 3)])
+        legacy.get_privacy_spent(1e-5)
+        self.assertEqual(legacy.ledger.entries, [LedgerEntry(0.05, 2.0, 3)])
+
+    def test_privacy_engine_steps_mismatch(self):
+        engine = PrivacyEngine(
+            nn.Linear(4, 2), sample_rate=0.05, noise_multiplier=1.0, max_grad_norm=1.0
+        )
+        engine.ledger.record(1.0, 8.0)
+        engine.ledger.record(0.05, 1.0, count=3)
+        engine.steps = 4
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            engine.get_privacy_spent(1e-5)
+        for steps, entries in (
+            (2, [LedgerEntry(1.0, 8.0, 1), LedgerEntry(0.05, 1.0, 1)]),
+            (6, [LedgerEntry(1.0, 8.0, 1), LedgerEntry(0.05, 1.0, 5)]),
+        ):
+            engine.steps = steps
+            expected = PrivacyLedger()
+            for entry in entries:
+                expected.record(*entry)
+            with self.assertWarns(UserWarning):
+                self.assertEqual(
+                    engine.get_privacy_spent(1e-5),
+                    expected.get_privacy_spent(1e-5, engine.alphas),
+                )
+        self.assertEqual(engine.ledger.steps, 4)
+
+    def test_with_steps(self):
+        ledger = PrivacyLedger()
+        ledger.record(1.0, 8.0, count=2)
+        ledger.record(0.05, 1.0, count=3)
+        self.assertEqual(ledger.with_steps(0, 0.1, 2.0).entries, [])
+        self.assertEqual(
+            ledger.with_steps(3, 0.1, 2.0).entries,
+            [LedgerEntry(1.0, 8.0, 2), LedgerEntry(0.05, 1.0, 1)],
+        )
+        self.assertEqual(
+            ledger.with_steps(7, 0.05, 1.0).entries,
+            [LedgerEntry(1.0, 8.0, 2), LedgerEntry(0.05, 1.0, 5)],
+        )
+        self.assertEqual(ledger.steps, 5)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+import csv
+import itertools
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from opacus import privacy_analysis
+from opacus.privacy_engine import DEFAULT_ALPHAS
+from opacus.scripts.compute_dp_sgd_privacy_sweep import (
+    COLUMNS,
+    compute_dp_sgd_privacy_sweep,
+    write_table,
+)
+
+
+class PrivacySweep_test(unittest.TestCase):
+    def setUp(self):
+        self.grid = ([0.8, 1.5], [256, 512, 1000], [1, 40], [50000, 60000], [1e-5, 1e-6])
+        self.table = compute_dp_sgd_privacy_sweep(*self.grid, DEFAULT_ALPHAS)
+
+    def test_matches_scalar_analysis(self):
+        configs = list(itertools.product(*self.grid))
+        self.assertEqual(len(self.table["epsilon"]), len(configs))
+        for k, (sigma, batch_size, epochs, sample_size, delta) in enumerate(configs):
+            sample_rate = batch_size / sample_size
+            steps = epochs * (sample_size // batch_size)
+            rdp = privacy_analysis.compute_rdp(sample_rate, sigma, steps, DEFAULT_ALPHAS)
+            eps, alpha = privacy_analysis.get_privacy_spent(DEFAULT_ALPHAS, rdp, delta)
+            row = {column: self.table[column][k] for column in COLUMNS}
+            self.assertEqual(
+                (row["noise_multiplier"], row["batch_size"], row["epochs"]),
+                (sigma, batch_size, epochs),
+            )
+            self.assertEqual((row["sample_size"], row["delta"]), (sample_size, delta))
+            self.assertEqual((row["sample_rate"], row["steps"]), (sample_rate, steps))
+            self.assertAlmostEqual(row["epsilon"], eps, places=9)
+            self.assertEqual(row["alpha"], alpha)
+
+    def test_write_table(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "epsilons.csv")
+            write_table(self.table, path)
+            with open(path) as f:
+                rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), len(self.table["epsilon"]))
+        np.testing.assert_array_equal(
+            [float(row["epsilon"]) for row in rows], self.table["epsilon"]
+        )
+
+    def test_batch_size_too_large(self):
+        with self.assertRaises(ValueError):
+            compute_dp_sgd_privacy_sweep([1.0], [1000], [1], [500], [1e-5], [2, 4])
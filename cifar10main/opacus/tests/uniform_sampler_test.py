@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+import unittest
+
+import numpy as np
+import torch
+from opacus.utils.uniform_sampler import (
+    DistributedPoissonBatchSampler,
+    UniformWithReplacementSampler,
+    poisson_sample,
+)
+
+
+class PoissonSample_test(unittest.TestCase):
+    def setUp(self):
+        self.generator = torch.Generator()
+        self.generator.manual_seed(0)
+
+    def test_distribution(self):
+        N, q, trials = 20, 0.3, 20000
+        counts = np.zeros(N)
+        sizes = []
+        for _ in range(trials):
+            indices = poisson_sample(N, q, generator=self.generator)
+            self.assertEqual(indices.dtype, torch.long)
+            self.assertTrue((indices[1:] > indices[:-1]).all())
+            counts[indices.numpy()] += 1
+            sizes.append(len(indices))
+        # every index is selected with probability q, and the batch size is Binomial(N, q)
+        np.testing.assert_allclose(counts / trials, q, atol=0.015)
+        self.assertAlmostEqual(np.mean(sizes), N * q, delta=0.05)
+        self.assertAlmostEqual(np.var(sizes), N * q * (1 - q), delta=0.15)
+
+    def test_long_batches(self):
+        # batches spanning several chunks of gaps
+        indices = poisson_sample(100000, 0.5, generator=self.generator)
+        self.assertTrue((indices[1:] > indices[:-1]).all())
+        self.assertLess(indices[-1], 100000)
+        self.assertAlmostEqual(len(indices) / 100000, 0.5, delta=0.01)
+
+    def test_edge_cases(self):
+        self.assertTrue(torch.equal(poisson_sample(5, 1.0), torch.arange(5)))
+        self.assertEqual(len(poisson_sample(5, 0.0)), 0)
+
+    def test_seeded(self):
+        batches = []
+        for _ in range(2):
+            generator = torch.Generator()
+            generator.manual_seed(7)
+            sampler = UniformWithReplacementSampler(1000, 0.01, generator=generator)
+            batches.append(list(sampler))
+        for b1, b2 in zip(*batches):
+            self.assertIsInstance(b1, torch.Tensor)
+            self.assertTrue(torch.equal(b1, b2))
+
+    def test_distributed(self):
+        for rank in range(2):
+            sampler = DistributedPoissonBatchSampler(
+                101,
+                0.1,
+                num_replicas=2,
+                rank=rank,
+                shuffle=False,
+                generator=self.generator,
+            )
+            # without shuffling, each replica samples from its own slice
+            local = set(range(101)[rank::2])
+            self.assertEqual(sampler.num_samples, len(local))
+            for batch in sampler:
+                self.assertTrue(set(batch.tolist()) <= local)
@@ -1,16 +1,60 @@
 #!/usr/bin/env python3
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 
+import math
 from typing import Optional
 
 import torch
 from torch.utils.data import Sampler
 
 
+def poisson_sample(
+    num_samples: int, sample_rate: float, generator=None
+) -> torch.Tensor:
+    r"""
+    Selects each index of ``range(num_samples)`` independently with probability
+    ``sample_rate``, in time proportional to the expected number of selected indices.
+
+    Instead of drawing one Bernoulli variable per index, the gaps between
+    consecutive selected indices are drawn from the geometric distribution of
+    parameter ``sample_rate``, which gives exactly the same distribution of
+    batches. The gaps are drawn in chunks of a bit more than the expected batch
+    size, so that a single chunk is almost always enough.
+
+    Args:
+        num_samples (int): number of indices to select from.
+        sample_rate (float): probability of each index to be selected.
+        generator (Generator): Generator used in sampling.
+
+    Returns:
+        The selected indices, in increasing order, as a LongTensor.
+    """
+    if sample_rate >= 1:
+        return torch.arange(num_samples)
+    if sample_rate <= 0:
+        return torch.empty(0, dtype=torch.long)
+
+    expected = num_samples * sample_rate
+    chunk_size = int(expected + 4 * math.sqrt(expected)) + 16
+    chunks = []
+    last = -1  # last selected index
+    while True:
+        gaps = torch.empty(chunk_size, dtype=torch.float64).geometric_(
+            sample_rate, generator=generator
+        )
+        selected = last + torch.cumsum(gaps.long(), dim=0)
+        if selected[-1] >= num_samples:
+            chunks.append(selected[selected < num_samples])
+            return torch.cat(chunks)
+        chunks.append(selected)
+        last = selected[-1].item()
+
+
 class UniformWithReplacementSampler(Sampler):
     r"""
     This sampler samples elements according to the Sampled Gaussian Mechanism.
     Each sample is selected with a probability equal to ``sample_rate``.
+    Batches are LongTensors of indices drawn by ``poisson_sample``.
     """
 
     def __init__(self, num_samples: int, sample_rate: float, generator=None):
@@ -41,11 +85,9 @@ class UniformWithReplacementSampler(Sampler):
     def __iter__(self):
         num_batches = int(1 / self.sample_rate)
         while num_batches > 0:
-            mask = (
-                torch.rand(self.num_samples, generator=self.generator)
-                < self.sample_rate
+            indices = poisson_sample(
+                self.num_samples, self.sample_rate, generator=self.generator
             )
-            indices = mask.nonzero(as_tuple=False).reshape(-1).tolist()
             if len(indices) != 0:
                 # We only output non-empty list of indices, otherwise the dataloader is unhappy
                 # This is compensated by the privacy engine
@@ -62,7 +104,7 @@ class DistributedPoissonBatchSampler(Sampler):
         2. Split the dataset among the replicas into chunks of equal size
            (plus or minus one sample)
         3. Each replica selects each sample of its chunk independently
-           with probability `sample_rate`
+           with probability `sample_rate` (see `poisson_sample`)
         4. Each replica ouputs the selected samples, which form a local batch
 
     The sum of the lengths of the local batches follows a Poisson distribution.
@@ -129,11 +171,9 @@ class DistributedPoissonBatchSampler(Sampler):
 
         # Now, select a batch with Poisson subsampling
         for _ in range(self.num_batches):
-            mask = (
-                torch.rand(self.num_samples, generator=self.generator)
-                < self.sample_rate
+            selected_examples = poisson_sample(
+                self.num_samples, self.sample_rate, generator=self.generator
             )
-            selected_examples = mask.nonzero(as_tuple=False).reshape(-1)
             if len(selected_examples) > 0:
                 yield indices[selected_examples]
 
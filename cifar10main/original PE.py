@@ -20,6 +20,8 @@ import torchvision.transforms as transforms
 import torchvision.datasets as datasets
 from torchvision import models
 from opacus.utils import module_modification
+from flat_mix import ModelMixer
+from augment_utils import get_augmented_loaders
 
 dev = 1
 device = torch.device('cuda:1')
@@ -73,6 +75,8 @@ parser.add_argument('--pretrained', dest='pretrained', action='store_true',
                     help='use pre-trained model')
 parser.add_argument('--half', dest='half', action='store_true',
                     help='use half-precision(16-bit) ')
+parser.add_argument('--batch-augment', dest='batch_augment', action='store_true',
+                    help='augment whole batches on the training device instead of per sample in DataLoader workers')
 parser.add_argument('--save-dir', dest='save_dir',
                     help='The directory used to save the trained models',
                     default='save_temp', type=str)
@@ -115,23 +119,27 @@ def main():
     normalize = transforms.Normalize(mean=[0.485, 0.456, 0.406],
                                      std=[0.229, 0.224, 0.225])
 
-    train_loader = torch.utils.data.DataLoader(
-        datasets.SVHN(root='./data', split='train', transform=transforms.Compose([
-            transforms.RandomHorizontalFlip(),
-            transforms.RandomCrop(32, 4),
-            transforms.ToTensor(),
-            normalize,
-        ]), download=True),
-        batch_size=args.batch_size, shuffle=True,
-        num_workers=args.workers, pin_memory=True)
-
-    val_loader = torch.utils.data.DataLoader(
-        datasets.SVHN(root='./data', split='test', transform=transforms.Compose([
-            transforms.ToTensor(),
-            normalize,
-        ]), download=True),
-        batch_size=1000, shuffle=False,
-        num_workers=args.workers, pin_memory=True)
+    if args.batch_augment:
+        train_loader, val_loader = get_augmented_loaders(
+            'svhn', args.batch_size, 1000, device=device)
+    else:
+        train_loader = torch.utils.data.DataLoader(
+            datasets.SVHN(root='./data', split='train', transform=transforms.Compose([
+                transforms.RandomHorizontalFlip(),
+                transforms.RandomCrop(32, 4),
+                transforms.ToTensor(),
+                normalize,
+            ]), download=True),
+            batch_size=args.batch_size, shuffle=True,
+            num_workers=args.workers, pin_memory=True)
+
+        val_loader = torch.utils.data.DataLoader(
+            datasets.SVHN(root='./data', split='test', transform=transforms.Compose([
+                transforms.ToTensor(),
+                normalize,
+            ]), download=True),
+            batch_size=1000, shuffle=False,
+            num_workers=args.workers, pin_memory=True)
 
 
     '''
@@ -176,6 +184,9 @@ def main():
                                     noise_multiplier=multi, max_grad_norm=clip_norm)
     privacy_engine2.attach(optimizer2)
 
+    # model2 is the ModelMix anchor; both models now live in flat buffers
+    mixer = ModelMixer(model, model2, skip_bn=True, alpha_on_anchor=False)
+
     lr_scheduler = torch.optim.lr_scheduler.MultiStepLR(optimizer, milestones=[100, 150, 250],
                                                         last_epoch=args.start_epoch - 1)
     lr_scheduler2 = torch.optim.lr_scheduler.MultiStepLR(optimizer2, milestones=[100, 150, 250],
@@ -210,7 +221,7 @@ def main():
             gap_rate = 0.025
         '''
 
-        train(train_loader, model, model2, criterion, optimizer, optimizer2, epoch)
+        train(train_loader, model, model2, mixer, criterion, optimizer, optimizer2, epoch)
         lr_scheduler.step()
         lr_scheduler2.step()
 
@@ -234,29 +245,8 @@ def main():
         }, is_best, filename=os.path.join(args.save_dir, 'model.th'))
 
 
-def model_mix(model, model2, tau):
-    temp_dict = model.state_dict()
-    temp_dict2 = model2.state_dict()
-    for name, param in model.named_parameters():
-        if "bn" in name or name not in temp_dict.keys():
-            continue
-        dictShape = temp_dict[name].shape
-        gap_opr = torch.abs(temp_dict[name] - temp_dict2[name])
-        if torch.min(gap_opr) < tau:
-            gap_opr = torch.clamp(gap_opr, min=0, max=tau)
-            gap_opr = torch.add(-gap_opr, tau)
-            sign_opr = torch.sign(temp_dict[name] - temp_dict2[name])
-            temp_dict[name] += gap_opr * sign_opr / 2
-            temp_dict2[name] -= gap_opr * sign_opr / 2
-
-        oness = torch.ones(dictShape).cuda(device)
-        alpha1 = torch.rand(dictShape).cuda(device)
-        temp_dict[name] = alpha1 * temp_dict[name] + (oness - alpha1) * temp_dict2[name]
-    model.load_state_dict(temp_dict)
-
-
 # def train(train_loader, model, criterion, optimizer, pe, epoch):
-def train(train_loader, model, model2, criterion, optimizer, optimizer2, epoch):
+def train(train_loader, model, model2, mixer, criterion, optimizer, optimizer2, epoch):
     """
         Run one train epoch
     """
@@ -290,14 +280,14 @@ def train(train_loader, model, model2, criterion, optimizer, optimizer2, epoch):
         loss = criterion(output, target_var)
         loss.backward()
         if (i + 1) % virtual_bn == 0:
-            temp_dict = copy.deepcopy(temp_model.state_dict())
+            mixer.snapshot()
             if use_mix:
                 lr_temp = temp_optimizer.param_groups[0]['lr']
                 tau = lr_temp * gap_rate
-                model_mix(temp_model, temp_model2, tau)
+                mixer.mix(tau)
             temp_optimizer.step()
             temp_optimizer.zero_grad()
-            temp_model2.load_state_dict(temp_dict)
+            mixer.swap_anchor()
         else:
             temp_optimizer.virtual_step()
 